@@ -1,9 +1,18 @@
 import json
 import os
+import sys
 import random
+import re
 # 设置 HF 缓存路径 (保持和你之前的一致)
 os.environ["HF_DATASETS_CACHE"] = "/ssd_2t_1/wyq_workspace/hf_cache"
 from datasets import load_dataset, Dataset, DatasetDict
+import pyarrow.parquet as pq
+
+# 位集标签 (label_bitset.py) 和标签版本库 (incremental_relabel.py) 在 unify_error_umi 中
+UMI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "unify_error_umi")
+sys.path.insert(0, UMI_DIR)
+from label_bitset import load_bitsets
+from incremental_relabel import LabelVersionStore
 
 # --- 配置路径 ---
 # 1. 你的标签文件
@@ -12,63 +21,119 @@ LABEL_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/final_
 HF_DATASET_NAME = "substratusai/the-stack-yaml-k8s"
 # 3. 最终保存的 Hugging Face 格式数据集路径
 OUTPUT_DIR = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/genkubesec_dataset"
+# 4. combine_umi_full.py 写出的标签列式副本（带数据集行号 index 列）
+#    USE_COLUMNAR_LABELS = True 时按行号直接从数据集取出有标签的样本，不再遍历整个数据集
+LABEL_PARQUET_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/final_labels.parquet"
+USE_COLUMNAR_LABELS = False
+# 5. combine_umi_full.py 写出的标签位集副本（Kind 编号 + uint64 位集，见 unify_error_umi/label_bitset.py）
+#    USE_BITSET_LABELS = True 时读取该文件，解码成与 final_labels.jsonl 相同的标签字符串
+LABEL_BITSET_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/final_labels.npz"
+USE_BITSET_LABELS = False
+# 6. combine_umi_full.py 增量重标注模式的标签版本库（见 unify_error_umi/incremental_relabel.py）
+#    USE_LABEL_VERSIONS = True 时读取最新版本的标签（最后一个全量版本 + 之后的增量版本）
+LABEL_VERSIONS_DIR = "/home/wyq/kcfs_results/label_versions"
+USE_LABEL_VERSIONS = False
+
+FILENAME_INDEX = re.compile(r'^file_(\d+)\.yaml$')
+
+def label_index(data):
+    """标签记录的数据集行号：index 字段；旧标签文件没有该字段时从 file_{i}.yaml 形式的文件名推出"""
+    if isinstance(data.get('index'), int):
+        return data['index']
+    match = FILENAME_INDEX.match(data.get('filename', ''))
+    return int(match.group(1)) if match else None
 
 def load_labels(filepath):
-    """加载标签文件，返回字典 {filename: labels_string}"""
+    """加载标签文件，返回按数据集行号升序排列的 [(行号, labels_string)]"""
     print(f"正在加载标签文件: {filepath} ...")
-    label_map = {}
+    labels = []
     with open(filepath, 'r', encoding='utf-8') as f:
         for line in f:
             try:
                 data = json.loads(line)
-                filename = data['filename']
-                labels = data['misconfig_labels']
+                idx = label_index(data)
+                if idx is None:
+                    continue
                 
                 # 将列表转换为逗号分隔的字符串，作为模型的训练目标
                 # 例如: ["Deployment+10", "Deployment+15"] -> "Deployment+10, Deployment+15"
-                label_str = ", ".join(labels)
-                label_map[filename] = label_str
+                label_str = ", ".join(data['misconfig_labels'])
+                labels.append((idx, label_str))
             except json.JSONDecodeError:
                 pass
-    print(f"✅ 加载完成，共 {len(label_map)} 个已标注文件。")
-    return label_map
+    labels.sort()
+    print(f"✅ 加载完成，共 {len(labels)} 个已标注文件。")
+    return labels
+
+def load_label_table(filepath):
+    """加载标签列式文件，返回按数据集行号升序排列的 [(行号, labels_string)]"""
+    print(f"正在加载标签列式文件: {filepath} ...")
+    table = pq.read_table(filepath, columns=["index", "misconfig_labels"])
+    labels = sorted(
+        (i, ", ".join(l))
+        for i, l in zip(table.column("index").to_pylist(), table.column("misconfig_labels").to_pylist())
+        if i is not None
+    )
+    print(f"✅ 加载完成，共 {len(labels)} 个已标注文件。")
+    return labels
+
+def load_label_bitsets(filepath):
+    """加载标签位集文件，返回按数据集行号升序排列的 [(行号, labels_string)]"""
+    print(f"正在加载标签位集文件: {filepath} ...")
+    index, bitsets, codec = load_bitsets(filepath)
+    labels = sorted(zip(index.tolist(), (", ".join(l) for l in codec.decode(bitsets))))
+    print(f"✅ 加载完成，共 {len(labels)} 个已标注文件。")
+    return labels
+
+def load_versioned_labels(directory):
+    """加载标签版本库中的最新标签，返回按数据集行号升序排列的 [(行号, labels_string)]"""
+    print(f"正在加载标签版本库: {directory} ...")
+    store = LabelVersionStore(directory)
+    labels = sorted((i, ", ".join(r['misconfig_labels'])) for i, r in store.labels().items())
+    print(f"✅ 加载完成 (版本 {store.versions[-1]['version']})，共 {len(labels)} 个已标注文件。")
+    return labels
+
+def build_entries_by_index(labels, raw_ds):
+    """
+    按行号从数据集中直接取出有标签的样本（不再遍历整个数据集、按 file_{i}.yaml 拼字符串匹配）；
+    行号升序，与顺序遍历数据集得到的样本顺序相同，因此后面按固定 seed 划分出的 Train/Validation/Test 也相同
+    """
+    data_entries = []
+    selected = raw_ds.select([i for i, _ in labels])
+    for (i, target), item in zip(labels, selected):
+        content = item['content']
+        
+        # 过滤过长的文件 (CodeT5p 限制 512 token，太长的 YAML 效果不好)
+        # 这里简单用字符数粗略过滤，后续 Tokenizer 处理时会截断
+        if len(content) > 10000:
+            continue
+
+        # GenKubeSec 论文主要关注有缺陷的样本进行检测训练，只有有标签的文件才纳入训练集
+        data_entries.append({
+            "source": content,   # 输入: YAML 内容
+            "target": target,    # 输出: 错误标签字符串
+            "filename": f"file_{i}.yaml"
+        })
+    return data_entries
 
 def main():
     # 1. 加载标签
-    label_map = load_labels(LABEL_FILE)
+    if USE_LABEL_VERSIONS:
+        labels = load_versioned_labels(LABEL_VERSIONS_DIR)
+    elif USE_BITSET_LABELS:
+        labels = load_label_bitsets(LABEL_BITSET_FILE)
+    elif USE_COLUMNAR_LABELS:
+        labels = load_label_table(LABEL_PARQUET_FILE)
+    else:
+        labels = load_labels(LABEL_FILE)
     
     # 2. 加载原始数据集
     print(f"正在加载原始数据集: {HF_DATASET_NAME} ...")
     raw_ds = load_dataset(HF_DATASET_NAME, split="train", streaming=False)
     
-    # 3. 构建训练数据列表
-    data_entries = []
-    
+    # 3. 构建训练数据列表 (按数据集行号关联)
     print("正在合并 YAML 内容与标签...")
-    # 遍历原始数据集，根据 file_{i}.yaml 的规则进行匹配
-    for i, item in enumerate(raw_ds):
-        pseudo_filename = f"file_{i}.yaml"
-        
-        # 只有当该文件有对应的错误标签时，才纳入训练集
-        # (GenKubeSec 论文主要关注有缺陷的样本进行检测训练，
-        #  如果你也想让模型学会识别“无错误”文件，可以保留 label_map 中没有的文件并标记为 "Safe")
-        if pseudo_filename in label_map:
-            content = item['content']
-            target = label_map[pseudo_filename]
-            
-            # 过滤过长的文件 (CodeT5p 限制 512 token，太长的 YAML 效果不好)
-            # 这里简单用字符数粗略过滤，后续 Tokenizer 处理时会截断
-            if len(content) > 10000: 
-                continue
-
-            data_entries.append({
-                "source": content,   # 输入: YAML 内容
-                "target": target,    # 输出: 错误标签字符串
-                "filename": pseudo_filename
-            })
-            
-        if (i + 1) % 50000 == 0:
-            print(f"   已扫描 {i + 1} 个原始文件...")
+    data_entries = build_entries_by_index(labels, raw_ds)
 
     print(f"✅ 合并完成。有效训练样本数: {len(data_entries)}")
 
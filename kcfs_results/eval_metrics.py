@@ -1,9 +1,15 @@
+import os
+import sys
 import torch
 from peft import PeftModel
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 from datasets import load_from_disk
 from tqdm import tqdm
 
+# 位集标签的编解码在 unify_error_umi/label_bitset.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "unify_error_umi"))
+from label_bitset import LabelCodec, count_matches
+
 # --- 配置 ---
 BASE_MODEL = "/ssd_2t_1/wyq_workspace/genkubesect_structural_model"
 LORA_MODEL = "/ssd_2t_1/wyq_workspace/genkubesect_detection_model"
@@ -17,24 +23,13 @@ def parse_labels(label_str):
     return set([x.strip() for x in label_str.split(',')])
 
 def calculate_metrics(predictions, references):
-    total_tp = 0
-    total_fp = 0
-    total_fn = 0
-    
-    for pred_str, ref_str in zip(predictions, references):
-        pred_set = parse_labels(pred_str)
-        ref_set = parse_labels(ref_str)
-        
-        # True Positives: 预测对的
-        tp = len(pred_set.intersection(ref_set))
-        # False Positives: 预测了但实际没有的 (误报)
-        fp = len(pred_set - ref_set)
-        # False Negatives: 实际有但没预测出来的 (漏报)
-        fn = len(ref_set - pred_set)
-        
-        total_tp += tp
-        total_fp += fp
-        total_fn += fn
+    # 预测和真实标签都编码成位集 (unify_error_umi/label_bitset.py)，交集 / 差集计数是整批的按位与加 popcount
+    codec = LabelCodec()
+    pred_bits = codec.encode([parse_labels(p) for p in predictions])
+    ref_bits = codec.encode([parse_labels(r) for r in references])
+
+    # True Positives: 预测对的; False Positives: 预测了但实际没有的 (误报); False Negatives: 实际有但没预测出来的 (漏报)
+    total_tp, total_fp, total_fn = count_matches(pred_bits, ref_bits)
         
     precision = total_tp / (total_tp + total_fp) if (total_tp + total_fp) > 0 else 0.0
     recall = total_tp / (total_tp + total_fn) if (total_tp + total_fn) > 0 else 0.0
@@ -0,0 +1,114 @@
+import os
+import asyncio
+import shutil
+import signal
+import tempfile
+
+from tqdm import tqdm
+
+from scan_utils import RETRY_NICENESS, SHM_DIR, ResultWriter, chunked, timeout_records, write_batch_to_dir
+
+# --- asyncio 子进程驱动 ---
+# KubeLinter / Terrascan（以及命令行模式的 Checkov）都是外部二进制，Python 进程只负责写文件、
+# 等待子进程、解析 JSON。用一个事件循环 + asyncio.create_subprocess_exec 即可驱动所有扫描，
+# 不需要为“等待子进程”再占用一个 Python 工作进程；并发度由信号量控制，每次调用有独立超时
+
+# 同一进程内会同时有多个批次在途，每批仍然单独建目录，目录放在 scan_utils.SHM_DIR (tmpfs) 上
+
+
+async def run_exec(argv, timeout=None, niceness=0):
+    """
+    直接执行命令（argv 列表，不经过 shell），返回 (returncode, stdout 文本)
+    子进程在独立的会话（进程组）中启动，超时后杀掉整个进程组并回收，再抛出 asyncio.TimeoutError
+    """
+    if niceness:
+        argv = ["nice", "-n", str(niceness), *argv]
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        start_new_session=True
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+        raise
+    return proc.returncode, stdout.decode('utf-8', errors='replace')
+
+
+async def scan_batch_async(batch, command_fn, parse_fn, tool_name, semaphore, timeout, niceness=0):
+    """
+    把一批清单写入临时目录，对目录运行一次扫描命令，再由 parse_fn 拆分回逐文件记录
+    返回: [(index, record), ...]；超时时每个文件都是 timeout 状态记录，执行失败时是 error 记录
+    """
+    async with semaphore:
+        tmp_dir = tempfile.mkdtemp(prefix="rb_scan_", dir=SHM_DIR)
+        try:
+            name_map = write_batch_to_dir(batch, tmp_dir)
+            try:
+                _, stdout = await run_exec(command_fn(tmp_dir), timeout=timeout, niceness=niceness)
+            except asyncio.TimeoutError:
+                return timeout_records(batch, tool_name, timeout)
+            except Exception as e:
+                return [(idx, {"error": str(e), "filename": filename}) for idx, _, filename in batch]
+            return parse_fn(stdout, name_map)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+async def run_batched_scan_async(tasks, command_fn, parse_fn, tool_name, f_out, desc, concurrency, batch_size,
+                                 total=None, max_in_flight=None, cache=None, f_clean=None, timeout=None,
+                                 retry_timeouts=False, split_documents=False, columnar=None):
+    """
+    asyncio 版本的 run_batched_scan，输出格式、缓存、去重和续扫行为与进程池驱动完全一致
+    tasks: (index, content, pseudo_filename) 的可迭代对象（需带 content）
+    command_fn: 接收目录路径，返回扫描命令的 argv 列表
+    parse_fn: 接收 (stdout, name_map)，返回 [(index, record), ...]
+    tool_name: 工具名，写入超时状态记录的 scan_tool 字段
+    concurrency: 同时运行的扫描子进程数上限
+    max_in_flight: 同时在途的批次数上限，默认 2 × concurrency
+    timeout: 单次扫描命令的超时时间（秒），None 表示不限制
+    retry_timeouts: 超时的文件在所有新批次之后以单文件批次、较低优先级 (nice) 重试一次
+    split_documents: 多文档清单按文档拆分扫描和缓存，结果拼回文件级记录（见 yaml_documents.py）
+    columnar: result_store.ColumnarResultWriter 或 None；写出的记录同时按列写入 Parquet
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * concurrency
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with tqdm(total=total, desc=desc) as pbar:
+        writer = ResultWriter(f_out, pbar, cache=cache, f_clean=f_clean, retry_timeouts=retry_timeouts,
+                              split_documents=split_documents, columnar=columnar)
+        batches = chunked(writer.uncached_tasks(tasks), max(1, batch_size))
+        in_flight = {}  # asyncio.Task -> batch
+
+        def fill_window():
+            while len(in_flight) < max_in_flight:
+                batch = next(batches, None)
+                niceness = 0
+                if batch is None:
+                    # 新批次全部提交后才处理超时重试
+                    batch = writer.next_retry()
+                    if batch is None:
+                        return
+                    niceness = RETRY_NICENESS
+                coro = scan_batch_async(batch, command_fn, parse_fn, tool_name, semaphore, timeout, niceness)
+                in_flight[asyncio.ensure_future(coro)] = batch
+
+        fill_window()
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                writer.handle_result(in_flight.pop(fut), fut.result())
+
+            # 每批完成后立即刷新缓冲区，防止程序中断丢失数据
+            writer.flush()
+            fill_window()
+
+        writer.flush()
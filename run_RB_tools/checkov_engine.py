@@ -0,0 +1,83 @@
+import os
+
+# --- 进程内 Checkov 引擎 ---
+# 每个进程只导入一次 Checkov 的 Kubernetes Runner（连同策略注册表），
+# 之后直接在本进程内调用，不再为每个文件启动一次 `checkov` 命令行：
+# 解释器启动、Checkov 导入和策略加载的冷启动开销每个进程只付一次
+
+_RUNNER_CLS = None
+_RUNNER_FILTER = None
+
+
+def init_engine(checks=None):
+    """
+    导入 Checkov 并缓存 Runner 类与过滤器
+    可作为 ProcessPoolExecutor 的 initializer，在工作进程启动时预热
+    checks: 只运行这些检查 ID（对应命令行的 --check），None 表示全部检查
+    """
+    global _RUNNER_CLS, _RUNNER_FILTER
+    if _RUNNER_CLS is not None:
+        return
+
+    from checkov.kubernetes.runner import Runner
+    from checkov.runner_filter import RunnerFilter
+
+    _RUNNER_CLS = Runner
+    # 与命令行的 --framework kubernetes [--check ...] 一致
+    _RUNNER_FILTER = RunnerFilter(framework=["kubernetes"], checks=checks)
+
+
+def _record_to_dict(record):
+    """
+    把 Checkov 的 Record 对象转换成与 JSON 输出中单条 check 相同的字典
+    """
+    return {
+        "check_id": record.check_id,
+        "check_name": record.check_name,
+        "file_path": record.file_path,
+        "file_line_range": record.file_line_range,
+    }
+
+
+def scan(root_folder=None, files=None):
+    """
+    在本进程内运行 Checkov 的 Kubernetes Runner
+    root_folder: 扫描目录（对应命令行的 --directory）
+    files: 文件路径列表（对应命令行的 --file）
+    返回: 与 `checkov --output json --framework kubernetes` 相同结构的字典，
+          Checkov 没有解析出任何 K8s 资源时返回 None（与命令行只输出汇总时的处理一致）
+    """
+    init_engine()
+
+    # Runner 实例在 run() 中保存本次扫描的状态，每次扫描新建一个；
+    # 代价高的导入与策略注册只在 init_engine 中发生一次
+    report = _RUNNER_CLS().run(
+        root_folder=root_folder,
+        files=files,
+        runner_filter=_RUNNER_FILTER
+    )
+
+    # 部分 Checkov 版本会返回报告列表
+    reports = report if isinstance(report, list) else [report]
+
+    passed_checks = []
+    failed_checks = []
+    for r in reports:
+        passed_checks.extend(_record_to_dict(rec) for rec in r.passed_checks)
+        failed_checks.extend(_record_to_dict(rec) for rec in r.failed_checks)
+
+    if not passed_checks and not failed_checks:
+        return None
+
+    # 目录扫描时 file_path 形如 /123.yaml；统一成相对扫描目录的写法，方便调用方按文件名拆分
+    if root_folder:
+        for check in passed_checks + failed_checks:
+            check["file_path"] = "/" + os.path.basename(check["file_path"] or "")
+
+    return {
+        "check_type": "kubernetes",
+        "results": {
+            "passed_checks": passed_checks,
+            "failed_checks": failed_checks,
+        },
+    }
@@ -0,0 +1,451 @@
+import os
+import sys
+import json
+import glob
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+# --- 关键配置：设置 Hugging Face 缓存路径 ---
+# 必须在导入 datasets 之前设置
+os.environ["HF_DATASETS_CACHE"] = "/ssd_2t_1/wyq_workspace/hf_cache"
+import yaml
+from tqdm import tqdm
+
+from scan_cache import content_hash
+from scan_utils import chunked, filter_valid_tasks, init_dataset_worker, resolve_batch_contents
+from umi_rules import MAPPING_FILE, normalize_text, read_csv_rows
+from yaml_documents import split_documents
+
+# --- 进程内快速规则引擎 ---
+# UMI 4, 7, 8, 10–19, 27–35, 50 几乎出现在每个 Deployment 上，它们都是 securityContext /
+# resources / 镜像标签之类的简单字段检查。这里直接在解析后的清单上求值：
+# 一批清单的所有容器先展开成按列存放的容器表，每条规则对整列求值一次，再按文档汇总，
+# 输出与 run_checkov_full.py 相同结构的记录（check_name 取映射表中对应 UMI 的 Checkov 规则名），
+# combine_umi_full.py 可以直接读取。--validate 模式与三个扫描器的结果逐文件对比
+
+# --- 配置区域 ---
+DATASET_NAME = "substratusai/the-stack-yaml-k8s"
+OUTPUT_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/fastpath_full_results.jsonl"
+# 并行进程数
+MAX_WORKERS = 16
+# 每个工作进程一次求值的清单数
+BATCH_SIZE = 512
+# 只处理 yaml_prefilter.py 判定为有效的清单（预过滤结果不存在时处理全部清单）
+USE_PREFILTER = True
+PREFILTER_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/prefilter_results.jsonl"
+
+# 验证模式：命令行加 --validate 时在 100 个样本上与扫描器结果对比，不处理全量数据集
+VALIDATE_MODE = "--validate" in sys.argv[1:]
+VALIDATE_YAML_DIR = "/home/wyq/GenKubeSec_Reproduce/raw_100_yaml_files"
+VALIDATE_RESULT_FILES = {
+    "checkov": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/checkov_100_results.jsonl",
+    "kubelinter": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/kubelinter_100_results.jsonl",
+    "terrascan": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/terrascan_100_results.jsonl"
+}
+
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# 带 Pod 模板的工作负载 kind -> Pod spec 所在路径
+POD_SPEC_PATHS = {
+    "Pod": ("spec",),
+    "Deployment": ("spec", "template", "spec"),
+    "DaemonSet": ("spec", "template", "spec"),
+    "StatefulSet": ("spec", "template", "spec"),
+    "ReplicaSet": ("spec", "template", "spec"),
+    "ReplicationController": ("spec", "template", "spec"),
+    "Job": ("spec", "template", "spec"),
+    "CronJob": ("spec", "jobTemplate", "spec", "template", "spec"),
+}
+# “默认命名空间”检查覆盖的 kind（Checkov CKV_K8S_21 / Terrascan AC_K8S_0086 实际会报的资源类型）
+NAMESPACED_KINDS = {
+    "Pod", "Deployment", "DaemonSet", "StatefulSet", "ReplicaSet", "ReplicationController", "Job", "CronJob",
+    "Service", "ConfigMap", "Secret", "ServiceAccount", "Ingress", "Role", "RoleBinding",
+}
+# 不以 root 运行的 PodSecurityPolicy 规则
+PSP_NON_ROOT_RULES = {"MustRunAsNonRoot"}
+SECCOMP_DEFAULTS = {"docker/default", "runtime/default"}
+POD_SECCOMP_ANNOTATION = "seccomp.security.alpha.kubernetes.io/pod"
+
+
+def dig(obj, *path):
+    """按路径读取嵌套字典，中途不是字典或缺失时返回 None"""
+    for key in path:
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+def as_dict(value):
+    return value if isinstance(value, dict) else {}
+
+
+def as_list(value):
+    return value if isinstance(value, list) else []
+
+
+def capability_set(security_context, field):
+    return {str(c).upper() for c in as_list(dig(security_context, "capabilities", field))}
+
+
+def image_tag(image):
+    """返回镜像的标签；带 digest 的镜像返回 "@"，没有标签时返回空字符串"""
+    image = str(image or "")
+    if "@" in image:
+        return "@"
+    name = image.rsplit("/", 1)[-1]
+    return name.split(":", 1)[1] if ":" in name else ""
+
+
+def command_args(container):
+    return [str(a) for a in as_list(container.get("command")) + as_list(container.get("args"))]
+
+
+def flag_value(args, flag):
+    """读取 --flag=value 形式的命令行参数，不存在时返回 None"""
+    for arg in args:
+        if arg.startswith(flag + "="):
+            return arg.split("=", 1)[1]
+    return None
+
+
+# --- 文档表与容器表 ---
+# 文档表：每个 K8s 资源一行；容器表：每个容器 (含 initContainers) 一行，doc 列指回文档表
+
+def build_tables(manifests):
+    """
+    把一批清单展开成文档表和容器表
+    manifests: [(key, content), ...]
+    返回: (docs, containers)，均为 {列名: [值, ...]}
+    """
+    docs = defaultdict(list)
+    containers = defaultdict(list)
+
+    for key, content in manifests:
+        for offset, text in split_documents(content or ""):
+            try:
+                parsed = yaml.load(text, Loader=SafeLoader)
+            except Exception:
+                continue
+            if not isinstance(parsed, dict):
+                continue
+            # kind: List 的每个 item 都是独立资源
+            resources = as_list(parsed.get("items")) if parsed.get("kind") == "List" else [parsed]
+
+            lines = text.split('\n')
+            content_lines = [i for i, line in enumerate(lines)
+                             if line.strip() and not line.lstrip().startswith('#')]
+            line_range = [offset + content_lines[0] + 1, offset + content_lines[-1] + 1]
+
+            for resource in resources:
+                if not isinstance(resource, dict) or not resource.get("apiVersion") or not resource.get("kind"):
+                    continue
+                kind = str(resource["kind"])
+                metadata = as_dict(resource.get("metadata"))
+                path = POD_SPEC_PATHS.get(kind)
+                pod_spec = as_dict(dig(resource, *path)) if path else None
+                template_metadata = as_dict(dig(resource, *path[:-1], "metadata")) if path and len(path) > 1 else metadata
+
+                row = len(docs["key"])
+                docs["key"].append(key)
+                docs["kind"].append(kind)
+                docs["line_range"].append(line_range)
+                docs["namespace"].append(metadata.get("namespace"))
+                docs["psp_run_as_user"].append(dig(resource, "spec", "runAsUser", "rule"))
+                docs["is_workload"].append(pod_spec is not None)
+                docs["pod_sc"].append(as_dict(pod_spec.get("securityContext")) if pod_spec is not None else {})
+                docs["has_pod_sc"].append(pod_spec is not None and pod_spec.get("securityContext") is not None)
+                docs["automount"].append(pod_spec.get("automountServiceAccountToken") if pod_spec is not None else None)
+                docs["annotations"].append(as_dict(template_metadata.get("annotations")))
+
+                if pod_spec is None:
+                    continue
+                for field in ("initContainers", "containers"):
+                    for container in as_list(pod_spec.get(field)):
+                        if not isinstance(container, dict):
+                            continue
+                        containers["doc"].append(row)
+                        containers["is_init"].append(field == "initContainers")
+                        containers["image"].append(container.get("image"))
+                        containers["sc"].append(as_dict(container.get("securityContext")))
+                        containers["has_sc"].append(container.get("securityContext") is not None)
+                        containers["resources"].append(as_dict(container.get("resources")))
+                        containers["liveness"].append(container.get("livenessProbe") is not None)
+                        containers["readiness"].append(container.get("readinessProbe") is not None)
+                        containers["args"].append(command_args(container))
+
+    return docs, containers
+
+
+def effective(containers, docs, field):
+    """容器级 securityContext 字段，容器未设置时取 Pod 级设置"""
+    return [
+        sc.get(field) if sc.get(field) is not None else docs["pod_sc"][doc].get(field)
+        for sc, doc in zip(containers["sc"], containers["doc"])
+    ]
+
+
+# --- 规则：每条规则对整列求值，返回失败的容器行号或文档行号 ---
+
+def container_rules(docs, containers):
+    """
+    返回: {UMI ID: [失败的容器行号, ...]}
+    """
+    sc = containers["sc"]
+    resources = containers["resources"]
+    run_as_non_root = effective(containers, docs, "runAsNonRoot")
+    run_as_user = effective(containers, docs, "runAsUser")
+    is_apiserver = [any("kube-apiserver" in a for a in args) for args in containers["args"]]
+    seccomp_type = [
+        str(dig(s, "seccompProfile", "type") or dig(docs["pod_sc"][d], "seccompProfile", "type") or "")
+        for s, d in zip(sc, containers["doc"])
+    ]
+    annotations = [docs["annotations"][d] for d in containers["doc"]]
+    rows = range(len(containers["doc"]))
+
+    def fails(mask):
+        return [i for i in rows if mask[i]]
+
+    return {
+        # 显式设置 allowPrivilegeEscalation: false 才通过
+        "4": fails([s.get("allowPrivilegeEscalation") is not False for s in sc]),
+        # 容器级 runAsNonRoot: true 或 runAsUser 非 0；Terrascan 不认 Pod 级设置，
+        # Pod 级设置只能让 Checkov 通过，两者的并集就是容器级判定
+        "8": fails([not (s.get("runAsNonRoot") is True or (isinstance(s.get("runAsUser"), int) and s["runAsUser"] > 0))
+                    for s in sc]),
+        # 必须 drop NET_RAW 或 ALL
+        "10": fails([not ({"NET_RAW", "ALL"} & capability_set(s, "drop")) for s in sc]),
+        # 探针对 initContainers 没有意义
+        "11": fails([not live and not init for live, init in zip(containers["liveness"], containers["is_init"])]),
+        "12": fails([not ready and not init for ready, init in zip(containers["readiness"], containers["is_init"])]),
+        "13": fails([dig(r, "limits", "cpu") is None for r in resources]),
+        "14": fails([dig(r, "requests", "cpu") is None for r in resources]),
+        "15": fails([dig(r, "limits", "memory") is None for r in resources]),
+        "16": fails([dig(r, "requests", "memory") is None for r in resources]),
+        "17": fails([image_tag(image) in ("", "latest") for image in containers["image"]]),
+        "19": fails([s.get("readOnlyRootFilesystem") is not True for s in sc]),
+        "28": fails(["SYS_ADMIN" in capability_set(s, "add") or "CAP_SYS_ADMIN" in capability_set(s, "add")
+                     for s in sc]),
+        "29": fails([not (isinstance(u, int) and u >= 10000) for u in run_as_user]),
+        "30": fails([image_tag(image) != "@" for image in containers["image"]]),
+        "31": fails([apiserver and "AlwaysPullImages" not in str(flag_value(args, "--enable-admission-plugins") or "")
+                     for apiserver, args in zip(is_apiserver, containers["args"])]),
+        # Checkov 要求容器级 securityContext，Terrascan 要求 Pod 级和容器级都有
+        "33": fails([not has or not docs["has_pod_sc"][d] for has, d in zip(containers["has_sc"], containers["doc"])]),
+        "34": fails([t not in ("RuntimeDefault", "Localhost")
+                     and a.get(POD_SECCOMP_ANNOTATION) not in SECCOMP_DEFAULTS
+                     for t, a in zip(seccomp_type, annotations)]),
+        "50": fails([apiserver and flag_value(args, "--anonymous-auth") != "false"
+                     for apiserver, args in zip(is_apiserver, containers["args"])]),
+    }
+
+
+def document_rules(docs):
+    """
+    返回: {UMI ID: [失败的文档行号, ...]}
+    """
+    rows = range(len(docs["key"]))
+    kinds = docs["kind"]
+    return {
+        # PodSecurityPolicy 未限制 root 用户
+        "7": [i for i in rows
+              if kinds[i] == "PodSecurityPolicy" and docs["psp_run_as_user"][i] not in PSP_NON_ROOT_RULES],
+        # 命名空间级资源未指定 namespace 或显式使用 default
+        "18": [i for i in rows
+               if kinds[i] in NAMESPACED_KINDS and docs["namespace"][i] in (None, "", "default")],
+        "27": [i for i in rows if docs["is_workload"][i] and docs["automount"][i] is not False],
+        "32": [i for i in rows if docs["is_workload"][i] and not docs["has_pod_sc"][i]],
+    }
+
+
+# UMI 35 与 34 的判定相同（映射表中 Terrascan 的 seccomp 规则对应 35）
+ALIASES = {"35": "34"}
+# 每个 UMI 对应的 Checkov 规则 ID（记录中的 check_id 字段）
+CHECKOV_IDS = {
+    "4": "CKV_K8S_20", "7": "CKV_K8S_6", "8": "CKV_K8S_23", "10": "CKV_K8S_28", "11": "CKV_K8S_8",
+    "12": "CKV_K8S_9", "13": "CKV_K8S_11", "14": "CKV_K8S_10", "15": "CKV_K8S_13", "16": "CKV_K8S_12",
+    "17": "CKV_K8S_14", "18": "CKV_K8S_21", "19": "CKV_K8S_22", "27": "CKV_K8S_38", "28": "CKV_K8S_39",
+    "29": "CKV_K8S_40", "30": "CKV_K8S_43", "31": "CKV_K8S_80", "32": "CKV_K8S_29", "33": "CKV_K8S_30",
+    "34": "CKV_K8S_31", "35": "CKV_K8S_32", "50": "CKV_K8S_68",
+}
+FAST_UMI_IDS = sorted(CHECKOV_IDS, key=int)
+CHECK_IDS_TO_UMI = {check_id: umi_id for umi_id, check_id in CHECKOV_IDS.items()}
+
+
+def load_check_names():
+    """
+    UMI ID -> 映射表中的 Checkov_Policy 文本，作为记录的 check_name，
+    combine_umi_full.py 按 check_name 匹配时正好映射回该 UMI ID
+    """
+    names = {}
+    for row in read_csv_rows(MAPPING_FILE):
+        umi_id = normalize_text(row.get("ID"))
+        if umi_id in CHECKOV_IDS:
+            names[umi_id] = normalize_text(row.get("Checkov_Policy"))
+    return names
+
+
+CHECK_NAMES = load_check_names()
+
+
+def evaluate(manifests):
+    """
+    对一批清单求值全部快速规则
+    manifests: [(key, content), ...]
+    返回: {key: [error, ...]}，error 与 extract_checkov_errors 的结构一致；没有发现的清单不出现
+    """
+    docs, containers = build_tables(manifests)
+
+    failed_docs = defaultdict(set)  # UMI ID -> 失败的文档行号
+    for umi_id, rows in container_rules(docs, containers).items():
+        failed_docs[umi_id].update(containers["doc"][i] for i in rows)
+    for umi_id, rows in document_rules(docs).items():
+        failed_docs[umi_id].update(rows)
+    for alias, umi_id in ALIASES.items():
+        failed_docs[alias] = failed_docs[umi_id]
+
+    findings = defaultdict(list)
+    for umi_id in FAST_UMI_IDS:
+        for row in sorted(failed_docs[umi_id]):
+            findings[docs["key"][row]].append({
+                "check_id": CHECKOV_IDS[umi_id],
+                "check_name": CHECK_NAMES.get(umi_id),
+                "file_line_range": docs["line_range"][row],
+            })
+    return findings
+
+
+def evaluate_batch(batch):
+    """
+    工作进程函数：batch 为 [(index, content 或 None, pseudo_filename), ...]
+    返回: (批内清单数, [(index, record), ...])，记录只包含有发现的清单，结构与 run_checkov_full.py 一致
+    """
+    batch = resolve_batch_contents(batch)
+    tasks = {idx: (content, filename) for idx, content, filename in batch}
+    findings = evaluate([(idx, content) for idx, content, _ in batch])
+    return len(batch), [
+        (idx, {"index": idx, "content_hash": content_hash(tasks[idx][0]), "filename": tasks[idx][1],
+               "scan_tool": "fastpath", "error_count": len(errors), "errors": errors})
+        for idx, errors in findings.items()
+    ]
+
+
+# --- 验证模式 ---
+
+def scanner_umi_ids(result_files):
+    """
+    按 combine_umi_full.py 的匹配方式，从三个扫描器的结果中得到 {filename: UMI ID 集合}
+    """
+    rows = read_csv_rows(MAPPING_FILE)
+    mappings = {
+        "checkov": ("check_name", {normalize_text(r.get("Checkov_Policy")): r["ID"] for r in rows}),
+        "terrascan": ("description", {normalize_text(r.get("Terrascan_Policy")): r["ID"] for r in rows}),
+        "kubelinter": ("remediation", {normalize_text(r.get("Remediation")): r["ID"] for r in rows}),
+    }
+    labels = defaultdict(set)
+    for tool, filepath in result_files.items():
+        field, mapping = mappings[tool]
+        mapping.pop("", None)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                for err in entry.get("errors", []):
+                    umi_id = mapping.get(normalize_text(err.get(field)))
+                    if umi_id:
+                        labels[entry["filename"]].add(umi_id)
+    return labels
+
+
+def validate():
+    """
+    在样本清单上对比快速规则与扫描器的 UMI 标签（只比较快速规则覆盖的 UMI ID）
+    """
+    print(f"1. 正在读取样本清单: {VALIDATE_YAML_DIR}")
+    manifests = []
+    for path in sorted(glob.glob(os.path.join(VALIDATE_YAML_DIR, "*.yaml"))):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            manifests.append((os.path.basename(path), f.read()))
+    print(f"   共 {len(manifests)} 个清单。")
+
+    print("2. 正在读取扫描器结果并映射到 UMI ...")
+    expected = scanner_umi_ids(VALIDATE_RESULT_FILES)
+
+    findings = evaluate(manifests)
+    covered = set(FAST_UMI_IDS)
+    per_umi = defaultdict(Counter)
+    mismatched = []
+    for filename, _ in manifests:
+        got = {CHECK_IDS_TO_UMI[e["check_id"]] for e in findings.get(filename, [])}
+        want = expected.get(filename, set()) & covered
+        for umi_id in covered:
+            if umi_id in got and umi_id in want:
+                per_umi[umi_id]["tp"] += 1
+            elif umi_id in got:
+                per_umi[umi_id]["fp"] += 1
+            elif umi_id in want:
+                per_umi[umi_id]["fn"] += 1
+        if got != want:
+            mismatched.append((filename, sorted(got - want, key=int), sorted(want - got, key=int)))
+
+    print("\n" + "="*30)
+    print("📊 快速规则 vs 扫描器 (按 UMI)")
+    for umi_id in FAST_UMI_IDS:
+        c = per_umi[umi_id]
+        print(f"UMI {umi_id:>3}: 一致 {c['tp']:>3}, 多报 {c['fp']:>3}, 漏报 {c['fn']:>3}")
+    print(f"完全一致的文件: {len(manifests) - len(mismatched)} / {len(manifests)}")
+    for filename, extra, missing in mismatched:
+        print(f"  - {filename}: 多报 {extra}, 漏报 {missing}")
+    print("="*30)
+
+
+def main():
+    if VALIDATE_MODE:
+        validate()
+        return
+
+    from datasets import load_dataset
+
+    print(f"1. 正在设置缓存路径: {os.environ['HF_DATASETS_CACHE']}")
+    print(f"2. 正在加载数据集: {DATASET_NAME} ...")
+    try:
+        ds = load_dataset(DATASET_NAME, split="train", streaming=False)
+    except Exception as e:
+        print(f"数据集加载失败: {e}")
+        return
+
+    total_files = len(ds)
+    print(f"   数据集加载成功！共包含 {total_files} 个文件。")
+    print(f"3. 准备开始快速规则求值 (进程数: {MAX_WORKERS}, 批大小: {BATCH_SIZE}, UMI: {', '.join(FAST_UMI_IDS)})...")
+
+    # 与 KubeLinter / Terrascan 一致，文件名为 file_{i}.yaml；工作进程自行内存映射数据集
+    tasks = ((i, None, f"file_{i}.yaml") for i in range(total_files))
+    pending_files = total_files
+    if USE_PREFILTER:
+        tasks, skipped = filter_valid_tasks(tasks, PREFILTER_FILE)
+        pending_files -= skipped
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    files_with_findings = 0
+    finding_counts = Counter()
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f_out, \
+         tqdm(total=pending_files, desc="Evaluating fast-path rules") as pbar, \
+         ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=init_dataset_worker,
+                             initargs=(DATASET_NAME,)) as executor:
+        for count, results in executor.map(evaluate_batch, chunked(tasks, BATCH_SIZE)):
+            for _, record in results:
+                finding_counts.update(CHECK_IDS_TO_UMI[e["check_id"]] for e in record["errors"])
+                f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                files_with_findings += 1
+            pbar.update(count)
+
+    print("\n" + "="*30)
+    print("📊 快速规则统计")
+    print(f"处理文件数: {pending_files}")
+    print(f"有发现的文件数: {files_with_findings}")
+    for umi_id in FAST_UMI_IDS:
+        print(f"  - UMI {umi_id}: {finding_counts[umi_id]}")
+    print(f"结果已保存至: {OUTPUT_FILE}")
+    print("="*30)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import glob
+import time
+import tempfile
+import subprocess
+
+from scan_utils import SHM_DIR, run_command, write_scratch_file
+
+# --- 单文件 I/O 开销微基准 ---
+# 对比把一个清单交给扫描器的几种方式的每文件开销（不含扫描器本身的分析时间）：
+#   旧做法: 默认临时目录上 NamedTemporaryFile 创建 + write + flush + 删除，再经 shell=True 启动命令
+#   新做法: tmpfs 上复用的临时文件 + 直接 exec（Checkov / Terrascan）；stdin + 直接 exec（KubeLinter）
+# 用读取输入后立即退出的 cat 代替扫描器，测到的就是“写文件 + 启动进程 + 读文件”本身的开销
+
+# --- 配置区域 ---
+# 样本清单目录
+INPUT_DIR = "/home/wyq/GenKubeSec_Reproduce/raw_100_yaml_files"
+# 每种方式把全部样本重复的轮数
+ROUNDS = 5
+# 代替扫描器的命令：读取文件（或 stdin）后退出
+BENCH_COMMAND = "cat"
+
+
+def old_tempfile_shell(content):
+    """旧做法：NamedTemporaryFile（默认临时目录）+ shell=True"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=True) as tmp_file:
+        tmp_file.write(content)
+        tmp_file.flush()
+        subprocess.run(f"{BENCH_COMMAND} {tmp_file.name}", shell=True, capture_output=True, text=True, check=False)
+
+
+def old_tempfile_only(content):
+    """旧做法的纯文件部分：NamedTemporaryFile 创建 + write + flush + 删除"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=True) as tmp_file:
+        tmp_file.write(content)
+        tmp_file.flush()
+
+
+def scratch_file_exec(content):
+    """新做法：tmpfs 上复用的临时文件 + 直接 exec"""
+    run_command([BENCH_COMMAND, write_scratch_file(content)])
+
+
+def scratch_file_only(content):
+    """新做法的纯文件部分：覆盖写复用的临时文件"""
+    write_scratch_file(content)
+
+
+def stdin_exec(content):
+    """新做法：通过 stdin 传入 + 直接 exec"""
+    run_command([BENCH_COMMAND], input_text=content)
+
+
+METHODS = [
+    ("NamedTemporaryFile 写文件", old_tempfile_only),
+    ("tmpfs 复用文件 写文件", scratch_file_only),
+    ("NamedTemporaryFile + shell=True", old_tempfile_shell),
+    ("tmpfs 复用文件 + exec", scratch_file_exec),
+    ("stdin + exec", stdin_exec),
+]
+
+
+def time_method(fn, contents, rounds):
+    """
+    返回: 每个文件的平均耗时（微秒）
+    """
+    fn(contents[0])  # 预热（首次创建复用文件、加载命令）
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for content in contents:
+            fn(content)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(contents)) * 1e6
+
+
+def main():
+    print(f"1. 正在读取样本清单: {INPUT_DIR}")
+    contents = []
+    for path in sorted(glob.glob(os.path.join(INPUT_DIR, "*.yaml"))):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            contents.append(f.read())
+    if not contents:
+        print("❌ 错误: 没有找到样本清单")
+        return
+
+    print(f"   共 {len(contents)} 个清单。")
+    print(f"2. 正在测量 (每种方式 {ROUNDS} 轮, 默认临时目录: {tempfile.gettempdir()}, tmpfs: {SHM_DIR or '无'})...")
+
+    results = {}
+    for name, fn in METHODS:
+        results[name] = time_method(fn, contents, ROUNDS)
+
+    baseline = results["NamedTemporaryFile + shell=True"]
+    print("\n" + "="*30)
+    print("📊 每文件 I/O 开销 (微秒)")
+    for name, _ in METHODS:
+        line = f"{name}: {results[name]:.1f}"
+        if name in ("tmpfs 复用文件 + exec", "stdin + exec"):
+            line += f" (相对旧做法 {baseline / results[name]:.2f}x)"
+        print(line)
+    print("="*30)
+
+if __name__ == "__main__":
+    main()
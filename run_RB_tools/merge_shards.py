@@ -0,0 +1,170 @@
+import os
+import sys
+import glob
+import json
+import time
+
+from result_store import columnar_path, merge_columnar
+from scan_utils import clean_indices_path
+from shard_utils import file_sha256, shard_manifest_path, shard_range
+
+# --- 合并分片输出 ---
+# 各机器用 --shard i/N 扫描完成后，把分片输出 (*.shard-i-of-N.jsonl)、无发现行号文件和分片清单
+# 拷到同一目录，运行本脚本：先校验所有分片齐全、行号范围无重叠无缺口、工具版本一致、校验和与记录数匹配，
+# 全部通过后按分片顺序拼接成扫描脚本原来的 OUTPUT_FILE（combine_umi_full.py 读取的文件）
+#
+# 用法:
+#   python merge_shards.py                 合并下面配置的全部输出（没有分片清单的跳过）
+#   python merge_shards.py <输出文件> ...   只合并指定的输出
+
+# --- 配置区域 ---
+# 各扫描脚本的 OUTPUT_FILE，分片文件与之同目录同前缀
+MERGE_OUTPUT_FILES = [
+    "/home/wyq/kcfs_results/checkov_full_results.jsonl",
+    "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/kubelinter_full_results.jsonl",
+    "/home/wyq/kcfs_results/terrascan_full_results.jsonl",
+    "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/all_full_results.jsonl",
+]
+
+
+def find_manifests(output_file):
+    """
+    找到某个输出文件的全部分片清单
+    返回: [manifest 字典, ...]，每个附带 "_path"（清单文件路径）
+    """
+    base = os.path.splitext(output_file)[0]
+    manifests = []
+    for path in sorted(glob.glob(f"{glob.escape(base)}.shard-*-of-*.manifest.json")):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest["_path"] = path
+        manifests.append(manifest)
+    return manifests
+
+
+def validate_shards(output_file, manifests):
+    """
+    校验一组分片清单能否合并成完整输出
+    返回: 问题描述列表，为空表示校验通过
+    """
+    problems = []
+    directory = os.path.dirname(output_file)
+
+    for field in ("num_shards", "tool", "total_files", "tool_versions"):
+        values = {json.dumps(m[field], sort_keys=True) for m in manifests}
+        if len(values) > 1:
+            problems.append(f"各分片的 {field} 不一致: {sorted(values)}")
+    if problems:
+        return problems
+
+    num_shards = manifests[0]["num_shards"]
+    total_files = manifests[0]["total_files"]
+    shard_ids = [m["shard"] for m in manifests]
+    missing = sorted(set(range(num_shards)) - set(shard_ids))
+    duplicated = sorted({i for i in shard_ids if shard_ids.count(i) > 1})
+    if missing:
+        problems.append(f"缺少分片: {missing}")
+    if duplicated:
+        problems.append(f"分片重复: {duplicated}")
+
+    for m in manifests:
+        label = f"分片 {m['shard']}/{num_shards}"
+        expected_range = list(shard_range(total_files, (m["shard"], num_shards)))
+        if m["index_range"] != expected_range:
+            problems.append(f"{label} 的行号范围 {m['index_range']} 与划分 {expected_range} 不符")
+
+        shard_output = os.path.join(directory, m["output_file"])
+        if file_sha256(shard_output) != m["sha256"]:
+            problems.append(f"{label} 的输出 {shard_output} 缺失或校验和不符")
+        if m["clean_file"] is not None:
+            clean_file = os.path.join(directory, m["clean_file"])
+            if file_sha256(clean_file) != m["clean_sha256"]:
+                problems.append(f"{label} 的无发现行号文件 {clean_file} 缺失或校验和不符")
+
+    return problems
+
+
+def concat_files(paths, target):
+    """
+    按顺序拼接文件：先写临时文件再原子替换，校验失败或中断时不会留下半个输出
+    """
+    tmp_target = target + ".merging"
+    with open(tmp_target, 'wb') as f_out:
+        for path in paths:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    f_out.write(chunk)
+    os.replace(tmp_target, target)
+
+
+def merge_output(output_file):
+    """
+    校验并合并一个输出文件的全部分片
+    返回: True 表示已合并
+    """
+    manifests = find_manifests(output_file)
+    if not manifests:
+        print(f"⚠️ 跳过: 没有找到 {output_file} 的分片清单")
+        return False
+
+    print(f"📖 正在校验 {output_file} 的 {len(manifests)} 个分片 ...")
+    problems = validate_shards(output_file, manifests)
+    if problems:
+        print(f"❌ 校验失败，未合并 {output_file}:")
+        for problem in problems:
+            print(f"   - {problem}")
+        return False
+
+    manifests.sort(key=lambda m: m["shard"])
+    directory = os.path.dirname(output_file)
+    concat_files([os.path.join(directory, m["output_file"]) for m in manifests], output_file)
+    clean_files = [os.path.join(directory, m["clean_file"]) for m in manifests if m["clean_file"] is not None]
+    if clean_files:
+        concat_files(clean_files, clean_indices_path(output_file))
+    # 扫描时开启了 COLUMNAR_OUTPUT 的话，各分片的 .parquet 也一并合并
+    columnar_files = [columnar_path(os.path.join(directory, m["output_file"])) for m in manifests]
+    if all(os.path.exists(f) for f in columnar_files):
+        merge_columnar(columnar_files, columnar_path(output_file))
+
+    # 合并结果的清单：汇总计数并记录来源分片，便于追溯
+    totals = {}
+    for m in manifests:
+        for key, value in m["counts"].items():
+            totals[key] = totals.get(key, 0) + value
+    merged = {
+        "tool": manifests[0]["tool"],
+        "num_shards": manifests[0]["num_shards"],
+        "index_range": [0, manifests[0]["total_files"]],
+        "total_files": manifests[0]["total_files"],
+        "tool_versions": manifests[0]["tool_versions"],
+        "counts": totals,
+        "output_file": os.path.basename(output_file),
+        "sha256": file_sha256(output_file),
+        "shards": [os.path.basename(m["_path"]) for m in manifests],
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(shard_manifest_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False, indent=2)
+
+    print(f"   └─ 已合并 {totals.get('records', 0)} 条记录、{totals.get('clean', 0)} 个无发现文件 -> {output_file}")
+    return True
+
+
+def main():
+    output_files = sys.argv[1:] or MERGE_OUTPUT_FILES
+    print(f"🚀 开始合并分片输出 ({len(output_files)} 个输出文件)...")
+
+    merged = [f for f in output_files if merge_output(f)]
+
+    print("\n" + "="*30)
+    print("📊 合并统计")
+    print(f"已合并: {len(merged)} / {len(output_files)}")
+    for f in merged:
+        print(f"  - {f}")
+    print("="*30)
+
+    if len(merged) < len(output_files) and sys.argv[1:]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
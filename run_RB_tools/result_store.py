@@ -0,0 +1,196 @@
+import os
+import re
+import sys
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- 列式扫描结果 (Parquet) ---
+# JSONL 输出里 check_name / remediation / description 等长文本每条发现都重复一遍，
+# 下游脚本还要逐行 json.loads。这里把扫描结果同时写成 Parquet：每条发现一行，
+# 规则 ID 和各类文本做字典编码（文件里每个不同的字符串只存一次），另有整数的数据集行号列 index；
+# 结果随扫描进度分 row group 写出。combine_umi_full.py 可直接按列读取，映射只需对字典中的不同文本做一次
+#
+# 用法:
+#   python result_store.py <输出 JSONL> ...   把已有的 JSONL 结果转换成同名 .parquet
+
+# 每条发现一行；超时的文件一行（status 为 timeout，规则相关列为空）
+SCHEMA = pa.schema([
+    ("index", pa.int64()),
+    ("content_hash", pa.dictionary(pa.int32(), pa.string())),
+    ("filename", pa.dictionary(pa.int32(), pa.string())),
+    ("scan_tool", pa.dictionary(pa.int32(), pa.string())),
+    ("status", pa.dictionary(pa.int32(), pa.string())),
+    ("error_count", pa.int32()),
+    ("check_id", pa.dictionary(pa.int32(), pa.string())),
+    ("check_name", pa.dictionary(pa.int32(), pa.string())),
+    ("remediation", pa.dictionary(pa.int32(), pa.string())),
+    ("description", pa.dictionary(pa.int32(), pa.string())),
+    ("kind", pa.dictionary(pa.int32(), pa.string())),
+    ("object_kind", pa.dictionary(pa.int32(), pa.string())),
+    ("severity", pa.dictionary(pa.int32(), pa.string())),
+    ("category", pa.dictionary(pa.int32(), pa.string())),
+    ("line_start", pa.int32()),
+    ("line_end", pa.int32()),
+    ("document", pa.int32()),
+    ("object_name", pa.string()),
+    ("message", pa.string()),
+])
+# 直接取自 error 字典同名字段的列
+ERROR_FIELDS = ["check_id", "check_name", "remediation", "description", "kind", "object_kind",
+                "severity", "category", "document", "object_name", "message"]
+# 缓冲多少行写一个 row group
+ROW_GROUP_SIZE = 65536
+
+FILENAME_INDEX = re.compile(r'^file_(\d+)\.yaml$')
+
+
+def columnar_path(output_file):
+    """与 JSONL 输出同名的 .parquet 路径"""
+    return os.path.splitext(output_file)[0] + ".parquet"
+
+
+def index_from_filename(filename):
+    """从伪文件名 file_{i}.yaml 取回数据集行号，不符合格式时返回 None"""
+    match = FILENAME_INDEX.match(filename or "")
+    return int(match.group(1)) if match else None
+
+
+def line_range(error):
+    """Checkov 的 file_line_range [起, 止] 或 Terrascan 的 line，返回 (起, 止)"""
+    lines = error.get("file_line_range")
+    if isinstance(lines, list) and len(lines) == 2:
+        return lines[0], lines[1]
+    if isinstance(error.get("line"), int):
+        return error["line"], error["line"]
+    return None, None
+
+
+class ColumnarResultWriter:
+    """
+    把逐文件的扫描记录按列缓冲，每满 ROW_GROUP_SIZE 行写出一个 row group
+    只在主进程中使用（与 JSONL 输出由同一个 ResultWriter 驱动）
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(path, SCHEMA, compression="zstd")
+        self.columns = {field.name: [] for field in SCHEMA}
+        self.rows = 0
+
+    def _append(self, idx, record, status, error_count, error):
+        lines = line_range(error)
+        row = {
+            "index": idx,
+            "content_hash": record.get("content_hash"),
+            "filename": record.get("filename"),
+            "scan_tool": record.get("scan_tool"),
+            "status": status,
+            "error_count": error_count,
+            "line_start": lines[0],
+            "line_end": lines[1],
+        }
+        for field in ERROR_FIELDS:
+            row[field] = error.get(field)
+        # Terrascan 的规则 ID 字段名为 rule_id，同样写入 check_id 列
+        if row["check_id"] is None:
+            row["check_id"] = error.get("rule_id")
+        for name, values in self.columns.items():
+            values.append(row[name])
+
+    def write(self, idx, record):
+        """
+        追加一个文件的记录（写入 JSONL 的同一条记录）
+        idx: 数据集行号；为 None 时取记录的 index 字段，旧记录没有该字段时从 file_{i}.yaml 形式的文件名推出
+        """
+        if idx is None:
+            idx = record.get("index")
+        if idx is None:
+            idx = index_from_filename(record.get("filename"))
+        if record.get("status") == "timeout":
+            self._append(idx, record, "timeout", 0, {})
+        else:
+            errors = record.get("errors", [])
+            for error in errors:
+                self._append(idx, record, "findings", len(errors), error)
+        if len(self.columns["index"]) >= self.row_group_size:
+            self.flush()
+
+    def write_jsonl(self, jsonl_file):
+        """
+        把已有 JSONL 输出中的全部记录写入（断点续扫时先补上之前的结果，保证列式文件完整）
+        返回: 写入的记录数
+        """
+        count = 0
+        if not os.path.exists(jsonl_file):
+            return count
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.write(record.get("index"), record)
+                count += 1
+        return count
+
+    def flush(self):
+        """把缓冲的行写成一个 row group"""
+        if not self.columns["index"]:
+            return
+        table = pa.table({name: pa.array(values, type=SCHEMA.field(name).type)
+                          for name, values in self.columns.items()}, schema=SCHEMA)
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+        for values in self.columns.values():
+            values.clear()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def read_findings(path, columns=None):
+    """
+    读取列式扫描结果，返回 pyarrow.Table；字典编码列保持 DictionaryArray
+    columns: 只读取这些列（列式存储只会解码需要的列）
+    """
+    return pq.read_table(path, columns=columns)
+
+
+def merge_columnar(paths, target):
+    """
+    按顺序合并多个列式结果文件（merge_shards.py 合并分片时使用），逐个 row group 复制，不整体读入内存
+    """
+    tmp_target = target + ".merging"
+    writer = pq.ParquetWriter(tmp_target, SCHEMA, compression="zstd")
+    for path in paths:
+        source = pq.ParquetFile(path)
+        for k in range(source.num_row_groups):
+            writer.write_table(source.read_row_group(k))
+    writer.close()
+    os.replace(tmp_target, target)
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        print("用法: python result_store.py <输出 JSONL> ...")
+        return
+
+    for jsonl_file in paths:
+        target = columnar_path(jsonl_file)
+        print(f"📖 正在转换 {jsonl_file} ...")
+        writer = ColumnarResultWriter(target)
+        count = writer.write_jsonl(jsonl_file)
+        writer.close()
+        ratio = os.path.getsize(target) / max(1, os.path.getsize(jsonl_file))
+        print(f"   └─ {count} 条记录、{writer.rows} 行 -> {target} (大小为 JSONL 的 {ratio:.1%})")
+
+if __name__ == "__main__":
+    main()
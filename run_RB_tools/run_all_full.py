@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+
+# --- 关键配置：设置 Hugging Face 缓存路径 ---
+# 必须在导入 datasets 之前设置
+os.environ["HF_DATASETS_CACHE"] = "/ssd_2t_1/wyq_workspace/hf_cache"
+from datasets import load_dataset
+from tqdm import tqdm
+
+import checkov_engine
+import run_checkov_full
+import run_kubelinter_full
+import run_terrascan_full
+from run_checkov_full import scan_dir_with_checkov
+from run_kubelinter_full import iter_tasks, scan_dir_with_kubelinter
+from run_terrascan_full import scan_dir_with_terrascan
+from scan_cache import content_hash, get_tool_version
+from scan_utils import (
+    chunked, filter_completed_tasks, filter_valid_tasks, largest_first_order, write_batch_to_dir
+)
+from shard_utils import parse_shard_arg, shard_order, shard_output_path, shard_range, write_shard_manifest
+from umi_rules import rules_cache_version
+
+# --- 配置区域 ---
+# 单遍扫描：每批清单只写一次，三个工具在同一个目录上并发运行，每个文件输出一条合并记录
+# 替代分别运行三个 run_*_full.py 再由 combine_umi_full.py 按文件名对齐
+DATASET_NAME = "substratusai/the-stack-yaml-k8s"
+OUTPUT_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/all_full_results.jsonl"
+# 清单写入内存文件系统 (tmpfs)，没有 /dev/shm 时退回系统默认临时目录
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# 批处理大小：每批清单写入同一个目录，每个工具对该目录只启动一次
+BATCH_SIZE = 64
+# 各工具独立的并发度：三者 CPU 开销不同（Checkov 最重），按机器情况分别调整
+TOOL_WORKERS = {
+    "checkov": 8,
+    "kubelinter": 4,
+    "terrascan": 4,
+}
+# 同时在途（已写入 tmpfs、尚未全部扫描完）的批次数上限
+MAX_IN_FLIGHT_BATCHES = 2 * max(TOOL_WORKERS.values())
+# 断点续扫：命令行加 --resume 时跳过输出文件中已有的记录，新结果追加写入
+RESUME_SCAN = "--resume" in sys.argv[1:]
+# 多机分片：命令行加 --shard i/N 时只扫描第 i 段行号，输出写到分片文件并附带分片清单（见 shard_utils.py）
+SHARD = parse_shard_arg(sys.argv[1:])
+# 按清单字节数从大到小调度，避免最后只剩一个大文件拖尾
+# 单次扫描的超时时间沿用各 run_*_full.py 的 SCAN_TIMEOUT；任一工具失败或超时的文件不写出，续扫时重新扫描
+LARGEST_FIRST = True
+# YAML 预过滤：先运行 yaml_prefilter.py，之后只扫描判定为有效（含 apiVersion/kind 文档）的清单；
+# 预过滤结果文件不存在时扫描全部清单
+USE_PREFILTER = True
+PREFILTER_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/prefilter_results.jsonl"
+
+SCAN_DIR_FUNCS = {
+    "checkov": scan_dir_with_checkov,
+    "kubelinter": scan_dir_with_kubelinter,
+    "terrascan": scan_dir_with_terrascan,
+}
+
+
+def strip_record(record):
+    """
+    合并记录里每个工具只保留结果字段，filename / scan_tool 由外层记录和键名表示
+    """
+    if record is None:
+        return None
+    return {k: v for k, v in record.items() if k not in ("filename", "scan_tool")}
+
+
+def scan_failed(record):
+    """
+    工具的结果是否为扫描失败或超时（两者都带 "error" 字段，见 scan_utils.timeout_records）
+    """
+    return record is not None and "error" in record
+
+
+def create_executors():
+    """
+    为每个工具创建独立的执行器，并发度互不影响
+    Checkov 使用进程内引擎时需要独立进程（受 GIL 限制）；
+    KubeLinter / Terrascan 是外部二进制，线程只负责等待子进程，用线程池即可
+    """
+    if run_checkov_full.USE_INPROCESS_ENGINE:
+        checkov_executor = ProcessPoolExecutor(
+            max_workers=TOOL_WORKERS["checkov"],
+            initializer=partial(checkov_engine.init_engine, run_checkov_full.CHECKOV_CHECKS)
+        )
+    else:
+        checkov_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS["checkov"])
+
+    return {
+        "checkov": checkov_executor,
+        "kubelinter": ThreadPoolExecutor(max_workers=TOOL_WORKERS["kubelinter"]),
+        "terrascan": ThreadPoolExecutor(max_workers=TOOL_WORKERS["terrascan"]),
+    }
+
+
+def tool_versions():
+    """
+    三个工具的版本号（含规则白名单指纹），写入分片清单
+    """
+    return {
+        "checkov": rules_cache_version(get_tool_version("checkov"), run_checkov_full.CHECKOV_CHECKS),
+        "kubelinter": rules_cache_version(
+            get_tool_version("kubelinter", run_kubelinter_full.KUBELINTER_BIN), run_kubelinter_full.KUBELINTER_CHECKS
+        ),
+        "terrascan": rules_cache_version(get_tool_version("terrascan"), run_terrascan_full.TERRASCAN_RULES),
+    }
+
+
+def main():
+    print(f"1. 正在设置缓存路径: {os.environ['HF_DATASETS_CACHE']}")
+    print(f"2. 正在加载数据集: {DATASET_NAME} ...")
+
+    try:
+        ds = load_dataset(DATASET_NAME, split="train", streaming=False)
+    except Exception as e:
+        print(f"数据集加载失败: {e}")
+        return
+
+    total_files = len(ds)
+    print(f"   数据集加载成功！共包含 {total_files} 个文件。")
+    print(f"3. 准备开始单遍扫描 (并发度: {TOOL_WORKERS}, 批大小: {BATCH_SIZE}, 临时目录: {SHM_DIR or tempfile.gettempdir()})...")
+
+    order = largest_first_order(ds) if LARGEST_FIRST else None
+    # 多机分片：只扫描本分片的行号范围，输出写到分片文件
+    output_file, index_range = OUTPUT_FILE, None
+    if SHARD:
+        index_range = shard_range(total_files, SHARD)
+        order = shard_order(order, index_range)
+        output_file = shard_output_path(OUTPUT_FILE, SHARD)
+        print(f"   分片 {SHARD[0]}/{SHARD[1]}: 行号 [{index_range[0]}, {index_range[1]})，输出: {output_file}")
+
+    # 与 KubeLinter / Terrascan 一致，文件名为 file_{i}.yaml
+    tasks = iter_tasks(ds, order=order)
+    pending_files = total_files if index_range is None else index_range[1] - index_range[0]
+
+    # 预过滤：空文件、无法解析或不含 K8s 文档的清单不启动扫描器
+    if USE_PREFILTER:
+        tasks, skipped = filter_valid_tasks(tasks, PREFILTER_FILE, index_range)
+        pending_files -= skipped
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    # 三个工具都扫描成功的文件才写出记录（包括无发现的文件），续扫时只需读取输出文件；
+    # 有工具失败或超时的文件与各 run_*_full.py 一样不写出（ResultWriter.fail），续扫时重新扫描
+    if RESUME_SCAN:
+        tasks, done_count = filter_completed_tasks(tasks, output_file)
+        pending_files = max(0, pending_files - done_count)
+    write_mode = 'a' if RESUME_SCAN else 'w'
+
+    executors = create_executors()
+    batches = chunked(tasks, BATCH_SIZE)
+    in_flight = {}  # batch_id -> {"dir": 临时目录, "name_map": ..., "hashes": {index: 内容哈希}, "results": {工具: {index: record}}}
+    futures = {}    # future -> (batch_id, 工具名)
+    next_batch_id = 0
+    failed_files = 0
+
+    def fill_window():
+        nonlocal next_batch_id
+        while len(in_flight) < MAX_IN_FLIGHT_BATCHES:
+            batch = next(batches, None)
+            if batch is None:
+                return
+            # 每批清单只写一次，三个工具共用这个目录
+            tmp_dir = tempfile.mkdtemp(prefix="rb_scan_", dir=SHM_DIR)
+            name_map = write_batch_to_dir(batch, tmp_dir)
+            hashes = {idx: content_hash(content) for idx, content, _ in batch}
+            in_flight[next_batch_id] = {"dir": tmp_dir, "name_map": name_map, "hashes": hashes, "results": {}}
+            for tool, executor in executors.items():
+                future = executor.submit(SCAN_DIR_FUNCS[tool], tmp_dir, name_map)
+                futures[future] = (next_batch_id, tool)
+            next_batch_id += 1
+
+    try:
+        with open(output_file, write_mode, encoding='utf-8') as f_out, \
+             tqdm(total=pending_files, desc="Scanning with Checkov + KubeLinter + Terrascan") as pbar:
+            fill_window()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_id, tool = futures.pop(future)
+                    state = in_flight[batch_id]
+                    state["results"][tool] = dict(future.result())
+                    if len(state["results"]) < len(SCAN_DIR_FUNCS):
+                        continue
+
+                    # 三个工具都完成后，按文件合并结果并写出
+                    for idx, filename in sorted(state["name_map"].values()):
+                        results = {name: state["results"][name].get(idx) for name in SCAN_DIR_FUNCS}
+                        if any(scan_failed(result) for result in results.values()):
+                            failed_files += 1
+                            continue
+                        record = {"index": idx, "content_hash": state["hashes"][idx], "filename": filename}
+                        for name, result in results.items():
+                            record[name] = strip_record(result)
+                        f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+                    shutil.rmtree(state["dir"], ignore_errors=True)
+                    pbar.update(len(state["name_map"]))
+                    del in_flight[batch_id]
+
+                # 立即刷新缓冲区，防止程序中断丢失数据
+                f_out.flush()
+                fill_window()
+    finally:
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+        for state in in_flight.values():
+            shutil.rmtree(state["dir"], ignore_errors=True)
+
+    if SHARD:
+        write_shard_manifest(output_file, "all", SHARD, total_files, tool_versions())
+
+    print(f"\n扫描完成！结果已保存至: {output_file}")
+    if failed_files:
+        print(f"⚠️ {failed_files} 个文件有工具扫描失败或超时，未写出结果，加 --resume 重新运行即可重试")
+
+if __name__ == "__main__":
+    main()
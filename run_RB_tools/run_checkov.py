@@ -3,28 +3,38 @@ import glob
 import subprocess
 import json
 
+import checkov_engine
+
 # --- 配置部分 ---
 INPUT_DIR = "/home/wyq/GenKubeSec_Reproduce/raw_100_yaml_files"       # 你的 YAML 文件存放目录
 OUTPUT_FILE = "/home/wyq/kcfs_results/checkov_100_results.jsonl" # 结果保存文件
 SCAN_LIMIT = 100                      # 只扫描前 10 个
+USE_INPROCESS_ENGINE = True           # True: 只导入一次 Checkov，进程内逐个扫描；False: 每个文件启动一次 checkov 命令
 
 def scan_file_with_checkov(filepath):
     """
     对单个文件运行 Checkov 并返回解析后的结果
     """
+    if USE_INPROCESS_ENGINE:
+        try:
+            # 进程内引擎返回的结构与 --output json 相同，后续提取逻辑无需改动
+            return checkov_engine.scan(files=[filepath])
+        except Exception as e:
+            print(f"运行出错 {filepath}: {str(e)}")
+            return None
+
     # 构造命令
     # --file: 指定文件
     # --output json: 输出 JSON 格式，方便代码解析
     # --quiet: 不输出 Checkov 的 Logo 和进度条
     # --framework kubernetes: 只启用 K8s 扫描，加快速度
-    cmd = f"checkov --file {filepath} --output json --quiet --framework kubernetes"
+    cmd = ["checkov", "--file", filepath, "--output", "json", "--quiet", "--framework", "kubernetes"]
     
     try:
         # 运行命令
         # check=False 是因为 Checkov 发现错误时会返回非 0 状态码，我们不希望脚本因此中断
         result = subprocess.run(
             cmd, 
-            shell=True, 
             capture_output=True, 
             text=True, 
             check=False 
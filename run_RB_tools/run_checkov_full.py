@@ -1,96 +1,285 @@
 import os
+import sys
+import asyncio
 import json
-import tempfile
-import subprocess
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import defaultdict
+from functools import partial
 # 必须在导入 datasets 之前设置缓存路径
 os.environ["HF_DATASETS_CACHE"] = "/ssd_2t_1/wyq_workspace/hf_cache"
 from datasets import load_dataset
-from tqdm import tqdm
+
+import checkov_engine
+from async_scan import run_batched_scan_async
+from scan_cache import ScanCache, get_tool_version
+from result_store import ColumnarResultWriter, columnar_path
+from scan_utils import (
+    ScanTimeout, call_with_timeout, clean_indices_path, filter_completed_tasks, filter_valid_tasks,
+    init_dataset_worker, largest_first_order, resolve_batch_contents, run_batched_scan, run_command,
+    scratch_dir, timeout_records, write_batch_to_dir, write_scratch_file
+)
+from shard_utils import (
+    parse_shard_arg, shard_order, shard_output_path, shard_range, write_shard_manifest
+)
+from umi_rules import checkov_check_ids, rules_cache_version
 
 # --- 配置区域 ---
 DATASET_NAME = "substratusai/the-stack-yaml-k8s"
 OUTPUT_FILE = "/home/wyq/kcfs_results/checkov_full_results.jsonl"
 # 并行进程数：建议设置为 CPU 核心数 - 2，防止卡死机器
 MAX_WORKERS = 16 
+# 批处理大小：每个工作进程把 N 个清单写入同一个临时目录，只启动一次 Checkov
+# 设置为 1 则退回到逐文件扫描模式
+BATCH_SIZE = 64
+# 同时提交给进程池的批次数上限：任务按需提交，主进程内存不随数据集大小增长
+MAX_IN_FLIGHT_BATCHES = 4 * MAX_WORKERS
+# 零拷贝模式：工作进程自行内存映射 HF/Arrow 缓存，主进程只发送行号，不再 pickle 文件内容
+ZERO_COPY_WORKERS = True
+# True: 每个工作进程只导入一次 Checkov，进程内直接调用 Kubernetes Runner
+# False: 每次扫描都启动 checkov 命令行子进程（原有方式）
+USE_INPROCESS_ENGINE = True
+# 扫描结果缓存 (三个工具共用同一个 SQLite 文件)，设置 USE_SCAN_CACHE = False 可关闭
+USE_SCAN_CACHE = True
+CACHE_DB = "/home/wyq/kcfs_results/scan_cache.sqlite"
+# 断点续扫：命令行加 --resume 时跳过输出文件中已有的记录和 *_clean.txt 中已完成的无发现文件，
+# 新结果追加写入；不加则与原来一样覆盖输出重新扫描
+RESUME_SCAN = "--resume" in sys.argv[1:]
+# 多机分片：命令行加 --shard i/N 时只扫描第 i 段行号，输出写到分片文件并附带分片清单，
+# 各分片完成后由 merge_shards.py 校验并拼接成 OUTPUT_FILE（见 shard_utils.py）
+SHARD = parse_shard_arg(sys.argv[1:])
+# asyncio 驱动：用单个事件循环 + asyncio.create_subprocess_exec 直接驱动扫描子进程（不经过 shell），
+# 不再占用 Python 工作进程等待子进程；默认关闭，仍使用上面的进程池
+USE_ASYNC_EXECUTOR = False
+# asyncio 驱动下同时运行的扫描子进程数
+ASYNC_CONCURRENCY = MAX_WORKERS
+# 单次扫描（一个批次或一个文件）的超时时间（秒），超时后杀掉扫描器的整个进程组，
+# 避免个别异常清单让整个扫描卡在 99.9%；设置为 None 则不限制
+SCAN_TIMEOUT = 600
+# 超时的文件在所有新批次之后以单文件批次、较低优先级 (nice) 重试一次，仍超时则写出 status 为 timeout 的记录
+RETRY_TIMEOUTS = True
+# 按清单字节数从大到小调度，避免最后只剩一个大文件拖尾
+LARGEST_FIRST = True
+# YAML 预过滤：先运行 yaml_prefilter.py，之后只扫描判定为有效（含 apiVersion/kind 文档）的清单；
+# 预过滤结果文件不存在时扫描全部清单
+USE_PREFILTER = True
+PREFILTER_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/prefilter_results.jsonl"
+# 按文档扫描：多文档清单拆成单个文档分别扫描、分别缓存，再按文档行偏移拼回文件级记录
+# （跨仓库重复的 Namespace / ServiceAccount 等样板文档可命中缓存）；需要在主进程读取 content
+SPLIT_DOCUMENTS = False
+# 列式输出：写入 JSONL 的记录同时写成同名 .parquet（规则 ID / 文本字典编码，带整数 index 列，见 result_store.py）
+COLUMNAR_OUTPUT = True
+# 只运行能映射到 UMI ID 的规则（白名单取自 combine 所用的映射索引 umi_index，见 umi_rules.py），
+# 其余规则的结果在 combine_umi_full.py 中本来就会被丢弃；命令行加 --all-rules 时运行全部规则
+SCAN_ALL_RULES = "--all-rules" in sys.argv[1:]
+# Checkov 检查 ID (--check)，None 表示全部规则
+CHECKOV_CHECKS = None if SCAN_ALL_RULES else checkov_check_ids()
+
+def checkov_command(path, is_directory=False):
+    """
+    构造 Checkov 命令参数列表（直接执行，不经过 shell）
+    --quiet: 减少无关输出
+    --framework kubernetes: 加速扫描
+    --check: 只运行能映射到 UMI ID 的规则 (CHECKOV_CHECKS)，进一步加速
+    """
+    target_flag = "--directory" if is_directory else "--file"
+    cmd = ["checkov", "--output", "json", "--quiet", "--framework", "kubernetes", target_flag, path]
+    if CHECKOV_CHECKS is not None:
+        cmd += ["--check", ",".join(CHECKOV_CHECKS)]
+    return cmd
+
+def parse_checkov_output(stdout):
+    """
+    解析 Checkov 命令行的 JSON 输出
+    Checkov 崩溃（无输出或输出不是 JSON）时抛出 RuntimeError
+    """
+    if not stdout:
+        raise RuntimeError("checkov produced no output")
+
+    try:
+        return json.loads(stdout)
+    except json.JSONDecodeError:
+        # JSON 解析失败通常意味着 Checkov 崩溃或输出了非 JSON 文本
+        raise RuntimeError("checkov output is not valid JSON")
+
+def run_checkov(path, is_directory=False):
+    """
+    对单个文件或整个目录运行 Checkov，返回与 `checkov --output json` 相同结构的解析结果
+    没有解析出任何 K8s 资源时返回 None；Checkov 崩溃（无输出或输出不是 JSON）时抛出 RuntimeError，
+    以便调用方区分“扫描成功但无问题”和“扫描失败”；超过 SCAN_TIMEOUT 时抛出 ScanTimeout
+    """
+    if USE_INPROCESS_ENGINE:
+        if is_directory:
+            return call_with_timeout(checkov_engine.scan, SCAN_TIMEOUT, root_folder=path)
+        return call_with_timeout(checkov_engine.scan, SCAN_TIMEOUT, files=[path])
+
+    # 运行 Checkov（Checkov 发现漏洞会返回非0状态码，只看 stdout）
+    return parse_checkov_output(run_command(checkov_command(path, is_directory), timeout=SCAN_TIMEOUT))
+
+def extract_checkov_errors(failed_checks):
+    """
+    从 Checkov 的 failed_checks 中提取数据集需要的精简字段
+    """
+    errors = []
+    for check in failed_checks:
+        errors.append({
+            "check_id": check.get("check_id"),     # 如 CKV_K8S_20
+            "check_name": check.get("check_name"), # 如 Containers should not run...
+            "file_line_range": check.get("file_line_range"), # 如 [20, 44]
+            # "guideline": check.get("guideline")  # 可选：修复指南
+        })
+    return errors
 
 def scan_content_with_checkov(args):
     """
-    工作进程函数：接收文件内容，创建临时文件，运行 Checkov，提取关键数据
+    工作进程函数：接收文件内容，写入复用的 tmpfs 临时文件，运行 Checkov，提取关键数据
     args: (index, content, pseudo_filename)
     """
     idx, content, filename = args
     
-    # 构造 Checkov 命令
-    # --quiet: 减少无关输出
-    # --framework kubernetes: 加速扫描
-    # --check: 如果你有特定的规则列表(UMI)，可以在这里加 --check CKV_K8S_1,CKV_K8S_2... 进一步加速
-    base_cmd = "checkov --output json --quiet --framework kubernetes --file"
-    
     extracted_data = None
     
     try:
-        # 创建临时文件 (扫描完自动删除)
-        # suffix='.yaml' 非常重要，Checkov 依赖后缀识别文件类型
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=True) as tmp_file:
-            tmp_file.write(content)
-            tmp_file.flush() # 确保内容写入磁盘
-            
-            cmd = f"{base_cmd} {tmp_file.name}"
-            
-            # 运行 Checkov
-            # check=False: Checkov 发现漏洞会返回非0状态码，不应抛出异常
-            result = subprocess.run(
-                cmd, 
-                shell=True, 
-                capture_output=True, 
-                text=True, 
-                check=False
-            )
-            
-            # 解析 JSON 输出
-            if result.stdout:
-                try:
-                    data = json.loads(result.stdout)
-                    
-                    # Checkov 可能返回字典(单文件)或列表(多文件/目录)
-                    result_dict = None
-                    if isinstance(data, dict):
-                        result_dict = data
-                    elif isinstance(data, list) and len(data) > 0:
-                        result_dict = data[0]
-                    
-                    # 提取关键字段 (复用你原来的逻辑)
-                    if result_dict and "results" in result_dict:
-                        failed_checks = result_dict["results"].get("failed_checks", [])
-                        
-                        errors = []
-                        for check in failed_checks:
-                            errors.append({
-                                "check_id": check.get("check_id"),     # 如 CKV_K8S_20
-                                "check_name": check.get("check_name"), # 如 Containers should not run...
-                                "file_line_range": check.get("file_line_range"), # 如 [20, 44]
-                                # "guideline": check.get("guideline")  # 可选：修复指南
-                            })
-                        
-                        # 只有当发现错误时才返回数据，或者如果你需要统计“无错误文件”，也可以返回空列表
-                        extracted_data = {
-                            "filename": filename,
-                            "scan_tool": "checkov",
-                            "error_count": len(errors),
-                            "errors": errors
-                        }
-                        
-                except json.JSONDecodeError:
-                    # JSON 解析失败通常意味着 Checkov 崩溃或输出了非 JSON 文本
-                    pass
+        # 写入本进程复用的 tmpfs 临时文件（覆盖写，不再每个文件创建 + 删除）
+        # suffix='.yaml' 非常重要，Checkov 依赖后缀识别文件类型，因此不能走 stdin
+        data = run_checkov(write_scratch_file(content, suffix='.yaml'))
+
+        # Checkov 可能返回字典(单文件)或列表(多文件/目录)
+        result_dict = None
+        if isinstance(data, dict):
+            result_dict = data
+        elif isinstance(data, list) and len(data) > 0:
+            result_dict = data[0]
 
+        # 提取关键字段 (复用你原来的逻辑)
+        if result_dict and "results" in result_dict:
+            failed_checks = result_dict["results"].get("failed_checks", [])
+            errors = extract_checkov_errors(failed_checks)
+
+            # 只有当发现错误时才返回数据，或者如果你需要统计“无错误文件”，也可以返回空列表
+            extracted_data = {
+                "filename": filename,
+                "scan_tool": "checkov",
+                "error_count": len(errors),
+                "errors": errors
+            }
+
+    except ScanTimeout:
+        return timeout_records([args], "checkov", SCAN_TIMEOUT)[0][1]
     except Exception as e:
         # 捕捉如 IO 错误等异常
         return {"error": str(e), "filename": filename}
 
     return extracted_data
 
+def split_checkov_results(data, name_map):
+    """
+    把 Checkov 目录扫描的结果按 file_path 拆分回逐文件记录
+    data: run_checkov / parse_checkov_output 的返回值，None 表示没有解析出任何 K8s 资源
+    name_map: write_batch_to_dir 的返回值 {临时文件名: (index, pseudo_filename)}
+    返回: [(index, record), ...]，每个文件一项
+    """
+    if not data:
+        return [(idx, None) for idx, _ in name_map.values()]
+
+    records = []
+
+    # 目录模式下每条 check 都带有 file_path (如 /123.yaml)，据此拆分
+    # 出现在 passed_checks 或 failed_checks 中的文件才算被 Checkov 成功解析，
+    # 与逐文件模式下“有 results 才写记录”的行为保持一致
+    failed_by_file = defaultdict(list)
+    scanned = set()
+    result_dicts = data if isinstance(data, list) else [data]
+    for result_dict in result_dicts:
+        if not isinstance(result_dict, dict) or "results" not in result_dict:
+            continue
+        for status in ("passed_checks", "failed_checks"):
+            for check in result_dict["results"].get(status, []):
+                tmp_name = os.path.basename(check.get("file_path") or "")
+                if tmp_name not in name_map:
+                    continue
+                scanned.add(tmp_name)
+                if status == "failed_checks":
+                    failed_by_file[tmp_name].append(check)
+
+    for tmp_name, (idx, filename) in name_map.items():
+        record = None
+        if tmp_name in scanned:
+            errors = extract_checkov_errors(failed_by_file[tmp_name])
+            record = {
+                "filename": filename,
+                "scan_tool": "checkov",
+                "error_count": len(errors),
+                "errors": errors
+            }
+        records.append((idx, record))
+
+    return records
+
+def parse_checkov_dir_output(stdout, name_map):
+    """
+    解析 Checkov 命令行目录扫描的 JSON 输出并拆分回逐文件记录（供 asyncio 驱动使用）
+    """
+    try:
+        return split_checkov_results(parse_checkov_output(stdout), name_map)
+    except Exception as e:
+        return [(idx, {"error": str(e), "filename": filename}) for idx, filename in name_map.values()]
+
+def scan_dir_with_checkov(tmp_dir, name_map):
+    """
+    对已经写好一批清单的目录只运行一次 Checkov，再按 file_path 把结果拆分回逐文件记录
+    name_map: write_batch_to_dir 的返回值 {临时文件名: (index, pseudo_filename)}
+    返回: [(index, record), ...]，每个文件一项
+    """
+    try:
+        # 扫描整个目录，Checkov 的启动和策略加载只发生一次
+        return split_checkov_results(run_checkov(tmp_dir, is_directory=True), name_map)
+    except ScanTimeout:
+        return timeout_records(name_map.values(), "checkov", SCAN_TIMEOUT)
+    except Exception as e:
+        return [(idx, {"error": str(e), "filename": filename}) for idx, filename in name_map.values()]
+
+def scan_batch_with_checkov(batch):
+    """
+    工作进程函数（批处理模式）：把一批文件内容写入同一个临时目录，
+    对整个目录只运行一次 Checkov，再按 file_path 把结果拆分回逐文件记录
+    batch: [(index, content, pseudo_filename), ...]
+    返回: [(index, record), ...]，每个任务一项；record 与 scan_content_with_checkov 的返回值一致
+    """
+    # 零拷贝模式下任务只带行号，先从工作进程映射的数据集中读取内容
+    batch = resolve_batch_contents(batch)
+
+    if len(batch) == 1:
+        return [(batch[0][0], scan_content_with_checkov(batch[0]))]
+
+    try:
+        # 批目录在 tmpfs 上且每个工作进程复用同一个，不再每批新建再删除
+        tmp_dir = scratch_dir()
+        name_map = write_batch_to_dir(batch, tmp_dir)
+        return scan_dir_with_checkov(tmp_dir, name_map)
+    except Exception as e:
+        return [(idx, {"error": str(e), "filename": filename}) for idx, _, filename in batch]
+
+def iter_tasks(ds, with_content=True, order=None):
+    """
+    逐行惰性读取数据集，生成 (index, content, pseudo_filename)
+    order: 行号的调度顺序（如 largest_first_order 的结果），None 表示按数据集顺序
+    with_content=False 时 content 为 None，由工作进程自行读取（零拷贝模式且不需要按内容查缓存时）
+    我们只提取需要的字段传给子进程，减少内存开销
+    """
+    if not with_content:
+        # 只读取构造文件名需要的列，content 不进入主进程
+        ds = ds.remove_columns(["content"])
+
+    for i in (order if order is not None else range(len(ds))):
+        item = ds[i]
+        content = item['content'] if with_content else None
+        # 构造一个伪文件名，结合仓库名和路径，方便后续追踪
+        # 格式: repo_owner_repo_name_filepath.yaml
+        repo = item.get('repository_name', 'unknown_repo').replace('/', '_')
+        path = item.get('path', f'file_{i}.yaml').replace('/', '_')
+        pseudo_filename = f"{repo}_{path}"
+        
+        yield (i, content, pseudo_filename)
+
 def main():
     print(f"1. 正在设置缓存路径: {os.environ['HF_DATASETS_CACHE']}")
     print(f"2. 正在加载数据集: {DATASET_NAME} (首次运行需要下载，请耐心等待)...")
@@ -105,43 +294,112 @@ def main():
 
     total_files = len(ds)
     print(f"   数据集加载成功！共包含 {total_files} 个文件。")
-    print(f"3. 准备开始并行扫描 (进程数: {MAX_WORKERS})...")
+    print(f"3. 准备开始并行扫描 (进程数: {MAX_WORKERS}, 批大小: {BATCH_SIZE})...")
+    if CHECKOV_CHECKS is None:
+        print("   运行全部 Checkov 规则 (--all-rules)")
+    else:
+        print(f"   只运行映射到 UMI 的 {len(CHECKOV_CHECKS)} 条 Checkov 规则 (加 --all-rules 可运行全部规则)")
 
-    # 准备任务列表
-    # 我们只提取需要的字段传给子进程，减少内存开销
-    tasks = []
-    for i in range(total_files):
-        item = ds[i]
-        content = item['content']
-        # 构造一个伪文件名，结合仓库名和路径，方便后续追踪
-        # 格式: repo_owner_repo_name_filepath.yaml
-        repo = item.get('repository_name', 'unknown_repo').replace('/', '_')
-        path = item.get('path', f'file_{i}.yaml').replace('/', '_')
-        pseudo_filename = f"{repo}_{path}"
-        
-        tasks.append((i, content, pseudo_filename))
+    # 任务按需从数据集中逐行读取，不再一次性构造包含全部内容的任务列表
+    # 零拷贝模式下只有需要按内容查缓存时，主进程才读取 content（仅用于计算哈希，不发送给工作进程）
+    # asyncio 驱动在主进程内写临时文件、按文档扫描需要在主进程内拆分，两者都需要 content
+    order = largest_first_order(ds) if LARGEST_FIRST else None
+    # 多机分片：只扫描本分片的行号范围，输出写到分片文件
+    output_file, index_range = OUTPUT_FILE, None
+    if SHARD:
+        index_range = shard_range(total_files, SHARD)
+        order = shard_order(order, index_range)
+        output_file = shard_output_path(OUTPUT_FILE, SHARD)
+        print(f"   分片 {SHARD[0]}/{SHARD[1]}: 行号 [{index_range[0]}, {index_range[1]})，输出: {output_file}")
+    need_content = USE_SCAN_CACHE or not ZERO_COPY_WORKERS or USE_ASYNC_EXECUTOR or SPLIT_DOCUMENTS
+    tasks = iter_tasks(ds, with_content=need_content, order=order)
+    pending_files = total_files if index_range is None else index_range[1] - index_range[0]
+
+    # 预过滤：空文件、无法解析或不含 K8s 文档的清单不启动扫描器
+    if USE_PREFILTER:
+        tasks, skipped = filter_valid_tasks(tasks, PREFILTER_FILE, index_range)
+        pending_files -= skipped
 
     # 确保输出目录存在
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    # 断点续扫：过滤掉上次已经完成的文件，并以追加模式打开输出
+    if RESUME_SCAN:
+        tasks, done_count = filter_completed_tasks(tasks, output_file)
+        pending_files = max(0, pending_files - done_count)
+    write_mode = 'a' if RESUME_SCAN else 'w'
+
+    # 扫描结果缓存：版本号是缓存键的一部分，升级 Checkov 后旧结果自动失效
+    # 分片清单也记录工具版本（含规则白名单指纹），合并时要求各分片一致
+    tool_version = None
+    if USE_SCAN_CACHE or SHARD:
+        tool_version = rules_cache_version(get_tool_version("checkov"), CHECKOV_CHECKS)
+    cache = None
+    if USE_SCAN_CACHE:
+        cache = ScanCache(CACHE_DB, "checkov", tool_version)
+
+    # 工作进程初始化：零拷贝模式下自行打开数据集；进程内引擎模式下导入 Checkov 并加载策略
+    engine_init = partial(checkov_engine.init_engine, CHECKOV_CHECKS) if USE_INPROCESS_ENGINE else None
+    if ZERO_COPY_WORKERS:
+        initializer, initargs = init_dataset_worker, (DATASET_NAME, engine_init)
+    else:
+        initializer, initargs = engine_init, ()
+
+    # 列式输出：续扫时先把已有的 JSONL 结果写入，保证 Parquet 中是完整结果
+    columnar = None
+    if COLUMNAR_OUTPUT:
+        columnar = ColumnarResultWriter(columnar_path(output_file))
+        if RESUME_SCAN:
+            columnar.write_jsonl(output_file)
 
     # 并行执行
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f_out:
-        with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # 提交任务
-            futures = [executor.submit(scan_content_with_checkov, task) for task in tasks]
-            
-            # 使用 tqdm 显示进度条
-            for future in tqdm(as_completed(futures), total=total_files, desc="Scanning with Checkov"):
-                result = future.result()
-                
-                # 如果有有效结果（result 非 None 且不是报错信息）
-                if result and "errors" in result:
-                    # 写入 JSONL
-                    f_out.write(json.dumps(result, ensure_ascii=False) + "\n")
-                    # 立即刷新缓冲区，防止程序中断丢失数据
-                    f_out.flush() 
-
-    print(f"\n扫描完成！结果已保存至: {OUTPUT_FILE}")
+    with open(output_file, write_mode, encoding='utf-8') as f_out, \
+         open(clean_indices_path(output_file), write_mode, encoding='utf-8') as f_clean:
+        if USE_ASYNC_EXECUTOR:
+            # asyncio 驱动只能调用命令行（进程内引擎受 GIL 限制，无法在事件循环中并发）
+            asyncio.run(run_batched_scan_async(
+                tasks, partial(checkov_command, is_directory=True), parse_checkov_dir_output, "checkov", f_out,
+                desc="Scanning with Checkov",
+                concurrency=ASYNC_CONCURRENCY,
+                batch_size=BATCH_SIZE,
+                total=pending_files,
+                cache=cache,
+                f_clean=f_clean,
+                timeout=SCAN_TIMEOUT,
+                retry_timeouts=RETRY_TIMEOUTS,
+                split_documents=SPLIT_DOCUMENTS,
+                columnar=columnar
+            ))
+        else:
+            run_batched_scan(
+                tasks, scan_batch_with_checkov, f_out,
+                desc="Scanning with Checkov",
+                max_workers=MAX_WORKERS,
+                batch_size=BATCH_SIZE,
+                total=pending_files,
+                max_in_flight=MAX_IN_FLIGHT_BATCHES,
+                cache=cache,
+                initializer=initializer,
+                initargs=initargs,
+                send_content=not ZERO_COPY_WORKERS,
+                f_clean=f_clean,
+                retry_timeouts=RETRY_TIMEOUTS,
+                split_documents=SPLIT_DOCUMENTS,
+                columnar=columnar
+            )
+
+    if columnar is not None:
+        columnar.close()
+        print(f"   列式结果已保存至: {columnar.path} ({columnar.rows} 行)")
+
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
+
+    if SHARD:
+        write_shard_manifest(output_file, "checkov", SHARD, total_files, {"checkov": tool_version})
+
+    print(f"\n扫描完成！结果已保存至: {output_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
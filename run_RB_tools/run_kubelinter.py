@@ -19,14 +19,13 @@ def scan_file_with_kubelinter(filepath):
     运行 KubeLinter 并提取结构化数据
     """
     # 构造命令: 添加 --format json
-    cmd = f"{KUBELINTER_BIN} lint {filepath} --format json"
+    cmd = [KUBELINTER_BIN, "lint", filepath, "--format", "json"]
     
     try:
         # capture_output=True: 捕获输出
         # check=False: 即使 KubeLinter 发现错误（返回非0状态码）也不报错退出
         result = subprocess.run(
             cmd, 
-            shell=True, 
             capture_output=True, 
             text=True, 
             check=False
@@ -18,13 +18,12 @@ def scan_file_with_terrascan(filepath):
     -f: 指定单个文件
     -o json: 输出 JSON 格式
     """
-    cmd = f"terrascan scan -i k8s -f {filepath} -o json"
+    cmd = ["terrascan", "scan", "-i", "k8s", "-f", filepath, "-o", "json"]
     
     try:
         # check=False: Terrascan 发现违规时退出码通常为 3，不应报错中断
         result = subprocess.run(
             cmd, 
-            shell=True, 
             capture_output=True, 
             text=True, 
             check=False
@@ -1,24 +1,131 @@
 import os
+import sys
+import asyncio
 import json
-import tempfile
-import subprocess
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import defaultdict
+from functools import partial
 
 # --- 关键配置：设置 Hugging Face 缓存路径 ---
 # 必须在导入 datasets 之前设置
 os.environ["HF_DATASETS_CACHE"] = "/ssd_2t_1/wyq_workspace/hf_cache"
 from datasets import load_dataset
-from tqdm import tqdm
+
+import requests
+
+import terrascan_server
+from async_scan import run_batched_scan_async
+from scan_cache import ScanCache, get_tool_version
+from result_store import ColumnarResultWriter, columnar_path
+from scan_utils import (
+    ScanTimeout, clean_indices_path, filter_completed_tasks, filter_valid_tasks,
+    init_dataset_worker, largest_first_order, resolve_batch_contents, run_batched_scan, run_command,
+    scratch_dir, timeout_records, write_batch_to_dir, write_scratch_file
+)
+from shard_utils import (
+    parse_shard_arg, shard_order, shard_output_path, shard_range, write_shard_manifest
+)
+from umi_rules import rules_cache_version, terrascan_rule_ids
 
 # --- 配置区域 ---
 DATASET_NAME = "substratusai/the-stack-yaml-k8s"
 OUTPUT_FILE = "/home/wyq/kcfs_results/terrascan_full_results.jsonl"
 # 并行进程数 (建议设置为 CPU 核数 - 2)
 MAX_WORKERS = 16 
+# 批处理大小：每个工作进程把 N 个清单写入同一个临时目录，只启动一次 Terrascan
+# 设置为 1 则退回到逐文件扫描模式
+BATCH_SIZE = 64
+# 同时提交给进程池的批次数上限：任务按需提交，主进程内存不随数据集大小增长
+MAX_IN_FLIGHT_BATCHES = 4 * MAX_WORKERS
+# 零拷贝模式：工作进程自行内存映射 HF/Arrow 缓存，主进程只发送行号，不再 pickle 文件内容
+ZERO_COPY_WORKERS = True
+# 扫描结果缓存 (三个工具共用同一个 SQLite 文件)，设置 USE_SCAN_CACHE = False 可关闭
+USE_SCAN_CACHE = True
+CACHE_DB = "/home/wyq/kcfs_results/scan_cache.sqlite"
+# 断点续扫：命令行加 --resume 时跳过输出文件中已有的记录和 *_clean.txt 中已完成的无发现文件，
+# 新结果追加写入；不加则与原来一样覆盖输出重新扫描
+RESUME_SCAN = "--resume" in sys.argv[1:]
+# 多机分片：命令行加 --shard i/N 时只扫描第 i 段行号，输出写到分片文件并附带分片清单，
+# 各分片完成后由 merge_shards.py 校验并拼接成 OUTPUT_FILE（见 shard_utils.py）
+SHARD = parse_shard_arg(sys.argv[1:])
+# asyncio 驱动：用单个事件循环 + asyncio.create_subprocess_exec 直接驱动扫描子进程（不经过 shell），
+# 不再占用 Python 工作进程等待子进程；默认关闭，仍使用上面的进程池
+USE_ASYNC_EXECUTOR = False
+# asyncio 驱动下同时运行的扫描子进程数
+ASYNC_CONCURRENCY = MAX_WORKERS
+# 单次扫描（一个批次或一个文件）的超时时间（秒），超时后杀掉扫描器的整个进程组，
+# 避免个别异常清单让整个扫描卡在 99.9%；设置为 None 则不限制
+SCAN_TIMEOUT = 600
+# 超时的文件在所有新批次之后以单文件批次、较低优先级 (nice) 重试一次，仍超时则写出 status 为 timeout 的记录
+RETRY_TIMEOUTS = True
+# 按清单字节数从大到小调度，避免最后只剩一个大文件拖尾
+LARGEST_FIRST = True
+# YAML 预过滤：先运行 yaml_prefilter.py，之后只扫描判定为有效（含 apiVersion/kind 文档）的清单；
+# 预过滤结果文件不存在时扫描全部清单
+USE_PREFILTER = True
+PREFILTER_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/prefilter_results.jsonl"
+# 按文档扫描：多文档清单拆成单个文档分别扫描、分别缓存，再按文档行偏移拼回文件级记录
+# （跨仓库重复的 Namespace / ServiceAccount 等样板文档可命中缓存）；需要在主进程读取 content
+SPLIT_DOCUMENTS = False
+# 列式输出：写入 JSONL 的记录同时写成同名 .parquet（规则 ID / 文本字典编码，带整数 index 列，见 result_store.py）
+COLUMNAR_OUTPUT = True
+# 只运行能映射到 UMI ID 的规则（白名单取自 combine 所用的映射索引 umi_index，见 umi_rules.py），
+# 其余规则的结果在 combine_umi_full.py 中本来就会被丢弃；命令行加 --all-rules 时运行全部规则
+SCAN_ALL_RULES = "--all-rules" in sys.argv[1:]
+# Terrascan 规则 ID (--scan-rules)，None 表示全部规则
+TERRASCAN_RULES = None if SCAN_ALL_RULES else terrascan_rule_ids()
+# 服务器模式：清单通过带连接池的 keep-alive HTTP 会话发给常驻的 terrascan server，
+# 策略只加载一次，不再逐批启动 terrascan 进程；默认关闭
+USE_SERVER_MODE = False
+# 已在运行的服务器地址（如 "http://127.0.0.1:9010"）；None 时在 TERRASCAN_SERVER_PORT 上自动启动一个
+TERRASCAN_SERVER_URL = None
+TERRASCAN_SERVER_PORT = terrascan_server.DEFAULT_PORT
+# 服务器模式下同时在途的请求数（也是 HTTP 连接池大小）
+SERVER_CONCURRENCY = 32
+
+# 服务器模式下主进程线程池共用的 HTTP 客户端，由 main 创建
+_SERVER_CLIENT = None
+
+def extract_terrascan_errors(violations):
+    """
+    从 Terrascan 的 violations 中提取用于构建 UMI 的关键字段
+    """
+    extracted_errors = []
+    for v in violations:
+        extracted_errors.append({
+            "rule_id": v.get("rule_id"),       # 如 AC_K8S_0062
+            "description": v.get("description"), 
+            "severity": v.get("severity"),     
+            "category": v.get("category"),     
+            "line": v.get("line")              
+        })
+    return extracted_errors
+
+def terrascan_record(data, filename):
+    """
+    把单个文件的 Terrascan JSON 结果（命令行或服务器模式）转换成输出记录，没有违规时返回 None
+    """
+    # 提取 violations 列表
+    # 结构通常是: {"results": {"violations": [...]}}
+    # 防御性编程：确保 results 存在且 violations 不为 None
+    violations = data.get("results", {}).get("violations", [])
+    if violations is None:
+        violations = []
+
+    # 只有当确实有 violations 时我们才提取
+    if len(violations) == 0:
+        return None
+
+    extracted_errors = extract_terrascan_errors(violations)
+    return {
+        "filename": filename,
+        "scan_tool": "terrascan",
+        "error_count": len(extracted_errors),
+        "errors": extracted_errors
+    }
 
 def scan_content_with_terrascan(args):
     """
-    工作进程函数：接收文件内容，创建临时文件，运行 Terrascan，提取关键数据
+    工作进程函数：接收文件内容，写入复用的 tmpfs 临时文件，运行 Terrascan，提取关键数据
     args: (index, content, pseudo_filename)
     """
     idx, content, filename = args
@@ -26,69 +133,188 @@ def scan_content_with_terrascan(args):
     extracted_data = None
     
     try:
-        # 创建临时文件 (扫描完自动删除)
-        # suffix='.yaml' 
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=True) as tmp_file:
-            tmp_file.write(content)
-            tmp_file.flush() # 确保内容写入磁盘
-            
-            # 构造命令
-            # -i k8s: 指定输入类型为 Kubernetes
-            # -f: 指定文件路径
-            # -o json: 输出 JSON 格式
-            cmd = f"terrascan scan -i k8s -f {tmp_file.name} -o json"
-            
-            # 运行 Terrascan
-            # check=False: Terrascan 发现违规时退出码通常为 3，不应报错中断
-            result = subprocess.run(
-                cmd, 
-                shell=True, 
-                capture_output=True, 
-                text=True, 
-                check=False
-            )
-            
-            # Terrascan 的 JSON 结果在 stdout 中
-            if result.stdout:
-                try:
-                    data = json.loads(result.stdout)
-                    
-                    # 提取 violations 列表
-                    # 结构通常是: {"results": {"violations": [...]}}
-                    # 防御性编程：确保 results 存在且 violations 不为 None
-                    violations = data.get("results", {}).get("violations", [])
-                    if violations is None:
-                        violations = []
-                    
-                    # 只有当确实有 violations 时我们才提取
-                    if len(violations) > 0:
-                        extracted_errors = []
-                        for v in violations:
-                            # 提取用于构建 UMI 的关键字段 (复用你原来的逻辑)
-                            extracted_errors.append({
-                                "rule_id": v.get("rule_id"),       # 如 AC_K8S_0062
-                                "description": v.get("description"), 
-                                "severity": v.get("severity"),     
-                                "category": v.get("category"),     
-                                "line": v.get("line")              
-                            })
-                        
-                        extracted_data = {
-                            "filename": filename,
-                            "scan_tool": "terrascan",
-                            "error_count": len(extracted_errors),
-                            "errors": extracted_errors
-                        }
-                    
-                except json.JSONDecodeError:
-                    # Terrascan 偶尔可能输出非 JSON 的 panic 信息，直接忽略
-                    pass
+        # 运行 Terrascan（命令参数见 terrascan_command，不经过 shell）
+        # Terrascan 只接受文件路径（-f），清单写入本进程复用的 tmpfs 临时文件（覆盖写，不再每个文件创建 + 删除）
+        # Terrascan 发现违规时退出码通常为 3，只看 stdout；超过 SCAN_TIMEOUT 时杀掉进程组
+        stdout = run_command(terrascan_command(write_scratch_file(content, suffix='.yaml')), timeout=SCAN_TIMEOUT)
+
+        # Terrascan 的 JSON 结果在 stdout 中
+        # 没有输出或输出无法解析视为扫描失败（返回 error），与“扫描成功但无问题”(None) 区分开
+        if not stdout:
+            return {"error": "terrascan produced no output", "filename": filename}
+
+        try:
+            data = json.loads(stdout)
+        except json.JSONDecodeError:
+            # Terrascan 偶尔可能输出非 JSON 的 panic 信息
+            return {"error": "terrascan output is not valid JSON", "filename": filename}
+
+        extracted_data = terrascan_record(data, filename)
 
+    except ScanTimeout:
+        return timeout_records([args], "terrascan", SCAN_TIMEOUT)[0][1]
     except Exception as e:
         return {"error": str(e), "filename": filename}
 
     return extracted_data
 
+def scan_content_via_server(args):
+    """
+    服务器模式的扫描函数（在主进程的线程池中运行）：把清单 POST 给 terrascan server
+    args: (index, content, pseudo_filename)；返回值与 scan_content_with_terrascan 一致
+    """
+    idx, content, filename = args
+    try:
+        data = _SERVER_CLIENT.scan(content)
+    except requests.Timeout:
+        return timeout_records([args], "terrascan", SCAN_TIMEOUT)[0][1]
+    except Exception as e:
+        return {"error": str(e), "filename": filename}
+    return terrascan_record(data, filename)
+
+def terrascan_command(path, is_directory=False):
+    """
+    构造 Terrascan 命令参数列表（直接执行，不经过 shell）
+    -i k8s: 指定输入类型为 Kubernetes
+    -d / -f: 指定目录 / 单个文件，目录模式下 Terrascan 只加载一次策略
+    -o json: 输出 JSON 格式
+    --scan-rules: 只运行能映射到 UMI ID 的规则 (TERRASCAN_RULES)
+    """
+    cmd = ["terrascan", "scan", "-i", "k8s", "-d" if is_directory else "-f", path, "-o", "json"]
+    if TERRASCAN_RULES is not None:
+        cmd += ["--scan-rules", ",".join(TERRASCAN_RULES)]
+    return cmd
+
+def parse_terrascan_dir_output(stdout, name_map):
+    """
+    解析 Terrascan 目录扫描的 JSON 输出，按 violation 的 file 字段拆分回逐文件记录
+    name_map: write_batch_to_dir 的返回值 {临时文件名: (index, pseudo_filename)}
+    返回: [(index, record), ...]，每个文件一项
+    """
+    records = []
+
+    if not stdout:
+        return [(idx, {"error": "terrascan produced no output", "filename": filename})
+                for idx, filename in name_map.values()]
+
+    try:
+        data = json.loads(stdout)
+    except json.JSONDecodeError:
+        return [(idx, {"error": "terrascan output is not valid JSON", "filename": filename})
+                for idx, filename in name_map.values()]
+
+    violations = data.get("results", {}).get("violations", [])
+    if violations is None:
+        violations = []
+
+    # 目录模式下每条 violation 的 file 字段是相对于扫描目录的路径
+    violations_by_file = defaultdict(list)
+    for v in violations:
+        tmp_name = os.path.basename(v.get("file") or "")
+        if tmp_name in name_map:
+            violations_by_file[tmp_name].append(v)
+
+    # 与逐文件模式一致：只有确实有 violations 的文件才生成记录，其余文件为 None
+    for tmp_name, (idx, filename) in name_map.items():
+        record = None
+        if violations_by_file[tmp_name]:
+            extracted_errors = extract_terrascan_errors(violations_by_file[tmp_name])
+            record = {
+                "filename": filename,
+                "scan_tool": "terrascan",
+                "error_count": len(extracted_errors),
+                "errors": extracted_errors
+            }
+        records.append((idx, record))
+
+    return records
+
+def scan_dir_with_terrascan(tmp_dir, name_map):
+    """
+    对已经写好一批清单的目录只运行一次 Terrascan，再拆分回逐文件记录
+    name_map: write_batch_to_dir 的返回值 {临时文件名: (index, pseudo_filename)}
+    返回: [(index, record), ...]，每个文件一项
+    """
+    try:
+        # Terrascan 发现违规时退出码通常为 3，只看 stdout；超过 SCAN_TIMEOUT 时杀掉进程组
+        stdout = run_command(terrascan_command(tmp_dir, is_directory=True), timeout=SCAN_TIMEOUT)
+        return parse_terrascan_dir_output(stdout, name_map)
+    except ScanTimeout:
+        return timeout_records(name_map.values(), "terrascan", SCAN_TIMEOUT)
+    except Exception as e:
+        return [(idx, {"error": str(e), "filename": filename}) for idx, filename in name_map.values()]
+
+def scan_batch_with_terrascan(batch):
+    """
+    工作进程函数（批处理模式）：把一批文件内容写入同一个临时目录，
+    对整个目录只运行一次 Terrascan，再按 violation 的 file 字段拆分回逐文件记录
+    batch: [(index, content, pseudo_filename), ...]
+    返回: [(index, record), ...]，每个任务一项；record 与 scan_content_with_terrascan 的返回值一致
+    """
+    # 零拷贝模式下任务只带行号，先从工作进程映射的数据集中读取内容
+    batch = resolve_batch_contents(batch)
+
+    if len(batch) == 1:
+        return [(batch[0][0], scan_content_with_terrascan(batch[0]))]
+
+    try:
+        # 批目录在 tmpfs 上且每个工作进程复用同一个，不再每批新建再删除
+        tmp_dir = scratch_dir()
+        name_map = write_batch_to_dir(batch, tmp_dir)
+        return scan_dir_with_terrascan(tmp_dir, name_map)
+    except Exception as e:
+        return [(idx, {"error": str(e), "filename": filename}) for idx, _, filename in batch]
+
+def iter_tasks(ds, with_content=True, order=None):
+    """
+    逐行惰性读取数据集，生成 (index, content, pseudo_filename)
+    order: 行号的调度顺序（如 largest_first_order 的结果），None 表示按数据集顺序
+    with_content=False 时 content 为 None，由工作进程自行读取（零拷贝模式且不需要按内容查缓存时）
+    """
+    for i in (order if order is not None else range(len(ds))):
+        content = ds[i]['content'] if with_content else None
+        
+        # === 文件名逻辑修改：只保留 file_{i}.yaml ===
+        pseudo_filename = f"file_{i}.yaml"
+        
+        yield (i, content, pseudo_filename)
+
+def run_with_server(tasks, f_out, f_clean, cache, pending_files, columnar=None):
+    """
+    服务器模式：连接（或启动）terrascan server，由线程池经同一个连接池并发发送清单
+    """
+    global _SERVER_CLIENT
+
+    server_proc = None
+    base_url = TERRASCAN_SERVER_URL
+    if base_url is None:
+        print(f"   正在启动 terrascan server (端口: {TERRASCAN_SERVER_PORT}) ...")
+        server_proc = terrascan_server.start_server(TERRASCAN_SERVER_PORT)
+        base_url = f"http://127.0.0.1:{TERRASCAN_SERVER_PORT}"
+    else:
+        terrascan_server.wait_until_ready(base_url)
+    print(f"   服务器模式: {base_url} (并发请求数: {SERVER_CONCURRENCY})")
+
+    _SERVER_CLIENT = terrascan_server.TerrascanServerClient(
+        base_url, pool_size=SERVER_CONCURRENCY, scan_rules=TERRASCAN_RULES, timeout=SCAN_TIMEOUT
+    )
+    try:
+        terrascan_server.run_server_scan(
+            tasks, scan_content_via_server, f_out,
+            desc="Scanning with Terrascan server",
+            concurrency=SERVER_CONCURRENCY,
+            total=pending_files,
+            cache=cache,
+            f_clean=f_clean,
+            retry_timeouts=RETRY_TIMEOUTS,
+            split_documents=SPLIT_DOCUMENTS,
+            columnar=columnar
+        )
+    finally:
+        _SERVER_CLIENT.close()
+        if server_proc is not None:
+            terrascan_server.stop_server(server_proc)
+
 def main():
     print(f"1. 正在设置缓存路径: {os.environ['HF_DATASETS_CACHE']}")
     print(f"2. 正在加载数据集: {DATASET_NAME} ...")
@@ -103,38 +329,109 @@ def main():
 
     total_files = len(ds)
     print(f"   数据集加载成功！共包含 {total_files} 个文件。")
-    print(f"3. 准备开始并行扫描 (进程数: {MAX_WORKERS})...")
+    print(f"3. 准备开始并行扫描 (进程数: {MAX_WORKERS}, 批大小: {BATCH_SIZE})...")
+    if TERRASCAN_RULES is None:
+        print("   运行全部 Terrascan 规则 (--all-rules)")
+    else:
+        print(f"   只运行映射到 UMI 的 {len(TERRASCAN_RULES)} 条 Terrascan 规则 (加 --all-rules 可运行全部规则)")
 
-    # 准备任务列表
-    tasks = []
-    for i in range(total_files):
-        item = ds[i]
-        content = item['content']
-        
-        # === 文件名逻辑修改：只保留 file_{i}.yaml ===
-        pseudo_filename = f"file_{i}.yaml"
-        
-        tasks.append((i, content, pseudo_filename))
+    # 任务按需从数据集中逐行读取，不再一次性构造包含全部内容的任务列表
+    # 零拷贝模式下只有需要按内容查缓存时，主进程才读取 content（仅用于计算哈希，不发送给工作进程）
+    # asyncio 驱动在主进程内写临时文件、按文档扫描需要在主进程内拆分、服务器模式在主进程内发送请求，都需要 content
+    order = largest_first_order(ds) if LARGEST_FIRST else None
+    # 多机分片：只扫描本分片的行号范围，输出写到分片文件
+    output_file, index_range = OUTPUT_FILE, None
+    if SHARD:
+        index_range = shard_range(total_files, SHARD)
+        order = shard_order(order, index_range)
+        output_file = shard_output_path(OUTPUT_FILE, SHARD)
+        print(f"   分片 {SHARD[0]}/{SHARD[1]}: 行号 [{index_range[0]}, {index_range[1]})，输出: {output_file}")
+    need_content = USE_SCAN_CACHE or not ZERO_COPY_WORKERS or USE_ASYNC_EXECUTOR or SPLIT_DOCUMENTS or USE_SERVER_MODE
+    tasks = iter_tasks(ds, with_content=need_content, order=order)
+    pending_files = total_files if index_range is None else index_range[1] - index_range[0]
+
+    # 预过滤：空文件、无法解析或不含 K8s 文档的清单不启动扫描器
+    if USE_PREFILTER:
+        tasks, skipped = filter_valid_tasks(tasks, PREFILTER_FILE, index_range)
+        pending_files -= skipped
 
     # 确保输出目录存在
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    # 断点续扫：过滤掉上次已经完成的文件，并以追加模式打开输出
+    if RESUME_SCAN:
+        tasks, done_count = filter_completed_tasks(tasks, output_file)
+        pending_files = max(0, pending_files - done_count)
+    write_mode = 'a' if RESUME_SCAN else 'w'
+
+    # 扫描结果缓存：版本号是缓存键的一部分，升级 Terrascan 后旧结果自动失效
+    # 分片清单也记录工具版本（含规则白名单指纹），合并时要求各分片一致
+    tool_version = None
+    if USE_SCAN_CACHE or SHARD:
+        tool_version = rules_cache_version(get_tool_version("terrascan"), TERRASCAN_RULES)
+    cache = None
+    if USE_SCAN_CACHE:
+        cache = ScanCache(CACHE_DB, "terrascan", tool_version)
+
+    # 零拷贝模式下工作进程启动时自行内存映射数据集
+    initializer, initargs = (init_dataset_worker, (DATASET_NAME,)) if ZERO_COPY_WORKERS else (None, ())
+
+    # 列式输出：续扫时先把已有的 JSONL 结果写入，保证 Parquet 中是完整结果
+    columnar = None
+    if COLUMNAR_OUTPUT:
+        columnar = ColumnarResultWriter(columnar_path(output_file))
+        if RESUME_SCAN:
+            columnar.write_jsonl(output_file)
 
     # 并行执行
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f_out:
-        with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # 提交任务
-            futures = [executor.submit(scan_content_with_terrascan, task) for task in tasks]
-            
-            # 使用 tqdm 显示进度条
-            for future in tqdm(as_completed(futures), total=total_files, desc="Scanning with Terrascan"):
-                result = future.result()
-                
-                # 如果有有效结果 (非 None 且包含 errors)
-                if result and "errors" in result:
-                    f_out.write(json.dumps(result, ensure_ascii=False) + "\n")
-                    f_out.flush()
-
-    print(f"\n扫描完成！结果已保存至: {OUTPUT_FILE}")
+    with open(output_file, write_mode, encoding='utf-8') as f_out, \
+         open(clean_indices_path(output_file), write_mode, encoding='utf-8') as f_clean:
+        if USE_SERVER_MODE:
+            run_with_server(tasks, f_out, f_clean, cache, pending_files, columnar)
+        elif USE_ASYNC_EXECUTOR:
+            asyncio.run(run_batched_scan_async(
+                tasks, partial(terrascan_command, is_directory=True), parse_terrascan_dir_output, "terrascan", f_out,
+                desc="Scanning with Terrascan",
+                concurrency=ASYNC_CONCURRENCY,
+                batch_size=BATCH_SIZE,
+                total=pending_files,
+                cache=cache,
+                f_clean=f_clean,
+                timeout=SCAN_TIMEOUT,
+                retry_timeouts=RETRY_TIMEOUTS,
+                split_documents=SPLIT_DOCUMENTS,
+                columnar=columnar
+            ))
+        else:
+            run_batched_scan(
+                tasks, scan_batch_with_terrascan, f_out,
+                desc="Scanning with Terrascan",
+                max_workers=MAX_WORKERS,
+                batch_size=BATCH_SIZE,
+                total=pending_files,
+                max_in_flight=MAX_IN_FLIGHT_BATCHES,
+                cache=cache,
+                initializer=initializer,
+                initargs=initargs,
+                send_content=not ZERO_COPY_WORKERS,
+                f_clean=f_clean,
+                retry_timeouts=RETRY_TIMEOUTS,
+                split_documents=SPLIT_DOCUMENTS,
+                columnar=columnar
+            )
+
+    if columnar is not None:
+        columnar.close()
+        print(f"   列式结果已保存至: {columnar.path} ({columnar.rows} 行)")
+
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
+
+    if SHARD:
+        write_shard_manifest(output_file, "terrascan", SHARD, total_files, {"terrascan": tool_version})
+
+    print(f"\n扫描完成！结果已保存至: {output_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
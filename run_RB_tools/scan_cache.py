@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+
+# --- 扫描结果缓存 ---
+# 三个 RB 工具共用同一个 SQLite 文件，键为 (规范化内容哈希, 工具名, 工具版本)
+# 值为去掉 filename 的扫描记录 JSON；无发现的文件存为 null，同样计入命中，
+# 这样重跑时只有真正的新内容才会启动扫描器
+
+# 查询工具版本的命令，版本号是缓存键的一部分，升级工具后旧结果自动失效
+# argv 列表，直接执行，不经过 shell
+VERSION_COMMANDS = {
+    "checkov": ["checkov", "--version"],
+    "kubelinter": ["{bin}", "version"],
+    "terrascan": ["terrascan", "version"],
+}
+
+
+def normalize_content(content):
+    """
+    规范化 YAML 文本用于计算哈希：统一换行符、去掉行尾空白和文件末尾的空行
+    只做不改变行号的处理，保证缓存中的 file_line_range / line 对所有命中文件都成立
+    """
+    lines = content.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).rstrip('\n')
+
+
+def content_hash(content):
+    """
+    规范化内容的 SHA-256，作为缓存键
+    """
+    return hashlib.sha256(normalize_content(content).encode('utf-8')).hexdigest()
+
+
+def get_tool_version(tool_name, kubelinter_bin="kube-linter"):
+    """
+    运行工具自带的 version 命令获取版本号，失败时返回 "unknown"
+    """
+    cmd = [arg.format(bin=kubelinter_bin) for arg in VERSION_COMMANDS[tool_name]]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
+        version = result.stdout.strip()
+        return version if version else "unknown"
+    except Exception:
+        return "unknown"
+
+
+class ScanCache:
+    """
+    单个工具的扫描结果缓存，只在主进程中使用（SQLite 单写者）
+    """
+
+    def __init__(self, db_path, tool_name, tool_version):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_cache ("
+            " content_hash TEXT NOT NULL,"
+            " tool TEXT NOT NULL,"
+            " tool_version TEXT NOT NULL,"
+            " record TEXT,"
+            " PRIMARY KEY (content_hash, tool, tool_version))"
+        )
+        self.conn.commit()
+        self.tool_name = tool_name
+        self.tool_version = tool_version
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        查询缓存，key 为 content_hash(content)
+        返回: (是否命中, 记录)；记录为 None 表示该内容扫描过且没有发现问题
+        """
+        row = self.conn.execute(
+            "SELECT record FROM scan_cache WHERE content_hash = ? AND tool = ? AND tool_version = ?",
+            (key, self.tool_name, self.tool_version)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, json.loads(row[0])
+
+    def put(self, key, record):
+        """
+        写入一条扫描结果，filename 不入库（同一内容可能对应多个文件名）
+        调用方负责在合适的时机 commit()
+        """
+        if record is not None:
+            record = {k: v for k, v in record.items() if k != "filename"}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO scan_cache (content_hash, tool, tool_version, record) VALUES (?, ?, ?, ?)",
+            (key, self.tool_name, self.tool_version,
+             json.dumps(record, ensure_ascii=False))
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"缓存统计 [{self.tool_name} {self.tool_version}]: "
+                f"命中 {self.hits}, 未命中 {self.misses}, 命中率 {rate:.2%}")
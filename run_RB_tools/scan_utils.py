@@ -0,0 +1,593 @@
+import os
+import json
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from functools import partial
+from multiprocessing.util import Finalize
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from tqdm import tqdm
+
+from scan_cache import content_hash
+from yaml_documents import DocumentAssembler, is_document_id
+
+# 三个 run_*_full.py 扫描脚本共用的辅助函数
+
+# 工作进程内以内存映射方式打开的数据集（零拷贝模式），由 init_dataset_worker 设置
+_WORKER_DS = None
+# 当前进程启动扫描子进程时使用的 nice 值，超时重试的批次由 run_low_priority 临时调高
+_NICENESS = 0
+# 超时重试批次的 nice 值：重试排在所有新批次之后，并以较低的 CPU 优先级运行
+RETRY_NICENESS = 10
+# 临时文件优先放在内存文件系统 (tmpfs)，没有 /dev/shm 时退回系统临时目录
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class ScanTimeout(Exception):
+    """
+    单次扫描超过设定的超时时间
+    """
+
+
+def chunked(items, size):
+    """
+    把任务序列按 size 切分为若干批次
+    items 可以是惰性生成器，切分过程中同一时刻只持有一个批次
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def init_dataset_worker(dataset_name, extra_initializer=None):
+    """
+    工作进程初始化函数（零拷贝模式）：工作进程自己打开 HF 数据集
+    load_dataset 命中本地 Arrow 缓存时直接内存映射缓存文件，不会复制数据，
+    之后主进程只需把行号发给工作进程，content 在工作进程内从映射的 Arrow 缓冲区读取
+    extra_initializer: 额外的初始化函数（如预热进程内 Checkov 引擎）
+    """
+    global _WORKER_DS
+    from datasets import load_dataset
+    _WORKER_DS = load_dataset(dataset_name, split="train", streaming=False)
+    if extra_initializer is not None:
+        extra_initializer()
+
+
+def resolve_batch_contents(batch):
+    """
+    在工作进程中补全任务内容：content 为 None 的任务按行号从内存映射的数据集中读取
+    batch: [(index, content 或 None, pseudo_filename), ...]
+    """
+    missing = [idx for idx, content, _ in batch if content is None]
+    if not missing:
+        return batch
+    contents = dict(zip(missing, _WORKER_DS[missing]["content"]))
+    return [
+        (idx, content if content is not None else contents[idx], filename)
+        for idx, content, filename in batch
+    ]
+
+
+def scan_with_content_hash(scan_batch_fn, batch):
+    """
+    工作进程函数包装（零拷贝模式）：内容只在工作进程中读取，顺带算出各文件的内容哈希，
+    附在有结果的记录上带回主进程，作为输出记录的 content_hash
+    """
+    batch = resolve_batch_contents(batch)
+    hashes = {idx: content_hash(content) for idx, content, _ in batch}
+    results = scan_batch_fn(batch)
+    return [
+        (idx, {**record, "content_hash": hashes[idx]} if record is not None and idx in hashes else record)
+        for idx, record in results
+    ]
+
+
+def largest_first_order(ds):
+    """
+    按清单字节数从大到小排列数据集行号，用于调度：大文件先扫，避免最后只剩一个长文件拖尾
+    the-stack 系列数据集自带 size 列；没有时在 Arrow 列上直接求 content 的 UTF-8 字节数，
+    不把内容读成 Python 字符串（零拷贝模式下主进程不持有清单内容）
+    稳定排序，大小相同的行保持数据集顺序
+    """
+    import pyarrow.compute as pc
+
+    table = ds.with_format("arrow")
+    if "size" in ds.column_names:
+        sizes = table["size"]
+    else:
+        sizes = pc.binary_length(table["content"])
+    sizes = pc.fill_null(sizes, 0)
+    return pc.sort_indices(sizes, sort_keys=[("", "descending")]).to_pylist()
+
+
+def scratch_path(name):
+    """
+    本进程（线程）专用的临时路径，位于 tmpfs 上；同一进程内反复复用，不再每个文件新建再删除
+    """
+    return os.path.join(SHM_DIR or tempfile.gettempdir(),
+                        f"rb_scan_{os.getpid()}_{threading.get_ident()}_{name}")
+
+
+def _register_cleanup(path):
+    # multiprocessing 的工作进程退出时不会执行 atexit，用 Finalize 在主进程和工作进程退出时都能清理
+    Finalize(None, shutil.rmtree if os.path.isdir(path) else os.remove, args=(path,), exitpriority=0)
+
+
+def write_scratch_file(content, suffix=".yaml"):
+    """
+    把清单覆盖写入本进程复用的临时文件并返回路径（代替每次 NamedTemporaryFile 的创建 + 删除）
+    suffix: Checkov / Terrascan 按后缀识别文件类型
+    """
+    path = scratch_path("file" + suffix)
+    is_new = not os.path.exists(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    if is_new:
+        _register_cleanup(path)
+    return path
+
+
+def scratch_dir():
+    """
+    本进程复用的批目录：首次调用时创建，之后每次先清空上一批的文件再返回
+    """
+    path = scratch_path("dir")
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+    else:
+        os.makedirs(path)
+        _register_cleanup(path)
+    return path
+
+
+def run_command(argv, timeout=None, input_text=None):
+    """
+    直接执行扫描命令（argv 列表，不经过 shell），返回 stdout 文本
+    input_text: 通过 stdin 传给扫描器的内容（工具支持从 stdin 读清单时使用），None 时 stdin 为空
+    子进程在独立的会话（进程组）中启动，超时后杀掉整个进程组（包括扫描器自己派生的子进程），
+    再抛出 ScanTimeout；run_low_priority 中调用时命令以 nice 运行
+    """
+    if _NICENESS:
+        argv = ["nice", "-n", str(_NICENESS), *argv]
+    proc = subprocess.Popen(
+        argv,
+        stdin=subprocess.PIPE if input_text is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        start_new_session=True
+    )
+    try:
+        stdout, _ = proc.communicate(input=input_text, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.communicate()
+        raise ScanTimeout(f"scan timed out after {timeout}s")
+    return stdout
+
+
+def call_with_timeout(fn, timeout, *args, **kwargs):
+    """
+    在当前进程内调用 fn，超过 timeout 秒时抛出 ScanTimeout（用于进程内 Checkov 引擎）
+    基于 SIGALRM，只在主线程中生效；在其他线程中调用时不限时
+    """
+    if not timeout or threading.current_thread() is not threading.main_thread():
+        return fn(*args, **kwargs)
+
+    def on_alarm(signum, frame):
+        raise ScanTimeout(f"scan timed out after {timeout}s")
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def run_low_priority(scan_batch_fn, batch):
+    """
+    工作进程函数包装：以 RETRY_NICENESS 运行本批次的扫描子进程（超时重试使用）
+    """
+    global _NICENESS
+    _NICENESS = RETRY_NICENESS
+    try:
+        return scan_batch_fn(batch)
+    finally:
+        _NICENESS = 0
+
+
+def timeout_records(tasks, tool_name, timeout):
+    """
+    为一组文件生成超时状态记录：[(index, record), ...]
+    tasks 的每一项以 (index, ..., pseudo_filename) 开头，兼容批任务和 name_map.values()
+    """
+    return [
+        (task[0], {"filename": task[-1], "scan_tool": tool_name, "status": "timeout",
+                   "error": f"scan timed out after {timeout}s"})
+        for task in tasks
+    ]
+
+
+def write_batch_to_dir(batch, dir_path):
+    """
+    把一批清单写入同一个临时目录，供扫描工具以目录模式一次性扫描
+    batch: [(index, content, pseudo_filename), ...]
+    返回: {临时文件名: (index, pseudo_filename)}，用于把扫描结果拆分回逐文件记录
+
+    临时文件统一命名为 {index}.yaml：伪文件名可能重名或包含特殊字符，
+    而数据集行号在一次扫描中是唯一的
+    """
+    name_map = {}
+    for idx, content, filename in batch:
+        tmp_name = f"{idx}.yaml"
+        with open(os.path.join(dir_path, tmp_name), 'w', encoding='utf-8') as f:
+            f.write(content)
+        name_map[tmp_name] = (idx, filename)
+    return name_map
+
+
+def clean_indices_path(output_file):
+    """
+    记录“已扫描但无发现”的数据集行号的旁路文件路径
+    无发现的文件不会写入输出 JSONL，断点续扫时靠这个文件识别它们
+    """
+    return os.path.splitext(output_file)[0] + "_clean.txt"
+
+
+def load_resume_state(output_file):
+    """
+    读取已有的输出 JSONL 和无发现行号文件，用于断点续扫
+    返回: (已写出记录的 index 集合, 已写出但没有 index 字段的旧记录的 filename 集合, 已完成但无发现的 index 集合)
+    程序中断时输出文件末尾可能留下半行，这里会把它截掉，保证后续追加的内容是合法 JSONL
+    """
+    done_indices = set()
+    done_filenames = set()
+    if os.path.exists(output_file):
+        valid_size = 0
+        with open(output_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if isinstance(entry.get("index"), int):
+                    done_indices.add(entry["index"])
+                else:
+                    done_filenames.add(entry.get("filename"))
+                valid_size += len(line)
+        if valid_size < os.path.getsize(output_file):
+            print(f"   截断 {output_file} 末尾不完整的记录")
+            with open(output_file, 'r+b') as f:
+                f.truncate(valid_size)
+
+    clean_indices = set()
+    clean_file = clean_indices_path(output_file)
+    if os.path.exists(clean_file):
+        with open(clean_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.isdigit():
+                    clean_indices.add(int(line))
+
+    return done_indices, done_filenames, clean_indices
+
+
+def filter_completed_tasks(tasks, output_file):
+    """
+    断点续扫：跳过输出文件中已有记录的 index（旧记录按 filename）和无发现行号文件中的 index
+    tasks 可以是惰性生成器
+    返回: (剩余任务的生成器, 已完成的文件数)
+    """
+    done_indices, done_filenames, clean_indices = load_resume_state(output_file)
+    done_indices |= clean_indices
+    done_count = len(done_indices) + len(done_filenames)
+    print(f"   断点续扫: 已完成 {done_count} 个文件，本次跳过。")
+    remaining = (
+        task for task in tasks
+        if task[0] not in done_indices and task[2] not in done_filenames
+    )
+    return remaining, done_count
+
+
+def load_prefilter(prefilter_file, index_range=None):
+    """
+    读取预过滤结果
+    index_range: 只统计该行号范围 [start, end) 内的清单（分片扫描时），None 表示全部
+    返回: (有效清单（single / multi）的 index 集合, 跳过的文件数)；文件不存在时返回 (None, 0)，表示不过滤
+    """
+    if not os.path.exists(prefilter_file):
+        return None, 0
+    valid_indices = set()
+    skipped = 0
+    with open(prefilter_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if index_range is not None and not index_range[0] <= entry["index"] < index_range[1]:
+                continue
+            if entry["status"] == "skip":
+                skipped += 1
+            else:
+                valid_indices.add(entry["index"])
+    return valid_indices, skipped
+
+
+def filter_valid_tasks(tasks, prefilter_file, index_range=None):
+    """
+    只保留预过滤判定为有效的清单，tasks 可以是惰性生成器
+    index_range: 分片扫描时本分片的行号范围 [start, end)，跳过数只统计范围内的清单
+    返回: (剩余任务的生成器, 被跳过的文件数)；预过滤文件不存在时原样返回任务
+    """
+    valid_indices, skipped = load_prefilter(prefilter_file, index_range)
+    if valid_indices is None:
+        print(f"   未找到预过滤结果 {prefilter_file}，扫描全部清单（可先运行 yaml_prefilter.py）")
+        return tasks, 0
+    print(f"   预过滤: 跳过 {skipped} 个无效清单，剩余 {len(valid_indices)} 个。")
+    return (task for task in tasks if task[0] in valid_indices), skipped
+
+
+def write_record(f_out, record, filename, idx=None, digest=None):
+    """
+    把一条有发现的扫描记录或超时状态记录写入 JSONL；无发现 (None) 或扫描失败的记录不写
+    记录以数据集行号 index 为主键，附带清单内容的 content_hash（下游按 index 关联各工具的结果，
+    content_hash 用于核对行号对应的内容没有变）；filename 只用于追溯，以当前任务为准（缓存命中的记录不带 filename）
+    digest: 文件内容哈希，为 None 时沿用记录中已有的 content_hash（零拷贝模式由工作进程附上）
+    返回: 写出的记录，没有写出时返回 None
+    """
+    if record and ("errors" in record or record.get("status") == "timeout"):
+        record = {
+            "index": idx,
+            "content_hash": digest if digest is not None else record.get("content_hash"),
+            "filename": filename,
+            **{k: v for k, v in record.items() if k not in RECORD_KEY_FIELDS}
+        }
+        f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+    return None
+
+
+# write_record 按任务重新填写的键字段
+RECORD_KEY_FIELDS = ("index", "content_hash", "filename")
+
+
+class ResultWriter:
+    """
+    批扫描结果的写出与记账：缓存查询/写入、同内容去重、无发现行号文件、超时重试、按文档拆分、进度条
+    进程池驱动 (run_batched_scan) 和 asyncio 驱动 (async_scan.run_batched_scan_async) 共用
+    """
+
+    def __init__(self, f_out, pbar, cache=None, f_clean=None, retry_timeouts=False, split_documents=False,
+                 columnar=None):
+        self.f_out = f_out
+        self.pbar = pbar
+        self.cache = cache
+        self.f_clean = f_clean
+        # 列式输出 (result_store.ColumnarResultWriter)：写入 JSONL 的记录同时按列写入 Parquet
+        self.columnar = columnar
+        # 按文档拆分：多文档清单的每个文档作为独立任务扫描和缓存，全部完成后拼回文件级记录
+        self.documents = None
+        if split_documents:
+            self.documents = DocumentAssembler(self.emit_file, lambda: self.pbar.update(1))
+        # 超时的文件拆成单文件批次放进重试队列，排在所有新批次之后再扫一次；
+        # 仍然超时（或不重试）时写出 status 为 timeout 的记录，续扫时不再重复扫描
+        self.retry_timeouts = retry_timeouts
+        self.retry_queue = []
+        self.retried = set()
+        # 内容哈希 -> 等待同内容扫描结果的 (index, filename) 列表
+        # 同一次运行中内容相同的文件只扫描第一个，其余文件等它的结果（同样计为命中）；
+        # 条目在对应批次完成时移除，大小受在途批次数限制
+        self.duplicates = {}
+        # 文件行号 -> 整个文件的内容哈希（主进程持有内容时在拆分文档前计算），写出文件级记录时取出
+        self.file_hashes = {}
+
+    def emit(self, idx, filename, record):
+        """
+        写出一个任务的结果；文档子任务的结果交给 DocumentAssembler，等整个文件完成后再写出
+        """
+        if is_document_id(idx):
+            self.documents.add(idx, record)
+        else:
+            self.emit_file(idx, filename, record)
+
+    def emit_file(self, idx, filename, record):
+        digest = self.file_hashes.pop(idx, None)
+        if record is None:
+            if self.f_clean is not None:
+                self.f_clean.write(f"{idx}\n")
+        else:
+            written = write_record(self.f_out, record, filename, idx, digest)
+            if written is not None and self.columnar is not None:
+                self.columnar.write(idx, written)
+
+    def flush(self):
+        self.f_out.flush()
+        if self.f_clean is not None:
+            self.f_clean.flush()
+        if self.cache is not None:
+            self.cache.commit()
+
+    def fail(self, idx):
+        """
+        一个任务扫描失败：结果既不写出也不缓存，下次续扫或重跑时会重新扫描
+        """
+        if is_document_id(idx):
+            self.documents.fail(idx)
+        else:
+            self.file_hashes.pop(idx, None)
+            self.advance(idx)
+
+    def advance(self, idx):
+        # 进度条按文件计数，文档子任务由 DocumentAssembler 在整个文件完成时推进
+        if not is_document_id(idx):
+            self.pbar.update(1)
+
+    def uncached_tasks(self, tasks):
+        """
+        惰性过滤：命中缓存的任务直接写出，只把未命中的任务交给扫描器
+        按文档拆分时先把多文档清单拆成文档子任务，缓存与去重都以单个文档为单位
+        """
+        cache = self.cache
+        tasks = self.hash_files(tasks)
+        if self.documents is not None:
+            tasks = self.documents.split(tasks)
+        for idx, content, filename in tasks:
+            if cache is not None:
+                key = content_hash(content)
+                if key in self.duplicates:
+                    self.duplicates[key].append((idx, filename))
+                    cache.hits += 1
+                    self.advance(idx)
+                    continue
+                hit, record = cache.get(key)
+                if hit:
+                    self.emit(idx, filename, record)
+                    self.advance(idx)
+                    continue
+                self.duplicates[key] = []
+            yield idx, content, filename
+
+    def hash_files(self, tasks):
+        """
+        记下带内容的任务的文件级内容哈希（零拷贝模式下任务不带内容，哈希由 scan_with_content_hash 在工作进程中计算）
+        """
+        for idx, content, filename in tasks:
+            if content is not None:
+                self.file_hashes[idx] = content_hash(content)
+            yield idx, content, filename
+
+    def next_retry(self):
+        """
+        取出一个待重试的单文件批次，没有时返回 None
+        """
+        if not self.retry_queue:
+            return None
+        return [self.retry_queue.pop(0)]
+
+    def handle_result(self, batch, results):
+        """
+        处理一个批次的扫描结果
+        batch: 提交前的任务列表（带 content，用于计算缓存键）
+        results: [(index, record), ...]
+        """
+        results = dict(results)
+        for task in batch:
+            idx, content, filename = task
+            record = results.get(idx)
+            key = content_hash(content) if self.cache is not None else None
+            if record is not None and record.get("status") == "timeout":
+                if self.retry_timeouts and idx not in self.retried:
+                    # 整批超时通常只是其中一个文件卡住，拆成单文件批次重试
+                    self.retried.add(idx)
+                    self.retry_queue.append(task)
+                    continue
+                # 超时记录不缓存，同内容的文件同样记为超时
+                self.emit(idx, filename, record)
+                if key is not None:
+                    for dup_idx, dup_filename in self.duplicates.pop(key, []):
+                        self.emit(dup_idx, dup_filename, record)
+                self.advance(idx)
+                continue
+            # 扫描失败的结果既不写出也不缓存，下次续扫或重跑时会重新扫描
+            if record is not None and "error" in record:
+                if key is not None:
+                    # 同内容的文件登记时已推进过进度条，这里不调用 self.fail，只释放它们的记账
+                    for dup_idx, _ in self.duplicates.pop(key, []):
+                        if is_document_id(dup_idx):
+                            self.documents.fail(dup_idx)
+                        else:
+                            self.file_hashes.pop(dup_idx, None)
+                self.fail(idx)
+                continue
+            self.emit(idx, filename, record)
+            if key is not None:
+                self.cache.put(key, record)
+                for dup_idx, dup_filename in self.duplicates.pop(key, []):
+                    self.emit(dup_idx, dup_filename, record)
+            self.advance(idx)
+
+
+def run_batched_scan(tasks, scan_batch_fn, f_out, desc, max_workers, batch_size,
+                     total=None, max_in_flight=None, cache=None, initializer=None, initargs=(),
+                     send_content=True, f_clean=None, retry_timeouts=False, split_documents=False,
+                     columnar=None):
+    """
+    并行执行批扫描，并把有发现的记录写入 f_out
+    tasks: (index, content, pseudo_filename) 的可迭代对象，通常是逐行读取数据集的生成器
+    scan_batch_fn: 工作进程函数，接收一批任务，返回 [(index, record), ...]；
+                   record 为 None 表示扫描成功但没有发现问题，含 "error" 字段表示扫描失败
+    total: 任务总数，仅用于进度条
+    max_in_flight: 同时提交给进程池的批次数上限，默认 4 × max_workers；
+                   任务按需从 tasks 中拉取，主进程内存不随数据集大小增长
+    cache: ScanCache 或 None；命中的任务直接写出缓存结果，不再启动扫描器
+    initializer / initargs: 工作进程初始化函数及其参数（如预热进程内引擎、打开数据集）
+    send_content: False 时只向工作进程发送 (index, None, filename)，
+                  工作进程用 resolve_batch_contents 从自己映射的数据集中读取内容（零拷贝模式）
+    f_clean: 无发现行号文件，扫描成功但无发现的 index 逐行写入，供断点续扫使用
+    retry_timeouts: 超时的文件在所有新批次之后以单文件批次、较低优先级重试一次
+    split_documents: 多文档清单按文档拆分扫描和缓存，结果拼回文件级记录（见 yaml_documents.py）
+    columnar: result_store.ColumnarResultWriter 或 None；写出的记录同时按列写入 Parquet
+    """
+    if max_in_flight is None:
+        max_in_flight = 4 * max_workers
+
+    with tqdm(total=total, desc=desc) as pbar, \
+         ProcessPoolExecutor(max_workers=max_workers, initializer=initializer,
+                             initargs=initargs) as executor:
+        writer = ResultWriter(f_out, pbar, cache=cache, f_clean=f_clean, retry_timeouts=retry_timeouts,
+                              split_documents=split_documents, columnar=columnar)
+        batches = chunked(writer.uncached_tasks(tasks), max(1, batch_size))
+        in_flight = {}  # future -> batch
+        # 零拷贝模式下主进程没有内容，由工作进程顺带计算输出记录的 content_hash
+        batch_fn = scan_batch_fn if send_content else partial(scan_with_content_hash, scan_batch_fn)
+
+        def fill_window():
+            while len(in_flight) < max_in_flight:
+                batch = next(batches, None)
+                is_retry = batch is None
+                if is_retry:
+                    # 新批次全部提交后才处理超时重试
+                    batch = writer.next_retry()
+                    if batch is None:
+                        return
+                payload = batch
+                if not send_content:
+                    # 零拷贝模式：每个任务只传行号和文件名，IPC 只有几十字节；
+                    # 文档子任务的内容是拆分后的片段，工作进程无法按行号读取，仍随任务发送
+                    payload = [
+                        (idx, content if is_document_id(idx) else None, filename)
+                        for idx, content, filename in batch
+                    ]
+                if is_retry:
+                    future = executor.submit(run_low_priority, batch_fn, payload)
+                else:
+                    future = executor.submit(batch_fn, payload)
+                in_flight[future] = batch
+
+        fill_window()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                writer.handle_result(in_flight.pop(future), future.result())
+
+            # 每批完成后立即刷新缓冲区，防止程序中断丢失数据
+            writer.flush()
+
+            # 有批次完成后再从数据集中拉取新任务补满窗口
+            fill_window()
+
+        writer.flush()
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import time
+import hashlib
+
+from scan_utils import clean_indices_path
+
+# --- 多机分片扫描 ---
+# 命令行加 --shard i/N（0 <= i < N）时，扫描脚本只处理数据集行号的第 i 段：按行号连续均分，
+# 每台机器独立算出相同的划分，不需要协调服务。分片输出写到 {输出文件}.shard-i-of-N.jsonl，
+# 扫描完成后在旁边写一份分片清单（行号范围、工具版本、记录数、校验和）；
+# 各机器的分片文件拷到同一目录后，由 merge_shards.py 校验并拼接成 combine_umi_full.py 读取的完整输出
+
+SHARD_ARG = re.compile(r'^(\d+)/(\d+)$')
+
+
+def parse_shard_arg(argv):
+    """
+    读取命令行的 --shard i/N（或 --shard=i/N）
+    返回: (i, N)；没有该参数时返回 None，格式错误时直接退出
+    """
+    for k, arg in enumerate(argv):
+        if arg == "--shard" and k + 1 < len(argv):
+            value = argv[k + 1]
+        elif arg.startswith("--shard="):
+            value = arg.split("=", 1)[1]
+        else:
+            continue
+        match = SHARD_ARG.match(value)
+        if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+            raise SystemExit(f"--shard 的格式应为 i/N 且 0 <= i < N，实际为: {value}")
+        return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def shard_range(total, shard):
+    """
+    第 i 个分片负责的行号范围 [start, end)：按行号连续均分，前 total % N 个分片各多一行
+    """
+    i, n = shard
+    base, extra = divmod(total, n)
+    start = i * base + min(i, extra)
+    return start, start + base + (1 if i < extra else 0)
+
+
+def shard_order(order, index_range):
+    """
+    把调度顺序限制在分片的行号范围内；order 为 None（按数据集顺序）时直接返回该范围
+    """
+    start, end = index_range
+    if order is None:
+        return range(start, end)
+    return [i for i in order if start <= i < end]
+
+
+def shard_output_path(output_file, shard):
+    """分片输出路径：{输出文件}.shard-i-of-N.jsonl"""
+    base, ext = os.path.splitext(output_file)
+    return f"{base}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def shard_manifest_path(shard_output):
+    """分片清单路径：与分片输出同名的 .manifest.json"""
+    return os.path.splitext(shard_output)[0] + ".manifest.json"
+
+
+def file_sha256(filepath):
+    """文件的 SHA-256；文件不存在时返回 None"""
+    if not os.path.exists(filepath):
+        return None
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_timeout_record(entry):
+    """
+    记录是否含超时结果：单工具输出的 status 字段，或 run_all_full.py 合并记录中任一工具的结果
+    """
+    if entry.get("status") == "timeout":
+        return True
+    return any(isinstance(v, dict) and v.get("status") == "timeout" for v in entry.values())
+
+
+def count_output(output_file):
+    """
+    统计输出 JSONL 的记录数和超时记录数，以及无发现行号旁路文件的行数
+    返回: {"records", "timeouts", "clean"}
+    """
+    records = 0
+    timeouts = 0
+    with open(output_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            records += 1
+            if is_timeout_record(json.loads(line)):
+                timeouts += 1
+
+    clean = 0
+    clean_file = clean_indices_path(output_file)
+    if os.path.exists(clean_file):
+        with open(clean_file, 'r', encoding='utf-8') as f:
+            clean = sum(1 for line in f if line.strip())
+
+    return {"records": records, "timeouts": timeouts, "clean": clean}
+
+
+def write_shard_manifest(shard_output, tool, shard, total_files, tool_versions):
+    """
+    扫描完成后写分片清单；记录数和校验和都从分片输出文件本身统计，续扫追加后重新生成即可
+    tool: 输出文件对应的工具名（checkov / kubelinter / terrascan / all）
+    tool_versions: {工具名: 版本号}（含规则白名单指纹），合并时要求所有分片一致
+    """
+    start, end = shard_range(total_files, shard)
+    clean_file = clean_indices_path(shard_output)
+    manifest = {
+        "tool": tool,
+        "shard": shard[0],
+        "num_shards": shard[1],
+        "index_range": [start, end],
+        "total_files": total_files,
+        "tool_versions": tool_versions,
+        "counts": count_output(shard_output),
+        "output_file": os.path.basename(shard_output),
+        "sha256": file_sha256(shard_output),
+        "clean_file": os.path.basename(clean_file) if os.path.exists(clean_file) else None,
+        "clean_sha256": file_sha256(clean_file),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    manifest_file = shard_manifest_path(shard_output)
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"   分片清单已保存至: {manifest_file}")
+    return manifest
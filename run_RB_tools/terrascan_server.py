@@ -0,0 +1,167 @@
+import os
+import signal
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+from scan_utils import ResultWriter
+
+# --- Terrascan 服务器模式 ---
+# `terrascan server` 常驻内存，策略只加载一次；扫描时把清单以 multipart 表单 POST 到文件扫描接口，
+# 响应与 `terrascan scan -o json` 的 JSON 结构相同，可直接交给 extract_terrascan_errors。
+# 多个线程共用一个带连接池的 requests.Session（HTTP keep-alive），不再为每个文件启动一次 terrascan 进程
+
+# terrascan server 的默认端口
+DEFAULT_PORT = 9010
+# 文件扫描接口：/v1/{iac 类型}/{iac 版本}/{云类型}/local/file/scan
+SCAN_PATH = "/v1/k8s/v1/k8s/local/file/scan"
+HEALTH_PATH = "/health"
+# 服务器启动后等待健康检查通过的最长时间（秒）
+STARTUP_TIMEOUT = 60
+
+
+def start_server(port=DEFAULT_PORT, terrascan_bin="terrascan"):
+    """
+    在本机启动 `terrascan server`，等待健康检查通过后返回进程对象
+    服务器在独立的进程组中运行，由 stop_server 连同其子进程一起结束
+    """
+    proc = subprocess.Popen(
+        [terrascan_bin, "server", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    try:
+        wait_until_ready(f"http://127.0.0.1:{port}", proc=proc)
+    except Exception:
+        stop_server(proc)
+        raise
+    return proc
+
+
+def stop_server(proc):
+    """
+    结束 start_server 启动的服务器进程组
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def wait_until_ready(base_url, timeout=STARTUP_TIMEOUT, proc=None):
+    """
+    轮询健康检查接口直到服务器可用；超时或服务器进程提前退出时抛出 RuntimeError
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"terrascan server exited with code {proc.returncode}")
+        try:
+            if requests.get(base_url + HEALTH_PATH, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"terrascan server at {base_url} not ready after {timeout}s")
+
+
+class TerrascanServerClient:
+    """
+    terrascan server 的 HTTP 客户端，可被多个线程同时使用
+    requests.Session 是线程安全的连接池：pool_size 个 keep-alive 连接在线程之间复用
+    """
+
+    def __init__(self, base_url, pool_size=32, scan_rules=None, timeout=None):
+        # scan_rules: 只运行这些规则（对应命令行的 --scan-rules），None 表示全部规则
+        # timeout: 单次请求的超时时间（秒），None 表示不限制
+        self.scan_url = base_url.rstrip("/") + SCAN_PATH
+        self.scan_rules = scan_rules
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def scan(self, content, filename="manifest.yaml"):
+        """
+        扫描一个清单，返回与 `terrascan scan -o json` 相同结构的字典 {"results": {"violations": [...]}}
+        超时抛出 requests.Timeout；其他 HTTP 错误或响应不是 JSON 时抛出异常
+        """
+        data = {}
+        if self.scan_rules is not None:
+            data["scan_rules"] = ",".join(self.scan_rules)
+        response = self.session.post(
+            self.scan_url,
+            files={"file": (filename, content.encode('utf-8'), "application/x-yaml")},
+            data=data,
+            timeout=self.timeout
+        )
+        # 发现违规时服务器返回 403（供准入控制使用），响应体同样是扫描结果
+        if response.status_code not in (200, 403):
+            raise RuntimeError(f"terrascan server returned HTTP {response.status_code}: {response.text[:200]}")
+        result = response.json()
+        # 部分版本直接返回 violations 结构，统一包成与命令行输出相同的 {"results": ...}
+        if "results" not in result:
+            result = {"results": result}
+        return result
+
+    def close(self):
+        self.session.close()
+
+
+def _scan_tasks(scan_fn, batch):
+    return [(task[0], scan_fn(task)) for task in batch]
+
+
+def run_server_scan(tasks, scan_fn, f_out, desc, concurrency, total=None, max_in_flight=None,
+                    cache=None, f_clean=None, retry_timeouts=False, split_documents=False, columnar=None):
+    """
+    服务器模式的驱动：线程池逐文件调用 scan_fn，输出格式、缓存、去重和续扫行为与 run_batched_scan 一致
+    tasks: (index, content, pseudo_filename) 的可迭代对象（需带 content）
+    scan_fn: 接收一个任务，返回该文件的记录（None / 有发现 / error / timeout 状态记录）
+    concurrency: 同时在途的请求数，应不大于客户端的连接池大小
+    max_in_flight: 已提交未完成的任务数上限，默认 2 × concurrency
+    columnar: 可选的 ColumnarResultWriter，写入 JSONL 的记录同时写一份列式结果
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * concurrency
+
+    with tqdm(total=total, desc=desc) as pbar, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        writer = ResultWriter(f_out, pbar, cache=cache, f_clean=f_clean, retry_timeouts=retry_timeouts,
+                              split_documents=split_documents, columnar=columnar)
+        pending_tasks = iter(writer.uncached_tasks(tasks))
+        in_flight = {}  # Future -> [task]
+
+        def fill_window():
+            while len(in_flight) < max_in_flight:
+                task = next(pending_tasks, None)
+                if task is not None:
+                    batch = [task]
+                else:
+                    # 新任务全部提交后才处理超时重试
+                    batch = writer.next_retry()
+                    if batch is None:
+                        return
+                in_flight[executor.submit(_scan_tasks, scan_fn, batch)] = batch
+
+        fill_window()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                writer.handle_result(in_flight.pop(fut), fut.result())
+
+            # 每批完成后立即刷新缓冲区，防止程序中断丢失数据
+            writer.flush()
+            fill_window()
+
+        writer.flush()
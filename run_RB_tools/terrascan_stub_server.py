@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import glob
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scan_cache import content_hash
+from terrascan_server import DEFAULT_PORT, HEALTH_PATH, SCAN_PATH
+
+# --- terrascan server 桩服务 ---
+# 不安装 terrascan 也能测试服务器模式（run_terrascan_full.py 的 USE_SERVER_MODE）：
+# 按上传清单的内容哈希回放预先录好的响应，未录制的清单返回“无违规”。
+# 使用 HTTP/1.1 keep-alive，退出时打印请求数和 TCP 连接数，用于确认客户端复用了连接池
+#
+# 用法:
+#   python terrascan_stub_server.py --build   由样本清单和 terrascan_100_results.jsonl 生成回放文件
+#   python terrascan_stub_server.py           启动桩服务（Ctrl-C 退出）
+
+# --- 配置区域 ---
+STUB_PORT = DEFAULT_PORT
+# 回放文件：每行 {"content_hash", "status", "response"}
+CANNED_RESPONSES_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/terrascan_stub_responses.jsonl"
+# --build 的输入：样本清单目录和对应的 Terrascan 扫描结果
+SAMPLE_YAML_DIR = "/home/wyq/GenKubeSec_Reproduce/raw_100_yaml_files"
+SAMPLE_RESULTS_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/terrascan_100_results.jsonl"
+# 每个请求额外等待的秒数，模拟真实扫描耗时
+RESPONSE_DELAY = 0.0
+
+BUILD_MODE = "--build" in sys.argv[1:]
+
+
+def empty_response():
+    """没有违规时 terrascan server 的响应"""
+    return {"results": {"violations": None, "count": {"low": 0, "medium": 0, "high": 0, "total": 0}}}
+
+
+def build_canned_responses():
+    """
+    把样本清单的 Terrascan 结果还原成服务器响应，按内容哈希写入回放文件
+    """
+    print(f"1. 正在读取样本结果: {SAMPLE_RESULTS_FILE}")
+    results = {}
+    with open(SAMPLE_RESULTS_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            results[entry["filename"]] = entry.get("errors", [])
+
+    print(f"2. 正在生成回放文件: {CANNED_RESPONSES_FILE}")
+    os.makedirs(os.path.dirname(CANNED_RESPONSES_FILE), exist_ok=True)
+    count = 0
+    with open(CANNED_RESPONSES_FILE, 'w', encoding='utf-8') as f_out:
+        for path in sorted(glob.glob(os.path.join(SAMPLE_YAML_DIR, "*.yaml"))):
+            errors = results.get(os.path.basename(path))
+            if not errors:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            response = {"results": {"violations": errors, "count": {"total": len(errors)}}}
+            f_out.write(json.dumps(
+                {"content_hash": content_hash(content), "status": 403, "response": response},
+                ensure_ascii=False
+            ) + "\n")
+            count += 1
+    print(f"   已写入 {count} 条响应。")
+
+
+def load_canned_responses(filepath):
+    """
+    返回: {内容哈希: (HTTP 状态码, 响应字典)}
+    """
+    canned = {}
+    if not os.path.exists(filepath):
+        return canned
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            canned[entry["content_hash"]] = (entry.get("status", 200), entry["response"])
+    return canned
+
+
+def uploaded_file(headers, body):
+    """从 multipart/form-data 请求体中取出 file 字段的内容"""
+    message = BytesParser(policy=policy.default).parsebytes(
+        b"Content-Type: " + headers["Content-Type"].encode('latin-1') + b"\r\n\r\n" + body
+    )
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True).decode('utf-8', errors='replace')
+    return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 默认保持连接，客户端的连接池才能复用
+    protocol_version = "HTTP/1.1"
+    canned = {}
+    stats = {"requests": 0, "connections": 0, "replayed": 0}
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            self.stats["connections"] += 1
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == HEALTH_PATH:
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != SCAN_PATH:
+            self.send_json(404, {"error": "not found"})
+            return
+
+        content = uploaded_file(self.headers, body)
+        if content is None:
+            self.send_json(400, {"error": "missing file field"})
+            return
+
+        if RESPONSE_DELAY:
+            time.sleep(RESPONSE_DELAY)
+
+        status, response = self.canned.get(content_hash(content), (200, None))
+        with self.lock:
+            self.stats["requests"] += 1
+            if response is not None:
+                self.stats["replayed"] += 1
+        self.send_json(status, response if response is not None else empty_response())
+
+    def log_message(self, format, *args):
+        # 关闭逐请求的访问日志
+        pass
+
+
+def serve(port=STUB_PORT, canned_file=CANNED_RESPONSES_FILE):
+    """
+    启动桩服务并返回 server 对象（在后台线程中运行，调用方用 server.shutdown() 结束）
+    """
+    StubHandler.canned = load_canned_responses(canned_file)
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    if BUILD_MODE:
+        build_canned_responses()
+        return
+
+    server = serve()
+    print(f"terrascan 桩服务已启动: http://127.0.0.1:{STUB_PORT} (回放响应: {len(StubHandler.canned)} 条)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+
+    stats = StubHandler.stats
+    print("\n" + "="*30)
+    print("📊 桩服务统计")
+    print(f"请求数: {stats['requests']}")
+    print(f"回放响应数: {stats['replayed']}")
+    print(f"TCP 连接数: {stats['connections']}")
+    print("="*30)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import hashlib
+import importlib.util
+
+# --- UMI 规则白名单 ---
+# combine_umi_full.py 只保留能在 policies_with_remediation.csv 中匹配到 UMI ID 的发现，
+# 其余规则的扫描结果最终都会被丢弃。这里直接取 combine 所用映射索引 (unify_error_umi/umi_index.py)
+# 中各工具的 by_id（加上对应多个 UMI ID、改按文本匹配的规则 ID）作为需要运行的规则，
+# 扫描时只把这些规则交给工具，减少每个文件的扫描开销，最终标签不变
+
+UMI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "unify_error_umi")
+
+
+def load_umi_module(name):
+    """按文件路径加载 unify_error_umi 下的模块（不改 sys.path），已加载过时直接返回"""
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(UMI_DIR, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+# umi_index 通过 `from policy_catalogue import ...` 引用同目录的策略目录模块，先把它加载进 sys.modules
+load_umi_module("policy_catalogue")
+umi_index = load_umi_module("umi_index")
+
+# fast_rules.py 等读取映射表时沿用 umi_index 的实现
+MAPPING_FILE = umi_index.MAPPING_FILE
+normalize_text = umi_index.normalize_text
+read_csv_rows = umi_index.read_csv_rows
+
+
+def mapped_rule_ids(tool):
+    """
+    映射索引中该工具能对应到 UMI ID 的规则 ID（含对应多个 UMI ID 的规则，排除默认不启用的规则），升序
+    """
+    mapping = umi_index.load_umi_index()["tools"][tool]
+    return sorted((set(mapping["by_id"]) | set(mapping["ambiguous_ids"])) - mapping["default_off"])
+
+
+def checkov_check_ids():
+    """
+    combine 用 check_name 匹配 Checkov_Policy，对应到 Checkov_K8s.csv 中的 CKV_K8S_* 规则 ID
+    """
+    return mapped_rule_ids("checkov")
+
+
+def kubelinter_check_names():
+    """
+    combine 用 remediation 匹配 Remediation 列，对应到 KubeLinter_Policies_UMI.csv 中的检查名
+    只保留默认启用的检查：原来的扫描没有配置文件，只运行默认检查，多加检查会改变最终标签
+    """
+    return mapped_rule_ids("kubelinter")
+
+
+def terrascan_rule_ids():
+    """
+    combine 用 description 匹配 Terrascan_Policy，对应到 Terrascan_K8s_Policies_UMI.csv 中的 AC_K8S_* 规则 ID
+    """
+    return mapped_rule_ids("terrascan")
+
+
+def rules_cache_version(tool_version, rules):
+    """
+    只运行部分规则时扫描结果与全量扫描不同，把规则列表的指纹拼进缓存用的版本号，两种结果互不混用
+    rules 为 None 表示运行全部规则，版本号不变
+    """
+    if rules is None:
+        return tool_version
+    digest = hashlib.sha256(",".join(rules).encode('utf-8')).hexdigest()[:12]
+    return f"{tool_version}+umi-rules-{digest}"
@@ -0,0 +1,143 @@
+import re
+
+# --- 多文档清单按文档扫描 ---
+# 多文档 YAML 按 --- 拆成单个文档分别扫描、分别缓存（缓存键是文档自己的内容哈希），
+# 跨仓库重复出现的样板文档（Namespace、ServiceAccount 等）因此可以命中缓存；
+# 所有文档扫描完成后再按文档偏移把结果拼回文件级记录，行号仍然对应原文件
+
+# 文档分隔行：行首的 --- 后面只能是空白或行尾（块标量中的内容都有缩进，不会误判）
+DOC_SEPARATOR = re.compile(r'^---(?:\s|$)')
+
+
+def split_documents(content):
+    """
+    按文档分隔行拆分清单
+    返回: [(行偏移, 文档文本), ...]；文档第 n 行对应原文件第 n + 行偏移 行
+    只含空白或注释的文档被丢弃
+    """
+    lines = content.split('\n')
+    docs = []
+    start = 0
+    for i, line in enumerate(lines):
+        if DOC_SEPARATOR.match(line):
+            docs.append((start, lines[start:i]))
+            start = i + 1
+    docs.append((start, lines[start:]))
+
+    return [
+        (offset, '\n'.join(doc_lines)) for offset, doc_lines in docs
+        if any(line.strip() and not line.lstrip().startswith('#') for line in doc_lines)
+    ]
+
+
+def is_document_id(idx):
+    """文档子任务的编号是 "{index}-{n}" 形式的字符串，整文件任务是 int 行号"""
+    return isinstance(idx, str)
+
+
+def shift_error_lines(error, offset):
+    """
+    把文档内的行号换算成原文件行号
+    Checkov: file_line_range [起, 止]；Terrascan: line；KubeLinter 的结果不带行号
+    """
+    error = dict(error)
+    if isinstance(error.get("file_line_range"), list):
+        error["file_line_range"] = [n + offset if isinstance(n, int) else n for n in error["file_line_range"]]
+    if isinstance(error.get("line"), int):
+        error["line"] = error["line"] + offset
+    return error
+
+
+class DocumentAssembler:
+    """
+    拆分多文档清单为文档子任务，并在所有文档都有结果后拼回文件级记录
+    由 ResultWriter 持有：子任务的结果经 add / fail 交回，整文件结果通过 emit_file 写出
+    """
+
+    def __init__(self, emit_file, advance):
+        # emit_file(index, filename, record): 写出一条文件级记录（None 表示无发现）
+        # advance(): 一个文件处理完毕（写出或失败），推进进度条
+        self.emit_file = emit_file
+        self.advance = advance
+        # 文件行号 -> {"filename", "offsets": [...], "records": {n: record}, "failed": bool}
+        self.pending = {}
+
+    def split(self, tasks):
+        """
+        惰性拆分任务：单文档清单原样输出，多文档清单输出 ("{index}-{n}", 文档文本, filename) 子任务
+        """
+        for idx, content, filename in tasks:
+            docs = split_documents(content) if content else []
+            if len(docs) < 2:
+                yield idx, content, filename
+                continue
+            self.pending[idx] = {
+                "filename": filename,
+                "offsets": [offset for offset, _ in docs],
+                "records": {},
+                "failed": False,
+            }
+            for n, (_, doc) in enumerate(docs):
+                yield f"{idx}-{n}", doc, filename
+
+    def _parse_id(self, doc_id):
+        idx, n = doc_id.rsplit("-", 1)
+        return int(idx), int(n)
+
+    def add(self, doc_id, record):
+        """
+        记录一个文档的扫描结果（None / 有发现 / timeout），全部文档到齐后拼回文件级记录
+        """
+        idx, n = self._parse_id(doc_id)
+        state = self.pending[idx]
+        state["records"][n] = record
+        self._maybe_finish(idx)
+
+    def fail(self, doc_id):
+        """
+        某个文档扫描失败：整个文件不写出（下次续扫时重新扫描），其余文档的结果仍会缓存
+        """
+        idx, n = self._parse_id(doc_id)
+        state = self.pending[idx]
+        state["records"][n] = None
+        state["failed"] = True
+        self._maybe_finish(idx)
+
+    def _maybe_finish(self, idx):
+        state = self.pending[idx]
+        if len(state["records"]) < len(state["offsets"]):
+            return
+        del self.pending[idx]
+        if not state["failed"]:
+            self.emit_file(idx, state["filename"], self.assemble(state))
+        self.advance()
+
+    def assemble(self, state):
+        """
+        把各文档的结果拼成文件级记录：
+        - 任一文档超时，整个文件记为 timeout
+        - 所有文档都无发现时为 None
+        - 否则合并 errors（行号换算回原文件，附带 document 序号），并记录各文档的行偏移
+        """
+        records = [state["records"][n] for n in range(len(state["offsets"]))]
+        for record in records:
+            if record is not None and record.get("status") == "timeout":
+                return record
+
+        found = [(n, record) for n, record in enumerate(records) if record is not None]
+        if not found:
+            return None
+
+        errors = []
+        for n, record in found:
+            offset = state["offsets"][n]
+            for error in record.get("errors", []):
+                errors.append({**shift_error_lines(error, offset), "document": n})
+
+        return {
+            "filename": state["filename"],
+            "scan_tool": found[0][1].get("scan_tool"),
+            "error_count": len(errors),
+            "errors": errors,
+            "document_offsets": state["offsets"],
+        }
@@ -0,0 +1,121 @@
+import os
+import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# --- 关键配置：设置 Hugging Face 缓存路径 ---
+# 必须在导入 datasets 之前设置
+os.environ["HF_DATASETS_CACHE"] = "/ssd_2t_1/wyq_workspace/hf_cache"
+import yaml
+from datasets import load_dataset
+from tqdm import tqdm
+
+from scan_utils import chunked, init_dataset_worker, resolve_batch_contents
+
+# --- YAML 预过滤 ---
+# 数据集中有不少空文件、无法解析的文件，以及不包含任何 apiVersion/kind 文档的文件，
+# 它们每一个都要启动三次扫描器却不会产生任何标签。这里先用 libyaml (CSafeLoader) 并行解析一遍，
+# 把每个清单分为 skip / single（单个 K8s 文档）/ multi（多个 K8s 文档），并记录资源 kind；
+# 三个 run_*_full.py 和 run_all_full.py 通过 scan_utils.filter_valid_tasks 只扫描 single / multi 的清单
+
+# --- 配置区域 ---
+DATASET_NAME = "substratusai/the-stack-yaml-k8s"
+# 预过滤结果：每行 {"index", "status", "reason", "kinds"}，扫描脚本据此跳过无效清单
+PREFILTER_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/prefilter_results.jsonl"
+# 并行进程数
+MAX_WORKERS = 16
+# 每个工作进程一次解析的清单数（解析很快，批大一些以减少 IPC 次数）
+BATCH_SIZE = 512
+
+# 优先使用 libyaml 的 C 实现，没有编译 libyaml 时退回纯 Python 实现
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def classify_manifest(content):
+    """
+    解析一个清单并分类
+    返回: (status, reason, kinds)
+      status: "skip" / "single" / "multi"
+      reason: skip 的原因（empty / parse_error / no_k8s_document），有效清单为 None
+      kinds: 各 K8s 文档的 kind 列表（按出现顺序）
+    """
+    if not content or not content.strip():
+        return "skip", "empty", []
+
+    try:
+        docs = list(yaml.load_all(content, Loader=SafeLoader))
+    except Exception:
+        return "skip", "parse_error", []
+
+    # 与扫描器的判断一致：同时带 apiVersion 和 kind 的映射才算 K8s 资源
+    kinds = [
+        str(doc["kind"]) for doc in docs
+        if isinstance(doc, dict) and doc.get("apiVersion") and doc.get("kind")
+    ]
+    if not kinds:
+        return "skip", "no_k8s_document", []
+    return ("single" if len(kinds) == 1 else "multi"), None, kinds
+
+
+def classify_batch(batch):
+    """
+    工作进程函数：batch 为 [(index, None, None), ...]，内容从工作进程映射的数据集中读取
+    返回: [(index, status, reason, kinds), ...]
+    """
+    return [(idx, *classify_manifest(content)) for idx, content, _ in resolve_batch_contents(batch)]
+
+
+def main():
+    print(f"1. 正在设置缓存路径: {os.environ['HF_DATASETS_CACHE']}")
+    print(f"2. 正在加载数据集: {DATASET_NAME} ...")
+
+    try:
+        ds = load_dataset(DATASET_NAME, split="train", streaming=False)
+    except Exception as e:
+        print(f"数据集加载失败: {e}")
+        return
+
+    total_files = len(ds)
+    print(f"   数据集加载成功！共包含 {total_files} 个文件。")
+    print(f"3. 准备开始预过滤 (进程数: {MAX_WORKERS}, 批大小: {BATCH_SIZE}, 解析器: {SafeLoader.__name__})...")
+
+    os.makedirs(os.path.dirname(PREFILTER_FILE), exist_ok=True)
+
+    status_counts = Counter()
+    skip_reasons = Counter()
+    kind_counts = Counter()
+
+    # 工作进程自行内存映射数据集，主进程只发送行号
+    tasks = ((i, None, None) for i in range(total_files))
+    with open(PREFILTER_FILE, 'w', encoding='utf-8') as f_out, \
+         tqdm(total=total_files, desc="Prefiltering YAML") as pbar, \
+         ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=init_dataset_worker,
+                             initargs=(DATASET_NAME,)) as executor:
+        for results in executor.map(classify_batch, chunked(tasks, BATCH_SIZE)):
+            for idx, status, reason, kinds in results:
+                status_counts[status] += 1
+                if reason:
+                    skip_reasons[reason] += 1
+                kind_counts.update(kinds)
+                f_out.write(json.dumps(
+                    {"index": idx, "status": status, "reason": reason, "kinds": kinds},
+                    ensure_ascii=False
+                ) + "\n")
+            pbar.update(len(results))
+
+    print("\n" + "="*30)
+    print("📊 预过滤统计")
+    print(f"总文件数: {total_files}")
+    print(f"有效单文档: {status_counts['single']}")
+    print(f"有效多文档: {status_counts['multi']}")
+    print(f"跳过: {status_counts['skip']}")
+    for reason, count in skip_reasons.most_common():
+        print(f"  - {reason}: {count}")
+    print("资源 kind Top 15:")
+    for kind, count in kind_counts.most_common(15):
+        print(f"  - {kind}: {count}")
+    print(f"结果已保存至: {PREFILTER_FILE}")
+    print("="*30)
+
+if __name__ == "__main__":
+    main()
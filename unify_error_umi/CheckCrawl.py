@@ -1,21 +1,26 @@
-import requests
 import pandas as pd
 import re
 import os
 
+from policy_catalogue import cached_policies, dataframe_policies, fetch_document, update_catalogue
+
 def fetch_unique_checkov_policies():
     # 1. GitHub Raw 地址
     url = "https://raw.githubusercontent.com/bridgecrewio/checkov/main/docs/5.Policy%20Index/kubernetes.md"
     
-    print(f"正在下载文档: {url} ...")
+    # 有固定副本时直接读取，否则按上次的 ETag / Last-Modified 条件请求 (policy_catalogue.py)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        content = response.text
+        content, source = fetch_document("checkov_kubernetes.md", url)
     except Exception as e:
         print(f"下载失败: {e}")
         return None
 
+    # 文档内容没变时沿用策略目录中的解析结果
+    policies = cached_policies("checkov", source["sha256"])
+    if policies is not None:
+        print("文档内容与策略目录中的相同，跳过解析。")
+        return pd.DataFrame(policies)
+
     print("下载成功，正在解析...")
 
     # 2. 清洗函数
@@ -85,6 +90,8 @@ def fetch_unique_checkov_policies():
         final_count = len(df)
         print(f"去重处理: 删除了 {initial_count - final_count} 条重复 ID 的记录。")
 
+    revision = update_catalogue("checkov", dataframe_policies(df), source)
+    print(f"解析结果已写入策略目录 (修订号 {revision})")
     return df
 
 # ================= 执行 =================
@@ -1,20 +1,25 @@
-import requests
 import pandas as pd
 import re
 
+from policy_catalogue import cached_policies, dataframe_policies, fetch_document, update_catalogue
+
 def fetch_kubelinter_policies():
     # 1. KubeLinter checks.md 的 Raw 地址
     url = "https://raw.githubusercontent.com/stackrox/kube-linter/main/docs/generated/checks.md"
     
-    print(f"正在下载文档: {url} ...")
+    # 有固定副本时直接读取，否则按上次的 ETag / Last-Modified 条件请求 (policy_catalogue.py)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        content = response.text
+        content, source = fetch_document("kubelinter_checks.md", url)
     except Exception as e:
         print(f"下载失败: {e}")
         return pd.DataFrame()
 
+    # 文档内容没变时沿用策略目录中的解析结果
+    policies = cached_policies("kubelinter", source["sha256"])
+    if policies is not None:
+        print("文档内容与策略目录中的相同，跳过解析。")
+        return pd.DataFrame(policies)
+
     print("下载成功，开始解析...")
 
     policies = []
@@ -76,6 +81,9 @@ def fetch_kubelinter_policies():
 
     # 4. 转为 DataFrame
     df = pd.DataFrame(policies)
+    if not df.empty:
+        revision = update_catalogue("kubelinter", dataframe_policies(df), source)
+        print(f"解析结果已写入策略目录 (修订号 {revision})")
     return df
 
 # ================= 执行 =================
@@ -2,10 +2,14 @@ import os
 import json
 import pandas as pd
 
+from policy_catalogue import cached_policies, dataframe_policies, directory_digest, resolve_directory, update_catalogue
+
 def parse_terrascan_policies(repo_path):
     """
     遍历本地 Terrascan 仓库目录，提取 k8s 策略的元数据
+    policy_snapshots/pinned/terrascan 下有固定副本（与仓库相同的目录结构）时改用固定副本
     """
+    repo_path = resolve_directory("terrascan", repo_path)
     # 拼接出 k8s 策略所在的绝对路径
     base_path = os.path.join(repo_path, 'pkg', 'policies', 'opa', 'rego', 'k8s')
     
@@ -16,6 +20,13 @@ def parse_terrascan_policies(repo_path):
         print(f"错误：路径 {base_path} 不存在，请确认您的 repo_path 设置正确。")
         return pd.DataFrame()
 
+    # 元数据文件没变时沿用策略目录中的解析结果
+    digest = directory_digest(base_path, '.json')
+    policies = cached_policies("terrascan", digest)
+    if policies is not None:
+        print(f"{base_path} 下的策略文件与策略目录中的相同，跳过解析。")
+        return pd.DataFrame(policies)
+
     print(f"正在扫描目录: {base_path} ...")
 
     # os.walk 遍历目录
@@ -66,6 +77,10 @@ def parse_terrascan_policies(repo_path):
 
     # 转换为 DataFrame
     df = pd.read_json(json.dumps(policies_list))
+    if not df.empty:
+        source = {"url": None, "origin": "directory", "path": os.path.abspath(base_path), "sha256": digest}
+        revision = update_catalogue("terrascan", dataframe_policies(df), source)
+        print(f"解析结果已写入策略目录 (修订号 {revision})")
     return df
 
 # ================= 使用说明 =================
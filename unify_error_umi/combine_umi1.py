@@ -1,8 +1,9 @@
 import json
-import pandas as pd
 import difflib
 import os
 
+from umi_index import load_umi_index, match_umi_id
+
 # --- 配置 ---
 MAPPING_FILE = "policies_with_remediation.csv"
 INPUT_FILES = {
@@ -13,28 +14,17 @@ INPUT_FILES = {
 OUTPUT_FILE = "unified_100_dataset2.jsonl"
 
 def load_mapping(filepath):
-    """加载 CSV 并创建查找字典"""
-    try:
-        df = pd.read_csv(filepath)
-        print(f"成功加载映射文件: {filepath}, 共 {len(df)} 条规则")
-    except Exception as e:
-        print(f"加载映射文件失败: {e}")
+    """
+    加载编译好的 UMI 映射索引 (umi_index.py)，返回三个工具的 {"by_id", "by_text"}
+    filepath 为映射表 CSV；索引按规则 ID 匹配，文本作为兜底
+    """
+    if not os.path.exists(filepath):
+        print(f"加载映射文件失败: 找不到 {filepath}")
         return None, None, None
-
-    # 创建查找表：描述 -> Rule_ID
-    # 注意：这里我们去掉字符串前后的空格，确保匹配准确
-    ckv_map = {row['Checkov_Policy'].strip(): row['ID'] for _, row in df.iterrows() if pd.notna(row['Checkov_Policy'])}
-    ter_map = {row['Terrascan_Policy'].strip(): row['ID'] for _, row in df.iterrows() if pd.notna(row['Terrascan_Policy'])}
-    
-    # 3. KubeLinter 映射：Remediation -> ID (改为精确匹配)
-    # 注意：这里读取的是 CSV 中的 'Remediation' 列
-    kbl_map = {
-        row['Remediation'].strip(): row['ID'] 
-        for _, row in df.iterrows() 
-        if pd.notna(row['Remediation'])
-    }
-    
-    return ckv_map, ter_map, kbl_map
+    tools = load_umi_index()["tools"]
+    print(f"成功加载映射索引: Checkov {len(tools['checkov']['by_id'])} 条规则 ID, "
+          f"Terrascan {len(tools['terrascan']['by_id'])} 条, KubeLinter {len(tools['kubelinter']['by_id'])} 条")
+    return tools["checkov"], tools["terrascan"], tools["kubelinter"]
 
 # def get_best_match(text, candidates, threshold=0.4):
 #     """
@@ -77,10 +67,10 @@ def main():
                 
                 for err in entry.get('errors', []):
                     stats["total_findings"] += 1
-                    # Checkov 使用 'check_name' 进行匹配
-                    check_name = err.get('check_name', '').strip()
-                    if check_name in ckv_map:
-                        aggregated_data[fname].add(f"{ckv_map[check_name]}")
+                    # Checkov 使用 check_id 匹配，查不到时用 'check_name'
+                    umi_id = match_umi_id(err, "checkov", ckv_map)
+                    if umi_id:
+                        aggregated_data[fname].add(umi_id)
                         stats["mapped_findings"] += 1
     
     # --- 2. 处理 Terrascan ---
@@ -94,13 +84,13 @@ def main():
 
                 for err in entry.get('errors', []):
                     stats["total_findings"] += 1
-                    # Terrascan 使用 'description' 进行匹配
-                    desc = err.get('description', '').strip()
-                    if desc in ter_map:
-                        aggregated_data[fname].add(f"{ter_map[desc]}")
+                    # Terrascan 使用 rule_id 匹配，查不到时用 'description'
+                    umi_id = match_umi_id(err, "terrascan", ter_map)
+                    if umi_id:
+                        aggregated_data[fname].add(umi_id)
                         stats["mapped_findings"] += 1
 
-    # --- 3. 处理 KubeLinter (使用 Remediation 精确匹配) ---
+    # --- 3. 处理 KubeLinter (使用检查名匹配，Remediation 精确匹配兜底) ---
     if os.path.exists(INPUT_FILES["kubelinter"]):
         print(f"正在处理 {INPUT_FILES['kubelinter']} ...")
         with open(INPUT_FILES["kubelinter"], 'r', encoding='utf-8') as f:
@@ -112,12 +102,10 @@ def main():
                 for err in entry.get('errors', []):
                     stats["total_findings"] += 1
                     
-                    # 获取工具输出中的 remediation 字段
-                    remediation_text = err.get('remediation', '').strip()
-                    
-                    # 直接在字典中查找 (Exact Match)
-                    if remediation_text in kbl_map:
-                        aggregated_data[fname].add(f"{kbl_map[remediation_text]}")
+                    # 使用检查名 check_id 匹配，查不到时用 remediation 字段精确匹配
+                    umi_id = match_umi_id(err, "kubelinter", kbl_map)
+                    if umi_id:
+                        aggregated_data[fname].add(umi_id)
                         stats["mapped_findings"] += 1
 
     # --- 4. 输出结果 ---
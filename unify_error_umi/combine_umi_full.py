@@ -1,16 +1,232 @@
 import json
-import pandas as pd
+import re
+import heapq
+import shutil
+import tempfile
+from itertools import groupby
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
-from collections import defaultdict
+
+from fuzzy_matcher import build_matcher
+from incremental_relabel import LabelVersionStore, build_findings_cache, cache_is_current, mapping_snapshot, relabel
+from label_bitset import WORD_BITS, LabelBitsetWriter, LabelCodec, ids_from_words, widen, words_for
+from parallel_combine import parallel_combine
+from umi_index import TEXT_FIELDS, load_umi_index, match_umi_id
 
 # --- 1. 配置路径 ---
 MAPPING_FILE = "policies_with_remediation.csv"
+# 使用编译好的映射索引 (umi_index.py)：按工具自己的规则 ID (CKV_K8S_* / 检查名 / AC_K8S_*) 匹配，
+# 查不到时按文本兜底；False 时只按 MAPPING_FILE 中的文本匹配
+USE_COMPILED_MAPPING = True
+# 近似匹配兜底 (fuzzy_matcher.py)：规则 ID 和文本都精确匹配不到的发现，按字符 n-gram TF-IDF 余弦相似度
+# 找最接近的 UMI 策略文本，相似度不低于 FUZZY_THRESHOLD 时采用；做出的近似匹配写入 FUZZY_REPORT_FILE 供人工核对
+USE_FUZZY_FALLBACK = False
+FUZZY_THRESHOLD = 0.8
+FUZZY_REPORT_FILE = "/home/wyq/kcfs_results/fuzzy_matches.jsonl"
 INPUT_FILES = {
     "checkov": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/checkov_full_results.jsonl",
     "kubelinter": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/kubelinter_full_results.jsonl",
     "terrascan": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/terrascan_full_results.jsonl"
 }
 OUTPUT_FILE = "/home/wyq/kcfs_results/final_labels.jsonl"
+# run_all_full.py 单遍扫描输出的合并结果：每行包含同一文件三个工具的结果，无需再按文件名对齐
+# USE_COMBINED_INPUT = True 时读取该文件，代替上面的三个 INPUT_FILES
+COMBINED_INPUT_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/all_full_results.jsonl"
+USE_COMBINED_INPUT = False
+# run_RB_tools/fast_rules.py 的快速规则结果：记录结构与 Checkov 一致（check_name 为映射表中的 Checkov_Policy），
+# USE_FASTPATH_INPUT = True 时按 Checkov 的匹配方式并入，与扫描器结果取并集
+FASTPATH_INPUT_FILE = "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/fastpath_full_results.jsonl"
+USE_FASTPATH_INPUT = False
+# 扫描脚本 COLUMNAR_OUTPUT 写出的列式结果（与 JSONL 输出同名的 .parquet，见 run_RB_tools/result_store.py）
+# USE_COLUMNAR_INPUT = True 时按列读取，代替上面的三个 INPUT_FILES
+COLUMNAR_INPUT_FILES = {
+    "checkov": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/checkov_full_results.parquet",
+    "kubelinter": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/kubelinter_full_results.parquet",
+    "terrascan": "/home/wyq/GenKubeSec_Reproduce/kcfs_results/RB_tool_results/terrascan_full_results.parquet"
+}
+USE_COLUMNAR_INPUT = False
+# 标签的列式副本：index（数据集行号）、filename、misconfig_labels，build_full_dataset.py 可按行号直接取样本
+LABEL_PARQUET_FILE = "/home/wyq/kcfs_results/final_labels.parquet"
+WRITE_LABEL_PARQUET = True
+# 标签的位集副本 (label_bitset.py)：每个文件一个 Kind 编号加 uint64 位集，build_full_dataset.py / 评估脚本可直接读取
+LABEL_BITSET_FILE = "/home/wyq/kcfs_results/final_labels.npz"
+WRITE_LABEL_BITSET = True
+# 外存归并模式：各工具的结果分块按行号排序后写入临时文件，再多路归并、边归并边写出结果，
+# 内存占用只与 SPILL_CHUNK_SIZE 有关，不随语料规模增长；输出与内存模式完全相同
+STREAMING_COMBINE = False
+# 每个排序块的条目数（每条发现约对应一个条目）
+SPILL_CHUNK_SIZE = 1_000_000
+# 排序块的临时目录，None 表示系统默认临时目录
+SPILL_DIR = None
+# 并行分片模式 (parallel_combine.py)：各 JSONL 输入按字节范围切片，由 COMBINE_WORKERS 个进程并行解析、
+# 向量化关联映射表，输出与内存模式逐字节相同；对列式输入 (USE_COLUMNAR_INPUT) 不生效
+PARALLEL_COMBINE = False
+COMBINE_WORKERS = 8
+# 增量重标注 (incremental_relabel.py)：全量合并时把每条发现的原始字段写入 FINDINGS_CACHE_FILE，标签存为
+# LABEL_VERSIONS_DIR 中的一个全量版本；之后扫描结果不变、只改了映射时，只重新计算受影响的文件，
+# 把标签有变化的文件追加为一个增量版本（不重写 OUTPUT_FILE 及其列式 / 位集副本，
+# 最新标签用 `python incremental_relabel.py <版本目录> <输出 JSONL>` 导出，或由 build_full_dataset.py 直接读取版本库）
+INCREMENTAL_RELABEL = False
+FINDINGS_CACHE_FILE = "/home/wyq/kcfs_results/findings_cache.parquet"
+LABEL_VERSIONS_DIR = "/home/wyq/kcfs_results/label_versions"
+# 标签列式副本每个 row group 的行数
+LABEL_ROW_GROUP_SIZE = 65536
+
+FILENAME_INDEX = re.compile(r'^file_(\d+)\.yaml$')
+
+class IndexedLabels:
+    """
+    以数据集行号为下标的数组：kind[i] 为该文件第一个有效的 Resource Kind 在 Kind 字典中的编号（-1 表示没有），
+    bits[i] 为匹配到的 UMI ID 位集（第 uid 位表示 UMI ID uid，见 label_bitset.py），各工具的结果按位或合并
+    各工具的记录按整数行号写入同一位置，不依赖各扫描脚本不同的文件名格式；
+    content_hash[i] 为第一条记录带来的内容哈希，用于发现各工具扫描的数据集版本不一致
+    """
+
+    def __init__(self, codec=None):
+        self.codec = codec or LabelCodec()
+        self.kind = np.full(0, -1, dtype=np.int32)
+        self.bits = np.zeros((0, self.codec.num_words), dtype=np.uint64)
+        self.size = 0
+        self.content_hash = []
+        self.hash_mismatches = 0
+
+    def _grow(self, idx):
+        if idx < self.size:
+            return
+        if idx >= len(self.kind):
+            # 容量按倍数扩大，避免逐行重新分配
+            capacity = max(idx + 1, 2 * len(self.kind), 1024)
+            self.kind = np.concatenate([self.kind, np.full(capacity - len(self.kind), -1, dtype=np.int32)])
+            self.bits = np.vstack([self.bits, np.zeros((capacity - len(self.bits), self.bits.shape[1]), dtype=np.uint64)])
+        self.content_hash.extend([None] * (idx + 1 - self.size))
+        self.size = idx + 1
+
+    def check_hash(self, idx, digest):
+        """记录或核对行号 idx 的内容哈希；与之前记录的不一致时计数"""
+        if not digest:
+            return
+        self._grow(idx)
+        if self.content_hash[idx] is None:
+            self.content_hash[idx] = digest
+        elif self.content_hash[idx] != digest:
+            self.hash_mismatches += 1
+
+    def add_kind(self, idx, kind):
+        self._grow(idx)
+        if self.kind[idx] < 0:
+            # 标签中 Kind 以字符串形式出现，字典中存 str(kind)
+            self.kind[idx] = self.codec.kind_code(str(kind))
+
+    def add_umi_id(self, idx, umi_id):
+        self._grow(idx)
+        uid = int(umi_id)
+        if uid >= self.bits.shape[1] * WORD_BITS:
+            self.codec.num_words = words_for(uid)
+            self.bits = widen(self.bits, self.codec.num_words)
+        self.bits[idx, uid // WORD_BITS] |= np.uint64(1 << (uid % WORD_BITS))
+
+    def __len__(self):
+        return int(np.count_nonzero((self.kind[:self.size] >= 0) | self.bits[:self.size].any(axis=1)))
+
+    def groups(self, chunk_size=65536):
+        """按行号顺序产出 (行号, 第一个有效 Kind, UMI ID 集合)"""
+        for start in range(0, self.size, chunk_size):
+            end = min(start + chunk_size, self.size)
+            kinds = self.kind[start:end].tolist()
+            for offset, words in enumerate(self.bits[start:end].tolist()):
+                code = kinds[offset]
+                yield (start + offset, self.codec.kinds[code] if code >= 0 else None,
+                       {str(uid) for uid in ids_from_words(words)})
+
+class SpillingLabels:
+    """
+    外存归并版的 IndexedLabels：接口相同，但不在内存中聚合，
+    而是把每次 check_hash / add_kind / add_umi_id 记成 (行号, 序号, 操作, 值) 条目，
+    每攒满 chunk_size 条按 (行号, 序号) 排序写成一个临时文件 (run)；
+    groups() 对所有 run 做多路归并，按行号逐个还原出与 IndexedLabels 相同的聚合结果
+    序号是全局递增的处理顺序，保证同一行号内“第一个 Kind / 第一个哈希”的判定与内存模式一致
+    """
+    HASH, KIND, UMI = 0, 1, 2
+
+    def __init__(self, chunk_size=SPILL_CHUNK_SIZE, spill_dir=None):
+        self.chunk_size = chunk_size
+        self.tmp_dir = tempfile.mkdtemp(prefix="combine_umi_", dir=spill_dir)
+        self.buffer = []
+        self.runs = []
+        self.seq = 0
+        self.hash_mismatches = 0
+
+    def _add(self, idx, op, value):
+        self.buffer.append((idx, self.seq, op, value))
+        self.seq += 1
+        if len(self.buffer) >= self.chunk_size:
+            self._spill()
+
+    def _spill(self):
+        if not self.buffer:
+            return
+        self.buffer.sort()
+        path = os.path.join(self.tmp_dir, f"run_{len(self.runs)}.tsv")
+        with open(path, 'w', encoding='utf-8') as f:
+            for idx, seq, op, value in self.buffer:
+                # 值用 JSON 编码，避免其中的制表符、换行破坏行格式
+                f.write(f"{idx}\t{seq}\t{op}\t{json.dumps(value, ensure_ascii=False)}\n")
+        self.runs.append(path)
+        self.buffer = []
+
+    def check_hash(self, idx, digest):
+        if digest:
+            self._add(idx, self.HASH, digest)
+
+    def add_kind(self, idx, kind):
+        self._add(idx, self.KIND, kind)
+
+    def add_umi_id(self, idx, umi_id):
+        self._add(idx, self.UMI, umi_id)
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                idx, seq, op, value = line.rstrip("\n").split("\t", 3)
+                yield int(idx), int(seq), int(op), json.loads(value)
+
+    def groups(self):
+        """
+        多路归并所有 run，按行号顺序产出 (行号, 第一个有效 Kind, UMI ID 集合)；结束后删除临时文件
+        """
+        self._spill()
+        try:
+            merged = heapq.merge(*(self._read_run(path) for path in self.runs))
+            for idx, items in groupby(merged, key=lambda item: item[0]):
+                first_kind = None
+                first_hash = None
+                umi_ids = set()
+                for _, _, op, value in items:
+                    if op == self.UMI:
+                        umi_ids.add(value)
+                    elif op == self.KIND:
+                        if first_kind is None:
+                            first_kind = value
+                    elif first_hash is None:
+                        first_hash = value
+                    elif value != first_hash:
+                        self.hash_mismatches += 1
+                yield idx, first_kind, umi_ids
+        finally:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+def record_index(entry):
+    """
+    记录的数据集行号：扫描脚本写出的 index 字段；旧输出没有该字段时从 file_{i}.yaml 形式的文件名推出
+    返回: 行号，无法确定时返回 None
+    """
+    if isinstance(entry.get('index'), int):
+        return entry['index']
+    match = FILENAME_INDEX.match(entry.get('filename') or "")
+    return int(match.group(1)) if match else None
 
 def normalize_text(text):
     """文本标准化：去除前后空格"""
@@ -18,8 +234,21 @@ def normalize_text(text):
         return ""
     return text.strip()
 
+def load_compiled_mapping(filepath):
+    """加载编译好的映射索引，返回三个工具的 {"by_id": {规则 ID: UMI ID}, "by_text": {文本: UMI ID}}"""
+    if not os.path.exists(filepath):
+        print(f"❌ 错误: 找不到 CSV 文件 {filepath}")
+        return None, None, None
+
+    tools = load_umi_index()["tools"]
+    print(f"✅ 映射索引加载完成。Checkov: {len(tools['checkov']['by_id'])}, "
+          f"Terrascan: {len(tools['terrascan']['by_id'])}, KubeLinter: {len(tools['kubelinter']['by_id'])} (规则 ID)")
+    return tools["checkov"], tools["terrascan"], tools["kubelinter"]
+
 def load_mapping(filepath):
-    """加载 CSV 映射表"""
+    """加载 CSV 映射表（只按文本匹配，结构与 load_compiled_mapping 相同，by_id 为空）"""
+    import pandas as pd
+
     if not os.path.exists(filepath):
         print(f"❌ 错误: 找不到 CSV 文件 {filepath}")
         return None, None, None
@@ -46,11 +275,41 @@ def load_mapping(filepath):
         if rem: kbl_map_remediation[rem] = umi_id
     
     print(f"✅ 映射表加载完成。Checkov: {len(ckv_map)}, Terrascan: {len(ter_map)}, KubeLinter: {len(kbl_map_remediation)}")
-    return ckv_map, ter_map, kbl_map_remediation
+    return (
+        {"by_id": {}, "by_text": ckv_map},
+        {"by_id": {}, "by_text": ter_map},
+        {"by_id": {}, "by_text": kbl_map_remediation},
+    )
+
+def process_entry(idx, errors, tool_name, mapping, global_data):
+    """
+    处理单个文件（数据集行号 idx）在某个工具下的错误列表，更新到 global_data (IndexedLabels) 中
+    返回: 成功匹配的错误项数
+    """
+    matched_count = 0
+
+    # 1. 收集 Resource Kind 候选 (用于后续补全 Unknown)
+    # 只要该文件在任意工具中识别出了有效的 Kind，就存下来
+    for err in errors:
+        k = err.get('kind', 'Unknown')
+        if k and k != "Unknown":
+            global_data.add_kind(idx, k)
+    
+    # 2. 匹配错误规则并记录 ID
+    # 先按规则 ID 匹配 (Checkov: check_id, Terrascan: rule_id, KubeLinter: check_id)，
+    # 查不到时按文本匹配 (Checkov: check_name, Terrascan: description, KubeLinter: remediation)
+    for err in errors:
+        matched_id = match_umi_id(err, tool_name, mapping)
+        
+        if matched_id:
+            global_data.add_umi_id(idx, matched_id)
+            matched_count += 1
+
+    return matched_count
 
 def process_file(filepath, tool_name, mapping, global_data):
     """
-    读取单个文件，解析并更新到全局字典 global_data 中
+    读取单个文件，解析并更新到 global_data 中
     """
     if not os.path.exists(filepath):
         print(f"⚠️ 跳过: 文件不存在 {filepath}")
@@ -59,6 +318,7 @@ def process_file(filepath, tool_name, mapping, global_data):
     print(f"📖 正在读取 {tool_name} 结果...")
     count = 0
     matched_count = 0
+    unkeyed = 0
     
     with open(filepath, 'r', encoding='utf-8') as f:
         for line in f:
@@ -67,89 +327,268 @@ def process_file(filepath, tool_name, mapping, global_data):
             
             try:
                 entry = json.loads(line)
-                filename = entry.get('filename')
-                if not filename: continue
+                idx = record_index(entry)
+                if idx is None:
+                    unkeyed += 1
+                    continue
                 
                 count += 1
-                
-                # 1. 收集 Resource Kind 候选 (用于后续补全 Unknown)
-                # 只要该文件在任意工具中识别出了有效的 Kind，就存下来
-                for err in entry.get('errors', []):
-                    k = err.get('kind', 'Unknown')
-                    if k and k != "Unknown":
-                        global_data[filename]["kinds"].append(k)
-                
-                # 2. 匹配错误规则并记录 ID
-                for err in entry.get('errors', []):
-                    matched_id = None
-                    
-                    if tool_name == "checkov":
-                        # Checkov: 用 check_name 匹配
-                        key = normalize_text(err.get('check_name', ''))
-                        if key in mapping: matched_id = mapping[key]
-                            
-                    elif tool_name == "terrascan":
-                        # Terrascan: 用 description 匹配
-                        key = normalize_text(err.get('description', ''))
-                        if key in mapping: matched_id = mapping[key]
-                            
-                    elif tool_name == "kubelinter":
-                        # KubeLinter: 用 remediation 匹配
-                        key = normalize_text(err.get('remediation', ''))
-                        if key in mapping: matched_id = mapping[key]
-                    
-                    if matched_id:
-                        global_data[filename]["umi_ids"].add(matched_id)
-                        matched_count += 1
+                global_data.check_hash(idx, entry.get('content_hash'))
+                matched_count += process_entry(
+                    idx, entry.get('errors', []), tool_name, mapping, global_data
+                )
                         
             except json.JSONDecodeError:
                 pass
     
     print(f"   └─ 已处理 {count} 个文件记录，成功匹配 {matched_count} 个错误项。")
+    if unkeyed:
+        print(f"   ⚠️ {unkeyed} 条记录没有 index 字段且文件名不是 file_{{i}}.yaml 格式，无法对应数据集行号，已跳过（请用当前扫描脚本重新生成）")
+
+def process_combined_file(filepath, mappings, global_data):
+    """
+    读取 run_all_full.py 输出的合并结果，每行已包含同一文件三个工具的结果
+    mappings: {工具名: 映射字典}，按 checkov -> terrascan -> kubelinter 的顺序处理，与三文件模式一致
+    """
+    if not os.path.exists(filepath):
+        print(f"⚠️ 跳过: 文件不存在 {filepath}")
+        return
+
+    print(f"📖 正在读取合并扫描结果 {filepath} ...")
+    count = 0
+    matched_count = 0
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            idx = record_index(entry)
+            if idx is None: continue
+
+            count += 1
+            global_data.check_hash(idx, entry.get('content_hash'))
+            for tool_name, mapping in mappings.items():
+                # 某个工具无发现 (null) 或扫描失败 ({"error": ...}) 时没有 errors 字段
+                tool_result = entry.get(tool_name) or {}
+                matched_count += process_entry(
+                    idx, tool_result.get('errors', []), tool_name, mapping, global_data
+                )
+
+    print(f"   └─ 已处理 {count} 个文件记录，成功匹配 {matched_count} 个错误项。")
+
+def process_columnar_file(filepath, tool_name, mapping, global_data):
+    """
+    读取列式扫描结果 (.parquet)，按列更新 global_data，结果与 process_file 读取同名 JSONL 相同
+    规则 ID 和文本列都是字典编码的：每个 row group 只对字典里的不同值查一次映射，再按下标取回每行的 UMI ID
+    （Terrascan 的 rule_id 在列式文件中也写在 check_id 列）
+    """
+    if not os.path.exists(filepath):
+        print(f"⚠️ 跳过: 文件不存在 {filepath}")
+        return
+
+    print(f"📖 正在读取 {tool_name} 列式结果...")
+    field = TEXT_FIELDS[tool_name]
+    table = pq.read_table(filepath, columns=["index", "kind", "check_id", field])
+    indices_seen = set()
+    matched_count = 0
+
+    for batch in table.to_batches():
+        rule_ids = batch.column("check_id")
+        texts = batch.column(field)
+        ids_by_rule = pa.array(
+            [mapping["by_id"].get(rule_id) for rule_id in rule_ids.dictionary.to_pylist()], type=pa.string()
+        ).take(rule_ids.indices).to_pylist()
+        ids_by_text = pa.array(
+            [mapping["by_text"].get(normalize_text(text)) for text in texts.dictionary.to_pylist()], type=pa.string()
+        ).take(texts.indices).to_pylist()
+        matched_ids = [by_rule or by_text for by_rule, by_text in zip(ids_by_rule, ids_by_text)]
+        fuzzy = mapping.get("fuzzy")
+        if fuzzy is not None:
+            # 近似匹配只用于两种精确匹配都落空的行；匹配器按文本缓存，逐行调用只为统计命中次数
+            row_texts = texts.to_pylist()
+            matched_ids = [
+                umi_id or (fuzzy.match(text)[0] if text and text.strip() else None)
+                for umi_id, text in zip(matched_ids, row_texts)
+            ]
+        indices = batch.column("index").to_pylist()
+        kinds = batch.column("kind").to_pylist()
+
+        # 行顺序与 JSONL 中的错误顺序一致，Kind 候选的先后（决定最终 Kind）也就一致
+        for idx, kind, matched_id in zip(indices, kinds, matched_ids):
+            if idx is None: continue
+            indices_seen.add(idx)
+            if kind and kind != "Unknown":
+                global_data.add_kind(idx, kind)
+            if matched_id:
+                global_data.add_umi_id(idx, matched_id)
+                matched_count += 1
+
+    print(f"   └─ 已处理 {len(indices_seen)} 个有发现的文件，成功匹配 {matched_count} 个错误项。")
+
+def label_record(idx, first_kind, umi_ids):
+    """
+    一个文件的标签记录；没有匹配到任何 UMI ID 时返回 None
+    """
+    # 如果没有匹配到任何 UMI ID，则跳过 (或者视情况保留空列表)
+    if not umi_ids:
+        return None
+
+    # 确定最佳 Kind：取第一个非 Unknown 的 (通常一个文件的 Kind 是唯一的)
+    best_kind = first_kind or "Unknown"
+
+    # 生成标签: Kind+ID
+    final_labels = [f"{best_kind}+{uid}" for uid in umi_ids]
+
+    return {
+        "index": idx,
+        "filename": f"file_{idx}.yaml",
+        "misconfig_labels": sorted(list(set(final_labels))),
+        "error_count": len(final_labels)
+    }
+
+LABEL_SCHEMA = pa.schema([
+    ("index", pa.int64()),
+    ("filename", pa.string()),
+    ("misconfig_labels", pa.list_(pa.dictionary(pa.int32(), pa.string()))),
+    ("error_count", pa.int32()),
+])
+
+class LabelParquetWriter:
+    """
+    把标签记录写成列式文件：index 为数据集行号，标签列表做字典编码；每 LABEL_ROW_GROUP_SIZE 条写一个 row group
+    """
+
+    def __init__(self, filepath, row_group_size=LABEL_ROW_GROUP_SIZE):
+        self.writer = pq.ParquetWriter(filepath, LABEL_SCHEMA, compression="zstd")
+        self.row_group_size = row_group_size
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.records:
+            return
+        self.writer.write_table(pa.table({
+            name: pa.array([r[name] for r in self.records], type=LABEL_SCHEMA.field(name).type)
+            for name in LABEL_SCHEMA.names
+        }, schema=LABEL_SCHEMA))
+        self.records = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
 
 def main():
-    # 1. 加载 CSV 映射
-    ckv_map, ter_map, kbl_map_rem = load_mapping(MAPPING_FILE)
+    # 1. 加载映射
+    if USE_COMPILED_MAPPING:
+        ckv_map, ter_map, kbl_map_rem = load_compiled_mapping(MAPPING_FILE)
+    else:
+        ckv_map, ter_map, kbl_map_rem = load_mapping(MAPPING_FILE)
     if not ckv_map: return
 
-    # 2. 初始化全局数据容器
-    # 结构: { "file_1.yaml": { "kinds": ["Service", ...], "umi_ids": set("1", "52") } }
-    # 使用 defaultdict 自动处理新文件
-    global_data = defaultdict(lambda: {"kinds": [], "umi_ids": set()})
+    fuzzy = None
+    if USE_FUZZY_FALLBACK:
+        fuzzy = build_matcher(FUZZY_THRESHOLD)
+        for mapping in (ckv_map, ter_map, kbl_map_rem):
+            mapping["fuzzy"] = fuzzy
+        print(f"✅ 近似匹配索引建立完成: {fuzzy.num_docs} 条候选文本 (阈值 {FUZZY_THRESHOLD})")
+
+    mappings = {"checkov": ckv_map, "terrascan": ter_map, "kubelinter": kbl_map_rem}
+    parallel = PARALLEL_COMBINE and not USE_COLUMNAR_INPUT
 
-    print("🚀 开始加载数据到内存 (字典模式)...")
+    # 输入按处理顺序排列，工具名为 None 表示合并结果
+    if USE_COMBINED_INPUT:
+        sources = [(None, COMBINED_INPUT_FILE)]
+    elif USE_COLUMNAR_INPUT:
+        sources = [(tool, COLUMNAR_INPUT_FILES[tool]) for tool in ("checkov", "terrascan", "kubelinter")]
+    else:
+        sources = [(tool, INPUT_FILES[tool]) for tool in ("checkov", "terrascan", "kubelinter")]
+    if USE_FASTPATH_INPUT:
+        sources.append(("checkov", FASTPATH_INPUT_FILE))
 
-    # 3. 依次处理三个文件 (顺序不重要，因为是按 filename 聚合)
-    process_file(INPUT_FILES["checkov"], "checkov", ckv_map, global_data)
-    process_file(INPUT_FILES["terrascan"], "terrascan", ter_map, global_data)
-    process_file(INPUT_FILES["kubelinter"], "kubelinter", kbl_map_rem, global_data)
+    if INCREMENTAL_RELABEL:
+        store = LabelVersionStore(LABEL_VERSIONS_DIR)
+        snapshot = mapping_snapshot(mappings, fuzzy)
+        if store.versions and cache_is_current(FINDINGS_CACHE_FILE, [path for _, path in sources]):
+            print(f"🚀 扫描结果与发现缓存一致，按映射变化增量重标注 (当前版本 {store.versions[-1]['version']})...")
+            relabel(store, FINDINGS_CACHE_FILE, mappings, snapshot)
+            print(f"🎉 全部完成！标签版本库: {LABEL_VERSIONS_DIR}")
+            return
+
+    # 2. 初始化全局数据容器
+    # 结构: 以数据集行号为下标的数组，kind[1] = Kind 字典中 "Service" 的编号，bits[1] 的第 1、52 位置位
+    # 外存归并模式下换成接口相同的 SpillingLabels，聚合推迟到写出时按行号归并完成
+    if parallel:
+        print(f"🚀 开始并行解析 (并行分片模式，进程数: {COMBINE_WORKERS})...")
+    elif STREAMING_COMBINE:
+        global_data = SpillingLabels(SPILL_CHUNK_SIZE, SPILL_DIR)
+        print(f"🚀 开始分块排序 (外存归并模式，每块 {SPILL_CHUNK_SIZE} 条)...")
+    else:
+        global_data = IndexedLabels()
+        print("🚀 开始加载数据到内存 (行号数组模式)...")
 
-    print(f"💾 内存加载完毕，共涉及 {len(global_data)} 个唯一文件。正在写入结果...")
+    # 3. 依次处理三个文件 (按数据集行号聚合；Kind 取最先出现的，与处理顺序有关)
+    if parallel:
+        global_data = parallel_combine(sources, mappings, COMBINE_WORKERS, fuzzy)
+    elif USE_COMBINED_INPUT:
+        process_combined_file(COMBINED_INPUT_FILE, mappings, global_data)
+    elif USE_COLUMNAR_INPUT:
+        process_columnar_file(COLUMNAR_INPUT_FILES["checkov"], "checkov", ckv_map, global_data)
+        process_columnar_file(COLUMNAR_INPUT_FILES["terrascan"], "terrascan", ter_map, global_data)
+        process_columnar_file(COLUMNAR_INPUT_FILES["kubelinter"], "kubelinter", kbl_map_rem, global_data)
+    else:
+        process_file(INPUT_FILES["checkov"], "checkov", ckv_map, global_data)
+        process_file(INPUT_FILES["terrascan"], "terrascan", ter_map, global_data)
+        process_file(INPUT_FILES["kubelinter"], "kubelinter", kbl_map_rem, global_data)
+    if USE_FASTPATH_INPUT and not parallel:
+        process_file(FASTPATH_INPUT_FILE, "checkov", ckv_map, global_data)
 
-    # 4. 生成最终结果
+    if STREAMING_COMBINE and not parallel:
+        print(f"💾 分块排序完毕，共 {global_data.seq} 个条目、{len(global_data.runs) + bool(global_data.buffer)} 个排序块。正在归并并写入结果...")
+    else:
+        print(f"💾 内存加载完毕，共涉及 {len(global_data)} 个唯一文件。正在写入结果...")
+
+    # 4. 生成最终结果 (按数据集行号顺序)
+    label_writer = LabelParquetWriter(LABEL_PARQUET_FILE) if WRITE_LABEL_PARQUET else None
+    bitset_writer = LabelBitsetWriter(LABEL_BITSET_FILE) if WRITE_LABEL_BITSET else None
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f_out:
-        for filename, data in global_data.items():
-            
-            # 确定最佳 Kind (投票机制)
-            best_kind = "Unknown"
-            if data["kinds"]:
-                # 简单取第一个非 Unknown 的，或者你可以写更复杂的统计逻辑
-                # 因为通常一个文件的 Kind 是唯一的
-                best_kind = data["kinds"][0]
-            
-            # 如果没有匹配到任何 UMI ID，则跳过 (或者视情况保留空列表)
-            if not data["umi_ids"]:
+        for idx, first_kind, umi_ids in global_data.groups():
+            record = label_record(idx, first_kind, umi_ids)
+            if record is None:
                 continue
-
-            # 生成标签: Kind+ID
-            final_labels = [f"{best_kind}+{uid}" for uid in data["umi_ids"]]
-            
-            record = {
-                "filename": filename,
-                "misconfig_labels": sorted(list(set(final_labels))),
-                "error_count": len(final_labels)
-            }
             f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if label_writer is not None:
+                label_writer.write(record)
+            if bitset_writer is not None:
+                bitset_writer.write(idx, first_kind or "Unknown", umi_ids)
+
+    if label_writer is not None:
+        label_writer.close()
+        print(f"   标签列式副本已保存至: {LABEL_PARQUET_FILE}")
+    if bitset_writer is not None:
+        bitset_writer.close()
+        print(f"   标签位集副本已保存至: {LABEL_BITSET_FILE} ({len(bitset_writer.codec.kinds)} 种 Kind，每个文件 {bitset_writer.codec.num_words} 个字)")
+
+    if fuzzy is not None:
+        fuzzy.write_report(FUZZY_REPORT_FILE)
+        print(f"   近似匹配 {sum(fuzzy.hits.values())} 个错误项 (不同文本 {len(fuzzy.hits)} 条)，报告已保存至: {FUZZY_REPORT_FILE}")
+
+    if global_data.hash_mismatches:
+        print(f"⚠️ {global_data.hash_mismatches} 条记录与其他工具同一行号的 content_hash 不一致，请确认各工具扫描的是同一版本的数据集")
+
+    if INCREMENTAL_RELABEL:
+        count = build_findings_cache(sources, FINDINGS_CACHE_FILE, list(mappings))
+        version = store.append("full", snapshot, label_file=OUTPUT_FILE)
+        print(f"   发现缓存 ({count} 条) 已保存至: {FINDINGS_CACHE_FILE}，标签已存为版本 {version}")
 
     print(f"🎉 全部完成！结果已保存至: {OUTPUT_FILE}")
 
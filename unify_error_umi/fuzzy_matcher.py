@@ -0,0 +1,184 @@
+import re
+import sys
+import json
+import math
+import time
+from collections import Counter, defaultdict
+
+from umi_index import MAPPING_FILE, TEXT_FIELDS, normalize_text, read_csv_rows
+
+# --- 近似匹配 ---
+# 工具输出的规则文本与 policies_with_remediation.csv 稍有出入（版本更新改了措辞、多了标点等）时，
+# 精确匹配查不到，发现就被静默丢弃。combine_umi1.py 里注释掉的 difflib.get_close_matches 每次查询都要
+# 和全部候选逐个比较，太慢。这里对映射表中所有 UMI 策略文本建一次字符 n-gram TF-IDF 倒排索引，
+# 查询时只累加共有 n-gram 的倒排表求余弦相似度；同一文本的查询结果缓存，全量语料中不同的文本只有几百条。
+# combine_umi_full.py 的 USE_FUZZY_FALLBACK 打开后，规则 ID 和文本都查不到的发现走这里兜底
+#
+# 用法:
+#   python fuzzy_matcher.py <扫描结果 JSONL> ...   对结果中未映射的文本做近似匹配，打印匹配报告（不写任何文件）
+
+# 映射表中参与索引的文本列
+CANDIDATE_COLUMNS = ["Checkov_Policy", "Kube_Linter_Policy", "Terrascan_Policy", "Remediation"]
+# 字符 n-gram 的长度
+NGRAM_SIZE = 3
+# 余弦相似度不低于该值才算匹配
+DEFAULT_THRESHOLD = 0.8
+
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    """
+    小写并把标点、连续空白折叠成一个空格后，取首尾补空格的字符 n-gram 计数
+    """
+    text = " " + NON_WORD.sub(" ", text.lower()).strip() + " "
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class FuzzyMatcher:
+    """
+    字符 n-gram TF-IDF 最近邻匹配器
+    candidates: {候选文本: UMI ID}
+    match(text) 返回 (UMI ID, 相似度, 候选文本)，低于 threshold 时 UMI ID 为 None；结果按文本缓存
+    """
+
+    def __init__(self, candidates, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.texts = list(candidates)
+        self.umi_ids = [candidates[text] for text in self.texts]
+
+        # 逆文档频率：平滑后的 log((1 + N) / (1 + df)) + 1，未见过的 n-gram 取 df = 0
+        grams = [char_ngrams(text) for text in self.texts]
+        df = Counter(gram for counts in grams for gram in counts)
+        self.num_docs = len(self.texts)
+        self.idf = {gram: math.log((1 + self.num_docs) / (1 + count)) + 1 for gram, count in df.items()}
+        self.default_idf = math.log(1 + self.num_docs) + 1
+
+        # 倒排表: n-gram -> [(候选下标, 归一化后的权重)]
+        self.postings = defaultdict(list)
+        for doc, counts in enumerate(grams):
+            weights = {gram: tf * self.idf[gram] for gram, tf in counts.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for gram, weight in weights.items():
+                self.postings[gram].append((doc, weight / norm))
+
+        self.cache = {}
+        # 文本 -> 命中次数，只统计达到阈值的近似匹配，用于报告
+        self.hits = Counter()
+        self.queries = 0
+
+    def nearest(self, text):
+        """
+        返回 (候选下标, 余弦相似度)；没有任何共有 n-gram 时返回 (None, 0.0)
+        """
+        counts = char_ngrams(text)
+        weights = {gram: tf * self.idf.get(gram, self.default_idf) for gram, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+
+        scores = defaultdict(float)
+        for gram, weight in weights.items():
+            for doc, doc_weight in self.postings.get(gram, ()):
+                scores[doc] += weight * doc_weight
+        if not scores:
+            return None, 0.0
+        doc = max(scores, key=scores.get)
+        return doc, scores[doc] / norm
+
+    def match(self, text):
+        """
+        近似匹配一个文本，返回 (UMI ID 或 None, 相似度, 最接近的候选文本)
+        """
+        text = normalize_text(text)
+        self.queries += 1
+        result = self.cache.get(text)
+        if result is None:
+            if not text:
+                result = (None, 0.0, None)
+            else:
+                doc, score = self.nearest(text)
+                if doc is None:
+                    result = (None, 0.0, None)
+                else:
+                    umi_id = self.umi_ids[doc] if score >= self.threshold else None
+                    result = (umi_id, score, self.texts[doc])
+            self.cache[text] = result
+        if result[0] is not None:
+            self.hits[text] += 1
+        return result
+
+    def report(self):
+        """
+        做出的近似匹配列表，按命中次数降序：[{"text", "matched_text", "umi_id", "score", "hits"}]
+        """
+        return [
+            {"text": text, "matched_text": self.cache[text][2], "umi_id": self.cache[text][0],
+             "score": round(self.cache[text][1], 4), "hits": hits}
+            for text, hits in self.hits.most_common()
+        ]
+
+    def write_report(self, filepath):
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for entry in self.report():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def load_candidates(mapping_file=MAPPING_FILE):
+    """
+    映射表中所有策略文本 -> UMI ID（同一文本出现在多行时后面的行覆盖前面的，与精确匹配一致）
+    """
+    candidates = {}
+    for row in read_csv_rows(mapping_file):
+        for column in CANDIDATE_COLUMNS:
+            text = normalize_text(row.get(column))
+            if text:
+                candidates[text] = row["ID"]
+    return candidates
+
+
+def build_matcher(threshold=DEFAULT_THRESHOLD, mapping_file=MAPPING_FILE):
+    return FuzzyMatcher(load_candidates(mapping_file), threshold)
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        print("用法: python fuzzy_matcher.py <扫描结果 JSONL> ...")
+        return
+
+    start = time.perf_counter()
+    matcher = build_matcher()
+    print(f"✅ 索引建立完成: {matcher.num_docs} 条候选文本，{len(matcher.postings)} 个 n-gram，"
+          f"耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    exact = set(matcher.texts)
+    unmapped = 0
+    query_time = 0.0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                tool = entry.get("scan_tool")
+                if tool not in TEXT_FIELDS:
+                    continue
+                for err in entry.get("errors", []):
+                    text = normalize_text(err.get(TEXT_FIELDS[tool]))
+                    if not text or text in exact:
+                        continue
+                    unmapped += 1
+                    start = time.perf_counter()
+                    matcher.match(text)
+                    query_time += time.perf_counter() - start
+
+    report = matcher.report()
+    print("\n" + "="*30)
+    print("📊 近似匹配统计")
+    print(f"未精确映射的发现: {unmapped} (不同文本 {len(matcher.cache)} 条)")
+    print(f"近似匹配成功: {sum(e['hits'] for e in report)} (阈值 {matcher.threshold})")
+    if matcher.cache:
+        print(f"平均每个不同文本的查询耗时: {query_time / len(matcher.cache) * 1000:.3f} ms")
+    for entry in report:
+        print(f"  - [{entry['score']:.3f}] {entry['text'][:60]!r} -> UMI {entry['umi_id']} ({entry['hits']} 次)")
+    print("="*30)
+
+if __name__ == "__main__":
+    main()
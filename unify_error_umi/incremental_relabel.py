@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import time
+import shutil
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from umi_index import ID_FIELDS, TEXT_FIELDS, match_umi_id, normalize_text
+
+# --- 增量重标注 ---
+# 每次改动 policies_with_remediation.csv（或据以生成它的 cheToTerra2.json / KubeToTerra2.json / cheToKube1.json）
+# 都要让 combine_umi_full.py 把全部发现重新过一遍。INCREMENTAL_RELABEL 打开后：
+#   1. 第一次（或扫描结果有变化时）照常全量合并，同时把每条发现的原始字段 (行号, 工具, Kind, 规则 ID, 文本)
+#      按处理顺序写入发现缓存 (Parquet)，标签和当时的映射存为版本库中的一个全量版本
+#   2. 之后扫描结果不变、只是映射改了时，对比新旧映射找出变化的规则 ID / 文本，只重新计算含有这些发现的文件，
+#      把标签真正变了的文件作为一个增量版本追加到版本库，不重写全部标签
+# 版本库目录中 versions.json 记录各版本，labels_v*.jsonl 为标签（增量版本中标签为空的记录表示该文件已无标签），
+# mapping_v*.json 为该版本使用的映射；最新标签 = 最后一个全量版本 + 之后的增量版本
+#
+# 用法:
+#   python incremental_relabel.py <版本目录>               列出各版本
+#   python incremental_relabel.py <版本目录> <输出 JSONL>   把最新标签写成与 final_labels.jsonl 相同格式的文件
+
+CACHE_VERSION = 1
+# 发现缓存：每条发现一行，按 combine 的处理顺序排列（决定每个文件“第一个有效 Kind”）
+CACHE_SCHEMA = pa.schema([
+    ("index", pa.int64()),
+    ("tool", pa.dictionary(pa.int32(), pa.string())),
+    ("kind", pa.dictionary(pa.int32(), pa.string())),
+    ("rule_id", pa.dictionary(pa.int32(), pa.string())),
+    ("text", pa.dictionary(pa.int32(), pa.string())),
+])
+CACHE_ROW_GROUP_SIZE = 65536
+MANIFEST_FILE = "versions.json"
+
+
+def input_fingerprints(paths):
+    """输入文件的 (大小, 修改时间)，用于判断发现缓存是否仍对应当前的扫描结果"""
+    return {path: [os.path.getsize(path), os.stat(path).st_mtime_ns] if os.path.exists(path) else None
+            for path in paths}
+
+
+def cache_is_current(cache_file, paths):
+    if not os.path.exists(cache_file):
+        return False
+    meta = json.loads(pq.read_schema(cache_file).metadata[b"relabel"])
+    return meta["version"] == CACHE_VERSION and meta["inputs"] == input_fingerprints(paths)
+
+
+def finding_row(idx, tool, err):
+    """
+    一条发现在缓存中的字段：Kind 只保留有效值，规则 ID 只保留字符串，文本先标准化；
+    丢掉的值在 match_umi_id 中本来也匹配不到任何 UMI ID，按缓存重新匹配的结果与读原始输出相同
+    """
+    k = err.get('kind', 'Unknown')
+    rule_id = err.get(ID_FIELDS[tool])
+    text = normalize_text(err.get(TEXT_FIELDS[tool]))
+    return (idx, tool, str(k) if k and k != "Unknown" else None,
+            rule_id if isinstance(rule_id, str) and rule_id else None, text or None)
+
+
+def iter_jsonl_findings(tool_name, filepath, tools):
+    """按 combine_umi_full.py 的处理顺序产出 JSONL 结果中的发现；tool_name 为 None 表示 run_all_full.py 的合并结果"""
+    # 在函数内导入，避免与 combine_umi_full 循环导入
+    from combine_umi_full import record_index
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            idx = record_index(entry)
+            if idx is None: continue
+            if tool_name:
+                for err in entry.get('errors', []):
+                    yield finding_row(idx, tool_name, err)
+            else:
+                for tool in tools:
+                    for err in (entry.get(tool) or {}).get('errors', []):
+                        yield finding_row(idx, tool, err)
+
+
+def iter_columnar_findings(tool_name, filepath):
+    """列式扫描结果中的发现（Terrascan 的 rule_id 在列式文件中写在 check_id 列）"""
+    table = pq.read_table(filepath, columns=["index", "kind", "check_id", TEXT_FIELDS[tool_name]])
+    for idx, kind, rule_id, text in zip(*(table.column(n).to_pylist() for n in table.column_names)):
+        if idx is None: continue
+        yield finding_row(idx, tool_name, {"kind": kind, ID_FIELDS[tool_name]: rule_id,
+                                           TEXT_FIELDS[tool_name]: text})
+
+
+def build_findings_cache(sources, cache_file, tools):
+    """
+    把所有输入中的发现按处理顺序写入发现缓存
+    sources: [(工具名 或 None, 文件路径), ...]，.parquet 为列式结果，其余为 JSONL
+    tools: 合并结果中各工具的处理顺序
+    返回: 写入的发现条数
+    """
+    meta = {"version": CACHE_VERSION, "inputs": input_fingerprints([path for _, path in sources])}
+    tmp_file = cache_file + ".tmp"
+    writer = pq.ParquetWriter(tmp_file, CACHE_SCHEMA.with_metadata({"relabel": json.dumps(meta)}),
+                              compression="zstd")
+    rows = []
+    count = 0
+
+    def flush():
+        columns = list(zip(*rows))
+        writer.write_table(pa.table([pa.array(values, type=field.type) for values, field in zip(columns, CACHE_SCHEMA)],
+                                    schema=CACHE_SCHEMA))
+        rows.clear()
+
+    for tool_name, filepath in sources:
+        if not os.path.exists(filepath):
+            continue
+        if filepath.endswith(".parquet"):
+            findings = iter_columnar_findings(tool_name, filepath)
+        else:
+            findings = iter_jsonl_findings(tool_name, filepath, tools)
+        for row in findings:
+            rows.append(row)
+            count += 1
+            if len(rows) >= CACHE_ROW_GROUP_SIZE:
+                flush()
+    if rows:
+        flush()
+    writer.close()
+    os.replace(tmp_file, cache_file)
+    return count
+
+
+def mapping_snapshot(mappings, fuzzy=None):
+    """可保存为 JSON 的映射快照：各工具的 by_id / by_text，以及近似匹配的候选文本和阈值（未启用时为 None）"""
+    return {
+        "tools": {tool: {"by_id": m["by_id"], "by_text": m["by_text"]} for tool, m in mappings.items()},
+        "fuzzy": None if fuzzy is None else {
+            "threshold": fuzzy.threshold, "candidates": dict(zip(fuzzy.texts, fuzzy.umi_ids))
+        },
+    }
+
+
+def changed_keys(old, new):
+    """值有增删改的键"""
+    return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+
+
+def diff_mappings(old, new):
+    """
+    返回 ({工具名: {"ids": 变化的规则 ID, "texts": 变化的文本}}, 近似匹配配置是否变化)
+    """
+    changed = {}
+    for tool, mapping in new["tools"].items():
+        before = old["tools"].get(tool, {"by_id": {}, "by_text": {}})
+        changed[tool] = {
+            "ids": changed_keys(before["by_id"], mapping["by_id"]),
+            "texts": changed_keys(before["by_text"], mapping["by_text"]),
+        }
+    return changed, old.get("fuzzy") != new.get("fuzzy")
+
+
+def affected_mask(table, changed, fuzzy_changed, snapshot):
+    """
+    可能受映射变化影响的发现：规则 ID 或文本的映射变了；近似匹配配置变了时，另加所有精确匹配不到的发现
+    """
+    tools = table.column("tool").cast(pa.string())
+    rule_ids = table.column("rule_id").cast(pa.string())
+    texts = table.column("text").cast(pa.string())
+    mask = None
+    for tool, keys in changed.items():
+        hit = pc.or_(pc.is_in(rule_ids, pa.array(sorted(keys["ids"]), pa.string())),
+                     pc.is_in(texts, pa.array(sorted(keys["texts"]), pa.string())))
+        if fuzzy_changed:
+            mapping = snapshot["tools"][tool]
+            exact = pc.or_(pc.is_in(rule_ids, pa.array(list(mapping["by_id"]), pa.string())),
+                           pc.is_in(texts, pa.array(list(mapping["by_text"]), pa.string())))
+            hit = pc.or_(hit, pc.and_(pc.invert(pc.fill_null(exact, False)), pc.is_valid(texts)))
+        tool_mask = pc.and_(pc.equal(tools, tool), pc.fill_null(hit, False))
+        mask = tool_mask if mask is None else pc.or_(mask, tool_mask)
+    return mask
+
+
+def recompute_labels(table, mappings):
+    """按缓存中的发现（已按处理顺序排列）重新聚合，返回 {行号: 标签记录 或 None}"""
+    from combine_umi_full import IndexedLabels, label_record
+
+    global_data = IndexedLabels()
+    for idx, tool, kind, rule_id, text in zip(*(table.column(n).to_pylist() for n in CACHE_SCHEMA.names)):
+        if kind:
+            global_data.add_kind(idx, kind)
+        matched_id = match_umi_id({ID_FIELDS[tool]: rule_id, TEXT_FIELDS[tool]: text}, tool, mappings[tool])
+        if matched_id:
+            global_data.add_umi_id(idx, matched_id)
+
+    indices = set(table.column("index").to_pylist())
+    return {idx: label_record(idx, first_kind, umi_ids)
+            for idx, first_kind, umi_ids in global_data.groups() if idx in indices}
+
+
+class LabelVersionStore:
+    """
+    标签版本库：只追加，每个版本一个标签文件和一个映射快照，versions.json 记录版本列表
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.versions = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.versions = json.load(f)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def mapping(self):
+        """最新版本使用的映射快照"""
+        with open(self._path(self.versions[-1]["mapping"]), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def append(self, kind, snapshot, records=None, label_file=None, **info):
+        """
+        追加一个版本；kind 为 "full"（全量，label_file 给出已写好的标签文件，直接复制）或 "delta"（增量，records 为变化的记录）
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        version = len(self.versions) + 1
+        labels_name = f"labels_v{version:04d}.jsonl"
+        mapping_name = f"mapping_v{version:04d}.json"
+        if label_file is not None:
+            shutil.copyfile(label_file, self._path(labels_name))
+        else:
+            with open(self._path(labels_name), 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(self._path(mapping_name), 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+
+        self.versions.append({"version": version, "type": kind, "labels": labels_name, "mapping": mapping_name,
+                              "created": time.strftime("%Y-%m-%d %H:%M:%S"), **info})
+        # 先写临时文件再替换，中途中断时 versions.json 仍指向上一个完整版本
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.versions, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        return version
+
+    def labels(self, indices=None):
+        """
+        最新标签 {行号: 记录}：从最后一个全量版本开始依次应用增量版本
+        indices: 只取这些行号（集合），None 表示全部
+        """
+        base = max(n for n, v in enumerate(self.versions) if v["type"] == "full")
+        labels = {}
+        for v in self.versions[base:]:
+            with open(self._path(v["labels"]), 'r', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    idx = record["index"]
+                    if indices is not None and idx not in indices:
+                        continue
+                    if record["misconfig_labels"]:
+                        labels[idx] = record
+                    else:
+                        labels.pop(idx, None)
+        return labels
+
+    def materialize(self, target):
+        """把最新标签按行号顺序写成与 final_labels.jsonl 相同格式的文件，返回记录数"""
+        labels = self.labels()
+        with open(target, 'w', encoding='utf-8') as f:
+            for idx in sorted(labels):
+                f.write(json.dumps(labels[idx], ensure_ascii=False) + "\n")
+        return len(labels)
+
+
+def relabel(store, cache_file, mappings, snapshot):
+    """
+    按映射变化增量重标注：映射有变化时总是追加一个增量版本，记录新的映射快照和有变化的标签；
+    只改了没有被用到的规则 ID / 文本时增量为空，该版本只记录映射变化
+    mappings: {工具名: 映射字典}（可带 "fuzzy"），snapshot: mapping_snapshot(mappings, fuzzy)
+    返回: 新版本号，映射没有变化时返回 None
+    """
+    start = time.perf_counter()
+    changed, fuzzy_changed = diff_mappings(store.mapping(), snapshot)
+    num_keys = sum(len(keys["ids"]) + len(keys["texts"]) for keys in changed.values())
+    if not num_keys and not fuzzy_changed:
+        print(f"✅ 映射与版本 {store.versions[-1]['version']} 相同，无需重标注")
+        return None
+    print(f"🔍 映射变化: {num_keys} 个规则 ID / 文本" + ("，近似匹配配置有变化" if fuzzy_changed else ""))
+
+    table = pq.read_table(cache_file)
+    mask = affected_mask(table, changed, fuzzy_changed, snapshot)
+    affected = pc.unique(table.column("index").filter(mask))
+    rows = table.filter(pc.is_in(table.column("index"), affected))
+    print(f"   └─ 缓存 {table.num_rows} 条发现中 {pc.sum(mask).as_py() or 0} 条受影响，涉及 {len(affected)} 个文件 ({rows.num_rows} 条发现需重新计算)")
+
+    new_labels = recompute_labels(rows, mappings)
+    current = store.labels(set(new_labels))
+    delta = []
+    for idx in sorted(new_labels):
+        record = new_labels[idx]
+        if record is None:
+            if idx in current:
+                # 空标签表示该文件在新映射下已没有任何 UMI ID
+                delta.append({"index": idx, "filename": f"file_{idx}.yaml", "misconfig_labels": [], "error_count": 0})
+        elif record != current.get(idx):
+            delta.append(record)
+
+    version = store.append("delta", snapshot, records=delta, affected_files=len(affected), changed_files=len(delta))
+    if delta:
+        print(f"💾 {len(delta)} 个文件的标签有变化，已追加为版本 {version} (耗时 {time.perf_counter() - start:.1f} s)")
+    else:
+        print(f"💾 没有文件的标签有变化，已追加版本 {version}，只记录映射变化 (耗时 {time.perf_counter() - start:.1f} s)")
+    return version
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python incremental_relabel.py <版本目录> [输出 JSONL]")
+        return
+
+    store = LabelVersionStore(sys.argv[1])
+    if not store.versions:
+        print(f"⚠️ {sys.argv[1]} 中没有标签版本")
+        return
+    if len(sys.argv) == 2:
+        for v in store.versions:
+            if v["type"] != "delta":
+                detail = "全量"
+            elif v.get("changed_files", 0):
+                detail = f"{v['changed_files']} 个文件有变化"
+            else:
+                detail = "只记录映射变化"
+            print(f"  v{v['version']:04d}  {v['created']}  {detail}")
+        return
+
+    count = store.materialize(sys.argv[2])
+    print(f"✅ 版本 {store.versions[-1]['version']} 的标签 ({count} 个文件) 已保存至: {sys.argv[2]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+
+import numpy as np
+
+# --- 位集标签 ---
+# UMI ID 是几百以内的稠密整数，标签却以 "Deployment+10" 这样的字符串列表（final_labels.jsonl）
+# 和逗号拼接的字符串（HF 数据集的 target）在流水线中传递。这里把一个文件的标签编码成
+# (Kind 编号, uint64 位集)：第 uid 位表示 UMI ID uid，Kind 存成字典下标。
+# 求并集是按位或，评估时的交集 / 差集计数是按位与加 popcount，整批文件一次向量运算完成。
+# 标签通常只有一种 Kind（combine_umi_full.py 给同一文件的所有 UMI ID 用同一个 Kind），
+# 模型预测可能混有多种 Kind，此时同一文件按 Kind 拆成多行位集
+#
+# 用法:
+#   python label_bitset.py <final_labels.jsonl> ...   转换成同名 .npz，并校验能还原出相同的字符串标签
+
+# 每个字的位数
+WORD_BITS = 64
+# 超过该值的 UMI ID 不进位集，按原字符串单独计数（防止模型生成的超大数字把位集撑大）
+MAX_UMI_ID = 4095
+# 位集文件的格式版本
+BITSET_VERSION = 1
+
+
+def words_for(uid):
+    """容纳 0..uid 需要的字数"""
+    return uid // WORD_BITS + 1
+
+
+def split_labels(label_str):
+    """将字符串 'Deployment+10, Service+52' 拆成标签集合（与 eval_metrics.py 的 parse_labels 一致）"""
+    if not label_str or label_str.strip() == "":
+        return set()
+    return set(x.strip() for x in label_str.split(','))
+
+
+def parse_label(label):
+    """
+    'Deployment+10' -> ('Deployment', 10)；不是 Kind+整数形式、或数字不是规范写法（如 '010'）时返回 None
+    """
+    kind, sep, uid = label.rpartition("+")
+    if not sep or not uid.isdigit() or str(int(uid)) != uid:
+        return None
+    return kind, int(uid)
+
+
+def widen(bits, num_words):
+    """把位集矩阵右侧补零到 num_words 列"""
+    if bits.shape[1] >= num_words:
+        return bits
+    return np.hstack([bits, np.zeros((bits.shape[0], num_words - bits.shape[1]), dtype=np.uint64)])
+
+
+def popcount(bits):
+    """每行置位的个数"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int64)
+    # numpy < 2.0 没有 bitwise_count，按字节展开计数
+    as_bytes = bits.astype('<u8').view(np.uint8).reshape(bits.shape[0], -1)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1, dtype=np.int64)
+
+
+def ids_from_words(words):
+    """一行位集（Python int 列表）中置位的 UMI ID，升序"""
+    ids = []
+    for w, word in enumerate(words):
+        while word:
+            low = word & -word
+            ids.append(w * WORD_BITS + low.bit_length() - 1)
+            word ^= low
+    return ids
+
+
+class LabelBitsets:
+    """
+    一批标签集合的位集表示，每个 (集合序号, Kind) 一行：
+      row:   int64[n]，所属集合的序号
+      kind:  int32[n]，Kind 在编码器字典中的下标
+      bits:  uint64[n, 字数]
+      extra: 每个集合中无法编码的标签 (frozenset)，按原字符串参与比较
+    """
+
+    def __init__(self, row, kind, bits, extra):
+        self.row = row
+        self.kind = kind
+        self.bits = bits
+        self.extra = extra
+
+    def __len__(self):
+        return len(self.extra)
+
+
+class LabelCodec:
+    """
+    字符串标签与位集之间的转换器：维护 Kind 字典和位集字数（遇到更大的 UMI ID 时自动加宽）
+    """
+
+    def __init__(self, kinds=(), num_words=1):
+        self.kinds = list(kinds)
+        self.codes = {kind: code for code, kind in enumerate(self.kinds)}
+        self.num_words = num_words
+
+    def kind_code(self, kind):
+        code = self.codes.get(kind)
+        if code is None:
+            code = self.codes[kind] = len(self.kinds)
+            self.kinds.append(kind)
+        return code
+
+    def pack(self, cells, num_rows):
+        """
+        [(行号, UMI ID)] -> uint64[num_rows, 字数] 位集矩阵，按位或一次写入；字数不够时先加宽
+        """
+        if cells:
+            self.num_words = max(self.num_words, words_for(max(uid for _, uid in cells)))
+        bits = np.zeros((num_rows, self.num_words), dtype=np.uint64)
+        if cells:
+            rows, uids = np.array(cells, dtype=np.int64).T
+            masks = np.left_shift(np.uint64(1), (uids % WORD_BITS).astype(np.uint64))
+            np.bitwise_or.at(bits, (rows, uids // WORD_BITS), masks)
+        return bits
+
+    def label(self, code, uid):
+        return f"{self.kinds[code]}+{uid}"
+
+    def encode(self, label_sets):
+        """
+        字符串标签 -> LabelBitsets
+        label_sets: 每项是标签字符串的列表 / 集合，或逗号拼接的字符串
+        """
+        groups = {}  # (集合序号, Kind 编号) -> 位集行号
+        cells = []   # (位集行号, UMI ID)
+        extra = []
+        for n, labels in enumerate(label_sets):
+            if isinstance(labels, str):
+                labels = split_labels(labels)
+            leftover = set()
+            for label in labels:
+                parsed = parse_label(label)
+                if parsed is None or parsed[1] > MAX_UMI_ID:
+                    leftover.add(label)
+                    continue
+                kind, uid = parsed
+                r = groups.setdefault((n, self.kind_code(kind)), len(groups))
+                cells.append((r, uid))
+            extra.append(frozenset(leftover))
+
+        bits = self.pack(cells, len(groups))
+        keys = np.array(list(groups), dtype=np.int64).reshape(-1, 2)
+        return LabelBitsets(keys[:, 0], keys[:, 1].astype(np.int32), bits, extra)
+
+    def decode(self, bitsets):
+        """LabelBitsets -> 每个集合按字符串排序的标签列表（与 combine_umi_full.py 的 misconfig_labels 顺序相同）"""
+        label_sets = [set(extra) for extra in bitsets.extra]
+        for n, code, words in zip(bitsets.row.tolist(), bitsets.kind.tolist(), bitsets.bits.tolist()):
+            label_sets[n].update(self.label(code, uid) for uid in ids_from_words(words))
+        return [sorted(labels) for labels in label_sets]
+
+
+def count_matches(pred, ref):
+    """
+    逐集合比较两批标签（集合序号一一对应），返回 (TP, FP, FN) 的总数
+    同一 (集合, Kind) 的位集按位与后 popcount 即为交集大小，整批一次向量运算
+    """
+    num_words = max(pred.bits.shape[1], ref.bits.shape[1])
+    pred_bits, ref_bits = widen(pred.bits, num_words), widen(ref.bits, num_words)
+
+    num_kinds = int(max(pred.kind.max(initial=-1), ref.kind.max(initial=-1))) + 1
+    _, ip, ir = np.intersect1d(pred.row * num_kinds + pred.kind, ref.row * num_kinds + ref.kind,
+                               assume_unique=True, return_indices=True)
+    tp = int(popcount(pred_bits[ip] & ref_bits[ir]).sum())
+    # 无法编码的标签很少，按字符串集合比较
+    tp += sum(len(p & r) for p, r in zip(pred.extra, ref.extra) if p and r)
+
+    pred_total = int(popcount(pred_bits).sum()) + sum(len(p) for p in pred.extra)
+    ref_total = int(popcount(ref_bits).sum()) + sum(len(r) for r in ref.extra)
+    return tp, pred_total - tp, ref_total - tp
+
+
+class LabelBitsetWriter:
+    """
+    combine_umi_full.py 写标签时同步收集 (行号, Kind, UMI ID 集合)，close 时一次编码并写成 .npz
+    """
+
+    def __init__(self, filepath, codec=None):
+        self.filepath = filepath
+        self.codec = codec or LabelCodec()
+        self.index = []
+        self.kinds = []
+        self.cells = []  # (记录序号, UMI ID)
+
+    def write(self, idx, kind, umi_ids):
+        n = len(self.index)
+        self.index.append(idx)
+        self.kinds.append(self.codec.kind_code(kind))
+        self.cells.extend((n, int(uid)) for uid in umi_ids)
+
+    def close(self):
+        bits = self.codec.pack(self.cells, len(self.index))
+        count = len(self.index)
+        bitsets = LabelBitsets(np.arange(count, dtype=np.int64), np.array(self.kinds, dtype=np.int32),
+                               bits, [frozenset()] * count)
+        save_bitsets(self.filepath, np.array(self.index, dtype=np.int64), bitsets, self.codec)
+
+
+def save_bitsets(filepath, index, bitsets, codec):
+    """
+    写成 .npz：index（数据集行号，每个集合一个）、row / kind / bits（位集行）、kinds（Kind 字典）
+    无法编码的标签以 JSON 字符串保存在 extra 中（combine 的输出不会有）
+    """
+    extra = {str(n): sorted(labels) for n, labels in enumerate(bitsets.extra) if labels}
+    np.savez_compressed(
+        filepath,
+        version=np.int32(BITSET_VERSION),
+        index=index,
+        row=bitsets.row,
+        kind=bitsets.kind,
+        bits=bitsets.bits,
+        kinds=np.array(codec.kinds, dtype=str),
+        extra=np.array(json.dumps(extra, ensure_ascii=False)),
+    )
+
+
+def load_bitsets(filepath):
+    """读取 save_bitsets 写出的文件，返回 (数据集行号数组, LabelBitsets, LabelCodec)"""
+    with np.load(filepath) as data:
+        if int(data["version"]) != BITSET_VERSION:
+            raise ValueError(f"{filepath}: unsupported bitset version {int(data['version'])}")
+        index = data["index"]
+        codec = LabelCodec(data["kinds"].tolist(), data["bits"].shape[1])
+        extra = [frozenset()] * len(index)
+        for n, labels in json.loads(str(data["extra"])).items():
+            extra[int(n)] = frozenset(labels)
+        bitsets = LabelBitsets(data["row"], data["kind"], data["bits"], extra)
+    return index, bitsets, codec
+
+
+def bitset_path(label_file):
+    """与标签 JSONL 同名的 .npz 路径"""
+    return os.path.splitext(label_file)[0] + ".npz"
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        print("用法: python label_bitset.py <final_labels.jsonl> ...")
+        return
+
+    for label_file in paths:
+        index, label_sets = [], []
+        with open(label_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                index.append(record["index"])
+                label_sets.append(record["misconfig_labels"])
+
+        target = bitset_path(label_file)
+        print(f"📖 正在转换 {label_file} ...")
+        codec = LabelCodec()
+        bitsets = codec.encode(label_sets)
+        save_bitsets(target, np.array(index, dtype=np.int64), bitsets, codec)
+
+        _, loaded, loaded_codec = load_bitsets(target)
+        same = loaded_codec.decode(loaded) == [sorted(labels) for labels in label_sets]
+        ratio = os.path.getsize(target) / max(1, os.path.getsize(label_file))
+        print(f"   └─ {len(index)} 个文件、{len(codec.kinds)} 种 Kind、每行 {codec.num_words} 个字 -> {target} "
+              f"(大小为 JSONL 的 {ratio:.1%})，还原校验{'通过' if same else '失败'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+from umi_index import ID_FIELDS, TEXT_FIELDS, normalize_text
+
+# --- 并行分片合并 ---
+# combine_umi_full.py 的 PARALLEL_COMBINE 模式：每个输入 JSONL 按字节范围切成若干片，由进程池并行解析
+# （有 orjson 时用 orjson），每片把发现展开成列式表 (行号, 位置, Kind, 规则 ID, 文本)，
+# 对规则 ID / 文本列做字典编码后与映射表向量化关联得到 UMI ID；主进程拼接各片结果，按 (行号, 处理顺序) 排序后
+# 按行号分组，聚合规则与内存模式相同（第一个有效 Kind、UMI ID 取并集），输出与内存模式逐字节相同
+
+# 每片的字节数
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# 发现表：每条发现一行
+FINDINGS_SCHEMA = pa.schema([
+    ("index", pa.int64()),
+    ("source", pa.int32()),
+    ("pos", pa.int64()),
+    ("err_no", pa.int32()),
+    ("kind", pa.string()),
+    ("umi_id", pa.string()),
+    ("tool", pa.string()),
+    ("text", pa.string()),
+])
+# 记录表：每条记录一行，用于核对 content_hash
+RECORDS_SCHEMA = pa.schema([
+    ("index", pa.int64()),
+    ("source", pa.int32()),
+    ("pos", pa.int64()),
+    ("content_hash", pa.string()),
+])
+
+# 工作进程内的映射：{工具名: {"by_id", "by_text"}}，由 init_worker 设置
+_MAPPINGS = None
+
+
+def init_worker(mappings):
+    global _MAPPINGS
+    _MAPPINGS = mappings
+
+
+def byte_ranges(filepath, chunk_bytes=CHUNK_BYTES):
+    """把文件按字节切片：[(start, end), ...]，行归属于行首所在的片"""
+    size = os.path.getsize(filepath)
+    return [(start, min(start + chunk_bytes, size)) for start in range(0, size, chunk_bytes)] or [(0, 0)]
+
+
+def iter_range_lines(filepath, start, end):
+    """
+    逐行读取行首位于 [start, end) 内的行，产出 (行首字节偏移, 行内容)
+    """
+    with open(filepath, 'rb') as f:
+        if start > 0:
+            # 上一片负责跨越 start 的那一行
+            f.seek(start - 1)
+            f.readline()
+        while True:
+            pos = f.tell()
+            if pos >= end:
+                break
+            line = f.readline()
+            if not line:
+                break
+            yield pos, line
+
+
+def map_column(values, lookup):
+    """
+    向量化关联：对列做字典编码，只对字典中的不同值调用 lookup，再按下标取回每行的结果
+    """
+    encoded = pc.dictionary_encode(pa.array(values, type=pa.string()))
+    mapped = pa.array([lookup(value) for value in encoded.dictionary.to_pylist()], type=pa.string())
+    return mapped.take(encoded.indices)
+
+
+def explode_range(task):
+    """
+    工作进程函数：解析一片输入并展开发现
+    task: (来源序号, 工具名 或 None（run_all_full.py 的合并结果）, 文件路径, start, end)
+    返回: (发现表, 记录表, 无法确定行号的记录数)
+      发现表每条发现一行: index, source, pos, err_no, kind（有效 Kind 或 null）, umi_id（精确匹配结果或 null）,
+                          tool, text（未匹配时保留，供主进程做近似匹配）
+      记录表每条记录一行: index, source, pos, content_hash
+    """
+    # 在工作进程中导入，避免与 combine_umi_full 循环导入
+    from combine_umi_full import record_index
+
+    source, tool_name, filepath, start, end = task
+    tools = [tool_name] if tool_name else list(_MAPPINGS)
+    columns = {tool: {"index": [], "pos": [], "err_no": [], "kind": [], "rule_id": [], "text": []} for tool in tools}
+    records = {"index": [], "pos": [], "content_hash": []}
+    unkeyed = 0
+
+    for pos, line in iter_range_lines(filepath, start, end):
+        line = line.strip()
+        if not line: continue
+        try:
+            entry = loads(line)
+        except ValueError:
+            continue
+        idx = record_index(entry)
+        if idx is None:
+            unkeyed += 1
+            continue
+        records["index"].append(idx)
+        records["pos"].append(pos)
+        records["content_hash"].append(entry.get('content_hash') or None)
+
+        err_no = 0
+        for tool in tools:
+            if tool_name:
+                errors = entry.get('errors', [])
+            else:
+                # 某个工具无发现 (null) 或扫描失败 ({"error": ...}) 时没有 errors 字段
+                errors = (entry.get(tool) or {}).get('errors', [])
+            cols = columns[tool]
+            for err in errors:
+                k = err.get('kind', 'Unknown')
+                rule_id = err.get(ID_FIELDS[tool])
+                text = err.get(TEXT_FIELDS[tool])
+                cols["index"].append(idx)
+                cols["pos"].append(pos)
+                cols["err_no"].append(err_no)
+                # 只在输出标签中以字符串形式出现，非字符串的 Kind 先转成字符串
+                cols["kind"].append(str(k) if k and k != "Unknown" else None)
+                cols["rule_id"].append(rule_id if isinstance(rule_id, str) and rule_id else None)
+                cols["text"].append(text if isinstance(text, str) else None)
+                err_no += 1
+
+    tables = []
+    for tool in tools:
+        cols = columns[tool]
+        mapping = _MAPPINGS[tool]
+        by_rule = map_column(cols["rule_id"], lambda v: mapping["by_id"].get(v) if v else None)
+        by_text = map_column(cols["text"], lambda v: mapping["by_text"].get(normalize_text(v)))
+        umi_ids = pc.coalesce(by_rule, by_text)
+        n = len(cols["index"])
+        tables.append(pa.table({
+            "index": pa.array(cols["index"], type=pa.int64()),
+            "source": pa.array([source] * n, type=pa.int32()),
+            "pos": pa.array(cols["pos"], type=pa.int64()),
+            "err_no": pa.array(cols["err_no"], type=pa.int32()),
+            "kind": pa.array(cols["kind"], type=pa.string()),
+            "umi_id": umi_ids,
+            "tool": pa.array([tool] * n, type=pa.string()),
+            "text": pc.if_else(pc.is_null(umi_ids), pa.array(cols["text"], type=pa.string()),
+                               pa.scalar(None, pa.string())),
+        }, schema=FINDINGS_SCHEMA))
+
+    record_table = pa.table({
+        "index": records["index"],
+        "source": [source] * len(records["index"]),
+        "pos": records["pos"],
+        "content_hash": records["content_hash"],
+    }, schema=RECORDS_SCHEMA)
+    return pa.concat_tables(tables), record_table, unkeyed
+
+
+class ParallelLabels:
+    """
+    并行合并的结果，接口与 IndexedLabels 的 groups() / hash_mismatches 相同
+    """
+
+    def __init__(self, findings, records, fuzzy=None):
+        # 按处理顺序排序：来源 -> 行在文件中的位置 -> 记录内的错误序号（合并结果中按 checkov -> terrascan -> kubelinter）
+        self.findings = findings.sort_by([("index", "ascending"), ("source", "ascending"),
+                                          ("pos", "ascending"), ("err_no", "ascending")])
+        self.records = records.sort_by([("index", "ascending"), ("source", "ascending"), ("pos", "ascending")])
+        self.fuzzy = fuzzy
+        self.hash_mismatches = self._count_hash_mismatches()
+
+    def _count_hash_mismatches(self):
+        mismatches = 0
+        first = {}
+        for idx, digest in zip(self.records.column("index").to_pylist(),
+                               self.records.column("content_hash").to_pylist()):
+            if not digest:
+                continue
+            if idx not in first:
+                first[idx] = digest
+            elif first[idx] != digest:
+                mismatches += 1
+        return mismatches
+
+    def __len__(self):
+        valid = pc.or_(pc.is_valid(self.findings.column("kind")), pc.is_valid(self.findings.column("umi_id")))
+        return len(pc.unique(self.findings.filter(valid).column("index")))
+
+    def groups(self):
+        """按行号顺序产出 (行号, 第一个有效 Kind, UMI ID 集合)"""
+        umi_ids = self.findings.column("umi_id").to_pylist()
+        if self.fuzzy is not None:
+            # 精确匹配不到的发现在主进程中按文本近似匹配（匹配器按文本缓存）
+            texts = self.findings.column("text").to_pylist()
+            umi_ids = [
+                umi_id or (self.fuzzy.match(text)[0] if text and text.strip() else None)
+                for umi_id, text in zip(umi_ids, texts)
+            ]
+
+        current = None
+        first_kind = None
+        ids = set()
+        for idx, kind, umi_id in zip(self.findings.column("index").to_pylist(),
+                                     self.findings.column("kind").to_pylist(), umi_ids):
+            if idx != current:
+                if current is not None:
+                    yield current, first_kind, ids
+                current, first_kind, ids = idx, None, set()
+            if first_kind is None and kind is not None:
+                first_kind = kind
+            if umi_id:
+                ids.add(umi_id)
+        if current is not None:
+            yield current, first_kind, ids
+
+
+def parallel_combine(sources, mappings, workers, fuzzy=None, chunk_bytes=CHUNK_BYTES):
+    """
+    并行解析并关联所有输入
+    sources: [(工具名 或 None, 文件路径), ...]，按处理顺序排列；工具名为 None 表示 run_all_full.py 的合并结果
+    mappings: {工具名: {"by_id", "by_text"}}（不含近似匹配器，近似匹配在主进程中进行）
+    返回: ParallelLabels
+    """
+    tasks = []
+    for source, (tool_name, filepath) in enumerate(sources):
+        if not os.path.exists(filepath):
+            print(f"⚠️ 跳过: 文件不存在 {filepath}")
+            continue
+        print(f"📖 正在切分 {tool_name or '合并'} 结果 {filepath} ...")
+        for start, end in byte_ranges(filepath, chunk_bytes):
+            tasks.append((source, tool_name, filepath, start, end))
+
+    exact = {tool: {"by_id": m["by_id"], "by_text": m["by_text"]} for tool, m in mappings.items()}
+    finding_tables = []
+    record_tables = []
+    unkeyed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(exact,)) as executor:
+        for findings, records, skipped in executor.map(explode_range, tasks):
+            finding_tables.append(findings)
+            record_tables.append(records)
+            unkeyed += skipped
+
+    findings = pa.concat_tables([FINDINGS_SCHEMA.empty_table()] + finding_tables)
+    records = pa.concat_tables([RECORDS_SCHEMA.empty_table()] + record_tables)
+    matched = pc.sum(pc.is_valid(findings.column("umi_id"))).as_py() or 0
+    print(f"   └─ {len(tasks)} 个分片，已处理 {records.num_rows} 个文件记录、{findings.num_rows} 个错误项，精确匹配 {matched} 个。")
+    if unkeyed:
+        print(f"   ⚠️ {unkeyed} 条记录没有 index 字段且文件名不是 file_{{i}}.yaml 格式，无法对应数据集行号，已跳过（请用当前扫描脚本重新生成）")
+    return ParallelLabels(findings, records, fuzzy)
+
@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import hashlib
+
+# --- 策略文档快照与策略目录 ---
+# CheckCrawl.py / KubeLinterCrawl.py 每次运行都用 requests.get 重新下载文档、逐行解析 markdown，
+# TerrascanPoliciesCrawl.py 每次都重新遍历本地仓库的 JSON 元数据。这里提供：
+#   1. 快照库 (SNAPSHOT_DIR)：pinned/ 下有固定副本时直接读取（完全离线、结果可复现）；否则带上次的
+#      ETag / Last-Modified 发条件请求，304 时用本地缓存的快照，下载失败时也退回缓存的快照
+#   2. 策略目录 (CATALOGUE_FILE)：三个爬虫的解析结果连同来源信息（URL、ETag、内容 SHA-256）存在一个带修订号的
+#      JSON 文件中；文档内容的哈希与目录中记录的相同时爬虫跳过解析，直接沿用目录中的结果
+# umi_index.py（combine_umi_full.py / combine_umi1.py 的映射索引，run_RB_tools/umi_rules.py 的规则白名单也取自它）
+# 优先从策略目录读取各工具的策略，目录中没有该工具时才读爬虫输出的 CSV
+# 快照缓存和策略目录都是运行时生成的文件，已在 .gitignore 中排除（pinned/ 下的固定副本除外）
+#
+# 用法:
+#   python policy_catalogue.py              打印策略目录的修订号和各工具的策略条数
+#   python policy_catalogue.py --from-csv   由仓库中已有的三个策略 CSV 生成策略目录（不联网）
+
+UMI_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.path.join(UMI_DIR, "policy_snapshots")
+PINNED_DIR = os.path.join(SNAPSHOT_DIR, "pinned")
+CATALOGUE_FILE = os.path.join(UMI_DIR, "policy_catalogue.json")
+CATALOGUE_VERSION = 1
+# 设置环境变量 POLICY_OFFLINE=1 时不发任何网络请求，只用固定副本或缓存的快照
+OFFLINE = os.environ.get("POLICY_OFFLINE") == "1"
+REQUEST_TIMEOUT = 30
+
+# 爬虫输出的 CSV，策略目录中没有某个工具时的后备来源
+POLICY_CSV_FILES = {
+    "checkov": os.path.join(UMI_DIR, "Checkov_K8s.csv"),
+    "kubelinter": os.path.join(UMI_DIR, "KubeLinter_Policies_UMI.csv"),
+    "terrascan": os.path.join(UMI_DIR, "Terrascan_K8s_Policies_UMI.csv"),
+}
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path, data, indent=None):
+    # 先写临时文件再替换，中途中断时不会留下半个文件
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+def fetch_document(name, url, offline=OFFLINE):
+    """
+    取得一个文档的内容，依次尝试：固定副本 -> 条件请求（304 时用缓存的快照）-> 缓存的快照
+    返回: (内容, 来源信息 {"url", "origin", "etag", "last_modified", "sha256"})；都取不到时抛出 RuntimeError
+    """
+    pinned = os.path.join(PINNED_DIR, name)
+    if os.path.exists(pinned):
+        with open(pinned, 'r', encoding='utf-8') as f:
+            content = f.read()
+        print(f"使用固定副本: {pinned}")
+        return content, {"url": url, "origin": "pinned", "etag": None, "last_modified": None,
+                         "sha256": sha256_text(content)}
+
+    cached = os.path.join(SNAPSHOT_DIR, name)
+    meta_path = cached + ".meta.json"
+    meta = _read_json(meta_path) if os.path.exists(meta_path) and os.path.exists(cached) else None
+
+    def from_cache(origin):
+        with open(cached, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return content, {**meta, "origin": origin, "sha256": sha256_text(content)}
+
+    if offline:
+        if meta is None:
+            raise RuntimeError(f"离线模式下没有 {name} 的固定副本或缓存快照")
+        print(f"离线模式，使用缓存的快照: {cached}")
+        return from_cache("cache")
+
+    import requests
+
+    headers = {}
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    print(f"正在下载文档: {url} ...")
+    try:
+        response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304 and meta is not None:
+            print("文档未修改 (304)，使用缓存的快照")
+            return from_cache("not-modified")
+        response.raise_for_status()
+    except Exception as e:
+        if meta is None:
+            raise RuntimeError(f"下载失败且没有缓存的快照: {e}")
+        print(f"下载失败 ({e})，使用缓存的快照: {cached}")
+        return from_cache("cache")
+
+    content = response.text
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(cached, 'w', encoding='utf-8') as f:
+        f.write(content)
+    meta = {"url": url, "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    _write_json(meta_path, meta, indent=2)
+    return content, {**meta, "origin": "network", "sha256": sha256_text(content)}
+
+
+def resolve_directory(name, default_path):
+    """本地目录来源（Terrascan 仓库）：pinned/ 下有固定副本时用固定副本，否则用 default_path"""
+    pinned = os.path.join(PINNED_DIR, name)
+    return pinned if os.path.isdir(pinned) else default_path
+
+
+def directory_digest(path, suffix):
+    """目录下所有 suffix 结尾文件的 (相对路径, 内容) 的 SHA-256，用于判断是否需要重新解析"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith(suffix):
+                continue
+            file_path = os.path.join(root, file)
+            digest.update(os.path.relpath(file_path, path).encode('utf-8') + b"\0")
+            with open(file_path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def load_catalogue(path=CATALOGUE_FILE):
+    """读取策略目录；文件不存在或格式版本不符时返回 None"""
+    if not os.path.exists(path):
+        return None
+    catalogue = _read_json(path)
+    if catalogue.get("version") != CATALOGUE_VERSION:
+        return None
+    return catalogue
+
+
+def cached_policies(tool, sha256, path=CATALOGUE_FILE):
+    """来源内容与策略目录中记录的相同时返回目录中的策略列表，否则返回 None（需要重新解析）"""
+    catalogue = load_catalogue(path)
+    entry = (catalogue or {}).get("tools", {}).get(tool)
+    if entry is None or entry["source"].get("sha256") != sha256:
+        return None
+    return entry["policies"]
+
+
+def update_catalogue(tool, policies, source, path=CATALOGUE_FILE):
+    """
+    写入一个工具的解析结果；内容与目录中已有的不同时修订号加一
+    policies: [{列名: 字符串}]，列名与爬虫输出的 CSV 相同
+    返回: 当前修订号
+    """
+    catalogue = load_catalogue(path) or {"version": CATALOGUE_VERSION, "revision": 0, "tools": {}}
+    entry = catalogue["tools"].get(tool)
+    if entry is not None and entry["policies"] == policies and entry["source"].get("sha256") == source.get("sha256"):
+        return catalogue["revision"]
+
+    catalogue["revision"] += 1
+    catalogue["tools"][tool] = {
+        "source": source,
+        "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "revision": catalogue["revision"],
+        "policies": policies,
+    }
+    _write_json(path, catalogue, indent=1)
+    return catalogue["revision"]
+
+
+def dataframe_policies(df):
+    """爬虫的 DataFrame -> 策略列表，取值与写成 CSV 再读回相同（空值为空字符串，其余转成字符串）"""
+    return [{k: "" if v is None or v != v else str(v) for k, v in row.items()} for row in df.to_dict("records")]
+
+
+def read_csv_policies(filepath):
+    import csv
+
+    with open(filepath, 'r', encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def policy_rows(tool, csv_file=None, path=CATALOGUE_FILE):
+    """
+    某个工具的策略行：优先取策略目录，目录中没有该工具时读 CSV（csv_file 或 POLICY_CSV_FILES 中的默认路径）；
+    都没有时返回 None
+    """
+    catalogue = load_catalogue(path)
+    if catalogue is not None and tool in catalogue["tools"]:
+        return catalogue["tools"][tool]["policies"]
+    csv_file = csv_file or POLICY_CSV_FILES[tool]
+    if os.path.exists(csv_file):
+        return read_csv_policies(csv_file)
+    return None
+
+
+def main():
+    if "--from-csv" in sys.argv[1:]:
+        for tool, csv_file in POLICY_CSV_FILES.items():
+            if not os.path.exists(csv_file):
+                print(f"⚠️ 跳过: 文件不存在 {csv_file}")
+                continue
+            with open(csv_file, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            source = {"url": None, "origin": "csv", "file": os.path.basename(csv_file), "sha256": digest}
+            update_catalogue(tool, read_csv_policies(csv_file), source)
+
+    catalogue = load_catalogue()
+    if catalogue is None:
+        print(f"⚠️ 策略目录不存在: {CATALOGUE_FILE}（运行爬虫或 `python policy_catalogue.py --from-csv` 生成）")
+        return
+    print(f"📚 策略目录 {CATALOGUE_FILE} (修订号 {catalogue['revision']})")
+    for tool, entry in catalogue["tools"].items():
+        source = entry["source"]
+        print(f"   {tool}: {len(entry['policies'])} 条策略，来源 {source.get('origin')} "
+              f"({source.get('url') or source.get('file')})，更新于 {entry['updated']} (修订号 {entry['revision']})")
+
+if __name__ == "__main__":
+    main()
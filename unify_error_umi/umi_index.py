@@ -0,0 +1,172 @@
+import os
+import csv
+import pickle
+import hashlib
+
+from policy_catalogue import CATALOGUE_FILE, policy_rows
+
+# --- 编译后的 UMI 映射索引 ---
+# combine_umi_full.py 原来用 pandas 逐行读取 policies_with_remediation.csv，按工具输出的规则文本
+# (check_name / description / remediation) 匹配 UMI ID；上游措辞一改就匹配不上。
+# 这里把映射表和三个工具的策略爬取结果编译成一个 pickle 文件，按工具自己的规则 ID 索引：
+#   Checkov:    CKV_K8S_*      (Checkov_K8s.csv 的 Policy 文本 -> 映射表 Checkov_Policy)
+#   KubeLinter: 检查名          (KubeLinter_Policies_UMI.csv 的 Remediation -> 映射表 Remediation)
+#   Terrascan:  AC_K8S_*       (Terrascan_K8s_Policies_UMI.csv 的 Description -> 映射表 Terrascan_Policy)
+# 原来的文本字典一并保存，规则 ID 查不到时按文本兜底。各工具的策略优先取自策略目录 policy_catalogue.json
+# （见 policy_catalogue.py），目录中没有时读上面的 CSV。文件里记录了四个 CSV 和策略目录的校验和，
+# 有改动时 load_umi_index 自动重新编译
+#
+# 用法:
+#   python umi_index.py   重新编译并打印各工具的映射条数
+
+UMI_DIR = os.path.dirname(os.path.abspath(__file__))
+MAPPING_FILE = os.path.join(UMI_DIR, "policies_with_remediation.csv")
+CHECKOV_POLICIES_FILE = os.path.join(UMI_DIR, "Checkov_K8s.csv")
+KUBELINTER_POLICIES_FILE = os.path.join(UMI_DIR, "KubeLinter_Policies_UMI.csv")
+TERRASCAN_POLICIES_FILE = os.path.join(UMI_DIR, "Terrascan_K8s_Policies_UMI.csv")
+INDEX_FILE = os.path.join(UMI_DIR, "umi_index.pkl")
+INDEX_VERSION = 3
+
+SOURCE_FILES = {
+    "mapping": MAPPING_FILE,
+    "checkov": CHECKOV_POLICIES_FILE,
+    "kubelinter": KUBELINTER_POLICIES_FILE,
+    "terrascan": TERRASCAN_POLICIES_FILE,
+    "catalogue": CATALOGUE_FILE,
+}
+# 各工具的发现中，规则 ID 所在字段和文本匹配字段
+ID_FIELDS = {"checkov": "check_id", "kubelinter": "check_id", "terrascan": "rule_id"}
+TEXT_FIELDS = {"checkov": "check_name", "kubelinter": "remediation", "terrascan": "description"}
+# 映射表中与各工具文本对应的列
+MAPPING_COLUMNS = {"checkov": "Checkov_Policy", "kubelinter": "Remediation", "terrascan": "Terrascan_Policy"}
+# 策略 CSV 中的 (规则 ID 列, 文本列)
+POLICY_COLUMNS = {
+    "checkov": ("Id", "Policy"),
+    "kubelinter": ("Name", "Remediation"),
+    "terrascan": ("Reference_ID", "Description"),
+}
+
+
+def normalize_text(text):
+    """文本标准化：去除前后空格（与 combine_umi_full.py 一致）"""
+    if not isinstance(text, str):
+        return ""
+    return text.strip()
+
+
+def read_csv_rows(filepath):
+    """读取爬虫生成的 CSV（可能带 BOM）"""
+    with open(filepath, 'r', encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def source_fingerprints():
+    """源 CSV 和策略目录的 SHA-256，文件不存在时为 None"""
+    fingerprints = {}
+    for name, path in SOURCE_FILES.items():
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                fingerprints[name] = hashlib.sha256(f.read()).hexdigest()
+        else:
+            fingerprints[name] = None
+    return fingerprints
+
+
+def compile_index():
+    """
+    由映射表和策略 CSV 构建索引
+    返回: {"version", "sources", "tools": {工具名: {"by_id": {规则 ID: UMI ID}, "by_text": {文本: UMI ID},
+                                            "ambiguous_ids": [规则 ID], "default_off": 默认不启用的规则 ID 集合}}}
+    同一规则 ID 在策略中有多行、对应到不同 UMI ID 时（如 Terrascan 的 AC_K8S_0050 对应 UMI 38 和 162），
+    该 ID 不进 by_id，只记在 ambiguous_ids 中，这类发现按文本匹配；run_RB_tools/umi_rules.py 仍把它们放进规则白名单
+    default_off 只有策略行带 Enabled_by_default 列（KubeLinter）时非空，供 umi_rules.py 筛选规则
+    """
+    mapping_rows = read_csv_rows(MAPPING_FILE)
+    tools = {}
+    for tool, column in MAPPING_COLUMNS.items():
+        # 文本字典：与原来 load_mapping 相同，同一文本出现多次时后面的行覆盖前面的
+        by_text = {}
+        for row in mapping_rows:
+            text = normalize_text(row.get(column))
+            if text:
+                by_text[text] = row["ID"]
+
+        umi_ids_by_rule = {}  # 规则 ID -> 对应到的 UMI ID 集合
+        default_off = set()
+        policies = policy_rows(tool, SOURCE_FILES[tool])
+        if policies is not None:
+            id_column, text_column = POLICY_COLUMNS[tool]
+            for row in policies:
+                rule_id = normalize_text(row.get(id_column))
+                umi_id = by_text.get(normalize_text(row.get(text_column)))
+                if rule_id and umi_id:
+                    umi_ids_by_rule.setdefault(rule_id, set()).add(umi_id)
+                if rule_id and "Enabled_by_default" in row and normalize_text(row["Enabled_by_default"]) != "Yes":
+                    default_off.add(rule_id)
+
+        by_id = {rule_id: next(iter(umi_ids)) for rule_id, umi_ids in umi_ids_by_rule.items() if len(umi_ids) == 1}
+        ambiguous_ids = sorted(rule_id for rule_id, umi_ids in umi_ids_by_rule.items() if len(umi_ids) > 1)
+        for rule_id in ambiguous_ids:
+            print(f"⚠️ {tool}: 规则 ID {rule_id} 对应多个 UMI ID {sorted(umi_ids_by_rule[rule_id])}，改按文本匹配")
+
+        tools[tool] = {"by_id": by_id, "by_text": by_text, "ambiguous_ids": ambiguous_ids, "default_off": default_off}
+
+    return {"version": INDEX_VERSION, "sources": source_fingerprints(), "tools": tools}
+
+
+def save_index(index, filepath=INDEX_FILE):
+    # 先写临时文件再替换，避免并发运行时读到半个文件
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, filepath)
+
+
+def load_umi_index(filepath=INDEX_FILE):
+    """
+    读取编译好的索引；文件不存在、版本不符或源 CSV 有改动时重新编译并保存
+    """
+    if os.path.exists(filepath):
+        with open(filepath, 'rb') as f:
+            index = pickle.load(f)
+        if index.get("version") == INDEX_VERSION and index.get("sources") == source_fingerprints():
+            return index
+
+    index = compile_index()
+    save_index(index, filepath)
+    return index
+
+
+def match_text(text, mapping):
+    """
+    按文本查 UMI ID；精确匹配查不到且 mapping 中带有近似匹配器 ("fuzzy"，见 fuzzy_matcher.py) 时由它兜底
+    """
+    text = normalize_text(text)
+    umi_id = mapping["by_text"].get(text)
+    if umi_id is None and text and mapping.get("fuzzy") is not None:
+        umi_id = mapping["fuzzy"].match(text)[0]
+    return umi_id
+
+
+def match_umi_id(error, tool_name, mapping):
+    """
+    一条发现对应的 UMI ID：先按规则 ID 查，查不到再按文本查；都没有时返回 None
+    mapping: 索引中该工具的 {"by_id", "by_text"}，可另带 "fuzzy" 近似匹配器
+    """
+    rule_id = error.get(ID_FIELDS[tool_name])
+    if rule_id:
+        umi_id = mapping["by_id"].get(rule_id)
+        if umi_id is not None:
+            return umi_id
+    return match_text(error.get(TEXT_FIELDS[tool_name]), mapping)
+
+
+def main():
+    index = compile_index()
+    save_index(index)
+    print(f"✅ UMI 映射索引已保存至: {INDEX_FILE}")
+    for tool, mapping in index["tools"].items():
+        print(f"   {tool}: 规则 ID {len(mapping['by_id'])} 条，文本 {len(mapping['by_text'])} 条")
+
+if __name__ == "__main__":
+    main()